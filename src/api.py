@@ -0,0 +1,464 @@
+import argparse
+import base64
+import binascii
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import metrics
+from catalog import catalog, search_products
+from db import Database
+from events import SubscriberDropped, bus
+from flows.login import authenticate, register_user
+from flows.order import (add_order_item, clear_order, get_open_order, place_order, remove_order_item,
+                         set_order_item_amount, set_order_item_comment)
+from flows.orders import PAGE_SIZE, get_order_status, get_past_orders, get_receipt
+from helpers import OutOfStock, is_busy
+from holds import HoldSweeper
+from kitchen import STATUS_NAMES
+from main import open_database
+from passwords import PasswordBusy, RateLimited
+from repository import User
+from users import users
+
+# Largest integer SQLite can store, bigger ids can't exist
+MAX_ID = 2 ** 63 - 1
+# Max seconds a status request waits for a change
+LONG_POLL_SECONDS = 30
+# Hours a session token stays valid without being used
+SESSION_HOURS = float(os.environ.get('FASTPIZZA_SESSION_HOURS', 24))
+
+
+class ApiError(Exception):
+    """Exception to be raised to answer a request with an error."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Sessions:
+    """Logged in API clients, by bearer token.
+
+    Only user ids are kept, the users themselves are read from the user map.
+    Tokens expire after `ttl` seconds without use. They are kept in order of
+    last use, so the expired ones are always first and are dropped from the
+    front on every login.
+    """
+
+    def __init__(self, ttl: float = SESSION_HOURS * 3600):
+        self.ttl = ttl
+        # Token -> (user id, expiry)
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, user: User) -> str:
+        token = secrets.token_urlsafe(32)
+        users.acquire(user)
+        with self._lock:
+            self._expire(time.monotonic())
+            self._sessions[token] = (user.id, time.monotonic() + self.ttl)
+        return token
+
+    def get(self, token: str) -> int:
+        now = time.monotonic()
+        with self._lock:
+            if (session := self._sessions.get(token)) is None:
+                return None
+            if session[1] <= now:
+                self._expire(now)
+                return None
+            self._sessions[token] = (session[0], now + self.ttl)
+            self._sessions.move_to_end(token)
+            return session[0]
+
+    def delete(self, token: str) -> None:
+        with self._lock:
+            if (session := self._sessions.pop(token, None)) is not None:
+                users.release(session[0])
+
+    def _expire(self, now: float) -> None:
+        while self._sessions:
+            token, (user_id, expires) = next(iter(self._sessions.items()))
+            if expires > now:
+                break
+            del self._sessions[token]
+            users.release(user_id)
+
+
+def public_user(user: User) -> dict:
+    """User data that is safe to send to the client."""
+    return {k: getattr(user, k) for k in ('id', 'email', 'firstName', 'lastName', 'isAdmin')}
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """JSON API for the ordering operations.
+
+    Set up by `serve`, which attaches the database and sessions to the class.
+    """
+
+    # Keep-alive, so clients can reuse their connection
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FastPizza'
+
+    db: Database = None
+    sessions: Sessions = None
+
+    routes = []
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PATCH(self):
+        self.dispatch('PATCH')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method: str) -> None:
+        path = self.path.split('?', 1)[0]
+        # Handlers return (status, body) or (status, body, content type)
+        content_type = []
+        try:
+            for route_method, pattern, handler in self.routes:
+                if route_method == method and (match := pattern.fullmatch(path)):
+                    status, body, *content_type = handler(self, *match.groups())
+                    break
+            else:
+                raise ApiError(404, "Not found")
+        except ApiError as e:
+            status, body = e.status, {"error": e.message}
+        except OutOfStock as e:
+            status, body = 409, {"error": f"Not enough {e.name} in stock", "ingredient": e.name, "left": e.in_stock}
+        except RateLimited:
+            status, body = 429, {"error": "Too many login attempts"}
+        except PasswordBusy:
+            status, body = 503, {"error": "Busy, try again"}
+        except ValueError as e:
+            status, body = 400, {"error": str(e)}
+        except OverflowError:
+            # A number too large for SQLite, e.g. a huge amount times a recipe
+            status, body = 400, {"error": "Number out of range"}
+        except sqlite3.Error as e:
+            # Out of busy retries, or a bug
+            traceback.print_exc()
+            if isinstance(e, sqlite3.OperationalError) and is_busy(e):
+                status, body = 503, {"error": "Busy, try again"}
+            else:
+                status, body = 500, {"error": "Internal error"}
+
+        self.send_json(status, body, *content_type)
+
+    def send_json(self, status: int, body, content_type: str = 'application/json') -> None:
+        data = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        if length == 0:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise ApiError(400, "Invalid JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "Expected a JSON object")
+        return body
+
+    def token(self) -> str:
+        auth = self.headers.get('Authorization', '')
+        return auth[7:] if auth.startswith('Bearer ') else None
+
+    def require_user(self) -> User:
+        if (token := self.token()) is None or (user_id := self.sessions.get(token)) is None:
+            raise ApiError(401, "Not logged in")
+        with self.db.read() as conn:
+            user = users.get(conn, user_id)
+        if not user:
+            # Deleted account
+            self.sessions.delete(token)
+            raise ApiError(401, "Not logged in")
+        return user
+
+    def log_message(self, format, *args):
+        # Logging every request to stderr is slow and noisy
+        pass
+
+
+def route(method: str, path: str):
+    """Register an `ApiHandler` method for a path regex."""
+
+    def decorator(fn):
+        ApiHandler.routes.append((method, re.compile(path), fn))
+        return fn
+    return decorator
+
+
+def field(body: dict, name: str, kind: type, required: bool = True, default=None):
+    """Get a typed field from a request body, `default` if it is missing and not required."""
+
+    if name not in body or body[name] is None:
+        if required:
+            raise ApiError(400, f"Missing field '{name}'")
+        return default
+    if not isinstance(body[name], kind) or isinstance(body[name], bool) and kind is not bool:
+        raise ApiError(400, f"Field '{name}' must be {kind.__name__}")
+    if kind is int and not -MAX_ID <= body[name] <= MAX_ID:
+        raise ApiError(400, f"Field '{name}' is out of range")
+    return body[name]
+
+
+def path_id(value: str) -> int:
+    """Get an id from a path, 404 if it is too large to exist."""
+
+    if (value := int(value)) > MAX_ID:
+        raise ApiError(404, "Not found")
+    return value
+
+
+@route('POST', r'/register')
+def register(handler: ApiHandler):
+    body = handler.read_json()
+    user = register_user(
+        handler.db,
+        field(body, 'firstName', str),
+        field(body, 'lastName', str),
+        field(body, 'email', str),
+        field(body, 'password', str),
+    )
+    if not user:
+        raise ApiError(409, "A user with this email already exists")
+    return 201, {"token": handler.sessions.create(user), "user": public_user(user)}
+
+
+@route('POST', r'/login')
+def login(handler: ApiHandler):
+    body = handler.read_json()
+    email = field(body, 'email', str)
+    user = authenticate(handler.db, email, field(body, 'password', str),
+                        source=f"{handler.client_address[0]}/{email}")
+    if not user:
+        raise ApiError(401, "Incorrect email or password")
+    return 200, {"token": handler.sessions.create(user), "user": public_user(user)}
+
+
+@route('POST', r'/logout')
+def logout(handler: ApiHandler):
+    handler.require_user()
+    handler.sessions.delete(handler.token())
+    return 200, {}
+
+
+@route('GET', r'/menu')
+def menu(handler: ApiHandler):
+    with handler.db.read() as conn:
+        menu = catalog.refresh(conn)
+    # Rendered once per catalog change, only the stock is filled in
+    return 200, menu.render_json()
+
+
+@route('GET', r'/menu/search')
+def menu_search(handler: ApiHandler):
+    query = parse_qs(handler.path.partition('?')[2])
+    with handler.db.read() as conn:
+        product_ids = search_products(conn, query['q'][0] if 'q' in query else "")
+    return 200, {"productIds": product_ids}
+
+
+@route('GET', r'/cart')
+def cart(handler: ApiHandler):
+    user = handler.require_user()
+    with handler.db.read() as conn:
+        order = get_open_order(conn, user.id)
+    return 200, order.as_dict() if order else {"orderId": None, "items": [], "total": 0}
+
+
+@route('POST', r'/cart/items')
+def add_item(handler: ApiHandler):
+    user = handler.require_user()
+    body = handler.read_json()
+    toppings = []
+    for topping in field(body, 'toppings', list, required=False) or []:
+        if not isinstance(topping, dict):
+            raise ApiError(400, "Toppings must be objects")
+        toppings.append({
+            "ingredientId": field(topping, 'ingredientId', int),
+            "amount": field(topping, 'amount', int, required=False, default=1),
+        })
+
+    order_item_id = add_order_item(
+        handler.db,
+        user.id,
+        field(body, 'productId', int),
+        field(body, 'amount', int, required=False, default=1),
+        toppings,
+        field(body, 'comment', str, required=False),
+    )
+    return 201, {"orderItemId": order_item_id}
+
+
+@route('PATCH', r'/cart/items/(\d+)')
+def modify_item(handler: ApiHandler, order_item_id: str):
+    user = handler.require_user()
+    body = handler.read_json()
+
+    found = True
+    if 'amount' in body:
+        found = set_order_item_amount(handler.db, user.id, path_id(order_item_id), field(body, 'amount', int))
+    if found and 'comment' in body:
+        found = set_order_item_comment(handler.db, user.id, path_id(order_item_id),
+                                       field(body, 'comment', str, required=False))
+    if not found:
+        raise ApiError(404, "Item is not in your cart")
+    return 200, {"orderItemId": path_id(order_item_id)}
+
+
+@route('DELETE', r'/cart/items/(\d+)')
+def remove_item(handler: ApiHandler, order_item_id: str):
+    user = handler.require_user()
+    if not remove_order_item(handler.db, user.id, path_id(order_item_id)):
+        raise ApiError(404, "Item is not in your cart")
+    return 200, {"orderItemId": path_id(order_item_id)}
+
+
+@route('DELETE', r'/cart')
+def clear_cart(handler: ApiHandler):
+    user = handler.require_user()
+    return 200, {"removed": clear_order(handler.db, user.id)}
+
+
+@route('POST', r'/cart/place')
+def place(handler: ApiHandler):
+    user = handler.require_user()
+    if not (order_id := place_order(handler.db, user.id)):
+        raise ApiError(409, "Your cart is empty")
+    return 201, {"orderId": order_id}
+
+
+def encode_cursor(order) -> str:
+    """Opaque page cursor pointing after an order."""
+    return base64.urlsafe_b64encode(json.dumps([order.createdAt, order.id]).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, binascii.Error):
+        raise ApiError(400, "Invalid cursor")
+    if not isinstance(created_at, str) or not isinstance(order_id, int):
+        raise ApiError(400, "Invalid cursor")
+    return created_at, order_id
+
+
+@route('GET', r'/orders')
+def orders(handler: ApiHandler):
+    user = handler.require_user()
+    query = parse_qs(handler.path.partition('?')[2])
+    before = decode_cursor(query['before'][0]) if 'before' in query else None
+
+    page = get_past_orders(handler.db, user.id, PAGE_SIZE + 1, before)
+    return 200, {
+        "orders": [o._asdict() for o in page[:PAGE_SIZE]],
+        "next": encode_cursor(page[PAGE_SIZE - 1]) if len(page) > PAGE_SIZE else None,
+    }
+
+
+@route('GET', r'/orders/(\d+)')
+def order(handler: ApiHandler, order_id: str):
+    user = handler.require_user()
+    if not (receipt := get_receipt(handler.db, user.id, path_id(order_id))):
+        raise ApiError(404, "Order not found")
+    return 200, receipt[0]
+
+
+@route('GET', r'/orders/(\d+)/status')
+def order_status(handler: ApiHandler, order_id: str):
+    """Long-poll: answer once the status differs from `?after=`, or after `?timeout=` seconds."""
+
+    user = handler.require_user()
+    query = parse_qs(handler.path.partition('?')[2])
+    after = int(query['after'][0]) if 'after' in query else None
+    timeout = min(float(query['timeout'][0]) if 'timeout' in query else LONG_POLL_SECONDS, LONG_POLL_SECONDS)
+    order_id = path_id(order_id)
+
+    with bus.subscribe(handler.db, user.id) as events:
+        if (status := get_order_status(handler.db, user.id, order_id)) is None:
+            raise ApiError(404, "Order not found")
+
+        deadline = time.monotonic() + timeout
+        while status == after:
+            try:
+                event = events.get(deadline - time.monotonic())
+            except SubscriberDropped:
+                # Fell behind, the client asks again
+                break
+            if event is None:
+                break
+            if event.orderId == order_id:
+                status = event.status
+
+    return 200, {"orderId": order_id, "status": status, "statusName": STATUS_NAMES[status]}
+
+
+@route('GET', r'/metrics')
+def metrics_text(handler: ApiHandler):
+    if not metrics.enabled:
+        raise ApiError(404, "Metrics are disabled, set FASTPIZZA_METRICS=1")
+    return 200, metrics.render().encode('utf-8'), 'text/plain; version=0.0.4'
+
+
+def serve(host: str, port: int) -> None:
+    """Serve the JSON API until interrupted.
+
+    Args:
+        host (str): Address to listen on.
+        port (int): Port to listen on.
+    """
+
+    metrics.start()
+    ApiHandler.db = open_database()
+    ApiHandler.sessions = Sessions()
+    sweeper = HoldSweeper(ApiHandler.db).start()
+
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    print(f"Serving FastPizza API on http://{host}:{port}")
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        sweeper.stop()
+        ApiHandler.db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the FastPizza JSON API.")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+
+    serve(args.host, args.port)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,303 @@
+import argparse
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+import metrics
+from db import Database
+from helpers import run_transaction
+from kitchen import READY
+from repository import PastOrder, stream
+
+# Days a completed order stays in the hot database
+ARCHIVE_DAYS = float(os.environ.get('FASTPIZZA_ARCHIVE_DAYS', 180))
+# Orders moved per transaction, so the job never holds the write lock for long
+ARCHIVE_BATCH = 500
+# Directory of the archives, next to the database
+ARCHIVE_DIR = 'archive'
+ARCHIVE_SCHEMA = 'assets/archive_schema.sql'
+
+# Oldest completed orders, with the month of the archive they go to. The
+# status is a literal, so the partial index on completed orders is used.
+ARCHIVABLE_ORDERS = f"""
+    SELECT id, strftime('%Y-%m', createdAt)
+    FROM `Order`
+    WHERE status = {READY}
+          AND createdAt < ?
+    ORDER BY createdAt
+    LIMIT ?
+"""
+
+# A batch of orders, params: {"ids"} (JSON array of order ids)
+BATCH_ORDERS = "SELECT value FROM json_each(:ids)"
+# Archived tables and their rows of a batch, in the order they are deleted:
+# orders first, so the item triggers don't update their totals, and toppings
+# before the items they are found by
+ARCHIVED_TABLES = [
+    ("Order", f"id IN ({BATCH_ORDERS})"),
+    ("IngredientOrderItemTopping", f"orderItemId IN (SELECT id FROM main.OrderItem WHERE orderId IN ({BATCH_ORDERS}))"),
+    ("OrderItem", f"orderId IN ({BATCH_ORDERS})"),
+    ("OrderReceipt", f"orderId IN ({BATCH_ORDERS})"),
+    ("KitchenJob", f"orderId IN ({BATCH_ORDERS})"),
+]
+
+# Which users have orders in the month's archive, params: {"ids", "month"}
+COUNT_ARCHIVED = f"""
+    INSERT INTO main.OrderArchive
+        (userId, month, orders)
+    SELECT userId, :month, COUNT(*)
+    FROM main.`Order`
+    WHERE id IN ({BATCH_ORDERS})
+    GROUP BY userId
+    ON CONFLICT (userId, month) DO UPDATE SET
+        orders = orders + excluded.orders
+"""
+
+# Months with archived orders of a user, newest first, params: (userId, first month, last month)
+USER_MONTHS = """
+    SELECT month
+    FROM OrderArchive
+    WHERE userId = ?
+          AND month BETWEEN ? AND ?
+    ORDER BY month DESC
+"""
+
+ARCHIVED_PAST_ORDERS = """
+    SELECT
+        id, status, itemsCount, total, createdAt
+    FROM archive.`Order`
+    WHERE userId = ?
+    ORDER BY
+        createdAt DESC, id DESC
+    LIMIT ?
+"""
+
+ARCHIVED_PAST_ORDERS_BEFORE = """
+    SELECT
+        id, status, itemsCount, total, createdAt
+    FROM archive.`Order`
+    WHERE userId = ?
+          AND (createdAt, id) < (?, ?)
+    ORDER BY
+        createdAt DESC, id DESC
+    LIMIT ?
+"""
+
+ARCHIVED_RECEIPT = "SELECT userId, receipt FROM archive.OrderReceipt WHERE orderId = ?"
+
+
+def archive_dir(conn: sqlite3.Connection) -> str:
+    """Directory of the archives of the connection's main database."""
+
+    path = next(row[2] for row in conn.execute("PRAGMA database_list") if row[1] == 'main')
+    return os.path.join(os.path.dirname(path), ARCHIVE_DIR)
+
+
+def archive_path(conn: sqlite3.Connection, month: str) -> str:
+    """Path of the archive of a month (`YYYY-MM`)."""
+    return os.path.join(archive_dir(conn), f"orders-{month}.db")
+
+
+def archive_months(conn: sqlite3.Connection) -> list:
+    """Months that have an archive, oldest first."""
+
+    directory = archive_dir(conn)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[7:-3] for name in os.listdir(directory)
+                  if name.startswith('orders-') and name.endswith('.db'))
+
+
+def create_archive(path: str) -> None:
+    """Create an archive database, unless it exists."""
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+            with open(ARCHIVE_SCHEMA) as f:
+                conn.executescript(f.read())
+            conn.execute("PRAGMA user_version = 1")
+    finally:
+        conn.close()
+
+
+@contextmanager
+def attached(conn: sqlite3.Connection, month: str, readonly: bool = True):
+    """Attach the archive of a month as `archive`, for the duration of the block.
+
+    Must not be used inside a transaction.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        month (str): Month of the archive, `YYYY-MM`.
+        readonly (bool, optional): Attach read-only. Defaults to True.
+
+    Yields:
+        sqlite3.Connection: The connection.
+    """
+
+    path = archive_path(conn, month)
+    conn.execute("ATTACH DATABASE ? AS archive",
+                 (f"file:{quote(os.path.abspath(path))}?mode=ro" if readonly else path,))
+    try:
+        yield conn
+    finally:
+        conn.execute("DETACH DATABASE archive")
+
+
+def _copy_orders(cur: sqlite3.Cursor, order_ids: list) -> None:
+    """Copy a batch of orders to the attached archive."""
+
+    params = {"ids": json.dumps(order_ids)}
+
+    for table, where in ARCHIVED_TABLES:
+        columns = ", ".join(f'"{row[1]}"' for row in cur.execute(f'PRAGMA archive.table_info("{table}")'))
+        # Replace, so a batch copied again after a crash before it was deleted
+        # here doesn't fail
+        cur.execute(f'INSERT OR REPLACE INTO archive."{table}" ({columns}) '
+                    f'SELECT {columns} FROM main."{table}" WHERE {where}', params)
+
+
+def _delete_orders(cur: sqlite3.Cursor, month: str, order_ids: list) -> int:
+    """Delete a batch of orders copied to the archive of a month."""
+
+    params = {"ids": json.dumps(order_ids), "month": month}
+
+    cur.execute(COUNT_ARCHIVED, params)
+
+    deleted = [cur.execute(f'DELETE FROM main."{table}" WHERE {where}', params).rowcount
+               for table, where in ARCHIVED_TABLES]
+    # Rows deleted from Order
+    return deleted[0]
+
+
+def archive_orders(db: Database, days: float = ARCHIVE_DAYS, batch: int = ARCHIVE_BATCH,
+                   now: datetime = None) -> int:
+    """Move completed orders older than `days` to the monthly archives.
+
+    Orders go with their items, toppings, receipt and kitchen job, to the
+    archive of the month they were created in. The hot database is in WAL
+    mode, so a transaction across both is not atomic: every batch is
+    committed to the archive first and then deleted here in a second
+    transaction. A crash in between leaves the orders in both, and the next
+    run copies them again.
+
+    Args:
+        db (Database): Database connection manager.
+        days (float, optional): Age in days of the orders to move. Defaults to `ARCHIVE_DAYS`.
+        batch (int, optional): Orders moved per transaction. Defaults to `ARCHIVE_BATCH`.
+        now (datetime, optional): Current time. Defaults to now.
+
+    Returns:
+        int: Number of orders moved.
+    """
+
+    cutoff = (now or datetime.now()) - timedelta(days=days)
+    moved = 0
+
+    while True:
+        with db.read() as conn:
+            rows = conn.execute(ARCHIVABLE_ORDERS, (cutoff, batch)).fetchall()
+
+        months = {}
+        for order_id, month in rows:
+            months.setdefault(month, []).append(order_id)
+
+        for month, order_ids in sorted(months.items()):
+            with db.write() as conn:
+                create_archive(archive_path(conn, month))
+                with attached(conn, month, readonly=False):
+                    run_transaction(conn, lambda cur: _copy_orders(cur, order_ids))
+                    moved += run_transaction(conn, lambda cur: _delete_orders(cur, month, order_ids))
+
+        if len(rows) < batch:
+            break
+
+    if moved and metrics.enabled:
+        metrics.increment('fastpizza_archived_orders_total', moved)
+    return moved
+
+
+def get_archived_orders(conn: sqlite3.Connection, user_id: int, limit: int, before: tuple = None,
+                        since: tuple = None) -> list:
+    """Get a page of the user's archived orders, newest first.
+
+    Only the archives of months the user has orders in are attached.
+
+    Args:
+        conn (sqlite3.Connection): Database connection, not in a transaction.
+        user_id (int): User id.
+        limit (int): Max number of orders.
+        before (tuple, optional): `(createdAt, id)` of the last order on the previous page.
+        since (tuple, optional): `(createdAt, id)`, skip the months before this one.
+
+    Returns:
+        list: `PastOrder`s.
+    """
+
+    first = since[0][:7] if since else '0000-00'
+    last = before[0][:7] if before else '9999-99'
+    months = [row[0] for row in conn.execute(USER_MONTHS, (user_id, first, last)).fetchall()]
+
+    orders = []
+    for month in months:
+        if not os.path.exists(archive_path(conn, month)):
+            continue
+        with attached(conn, month):
+            if before is None:
+                orders += stream(conn, PastOrder, ARCHIVED_PAST_ORDERS, (user_id, limit - len(orders)))
+            else:
+                orders += stream(conn, PastOrder, ARCHIVED_PAST_ORDERS_BEFORE,
+                                 (user_id, *before, limit - len(orders)))
+        if len(orders) >= limit:
+            break
+    return orders
+
+
+def get_archived_receipt(conn: sqlite3.Connection, user_id: int, order_id: int) -> tuple:
+    """Find the receipt of an archived order in the user's archives.
+
+    Returns:
+        tuple: `(userId, receipt JSON)`, or None.
+    """
+
+    for (month,) in conn.execute(USER_MONTHS, (user_id, '0000-00', '9999-99')).fetchall():
+        if not os.path.exists(archive_path(conn, month)):
+            continue
+        with attached(conn, month):
+            if row := conn.execute(ARCHIVED_RECEIPT, (order_id,)).fetchone():
+                return tuple(row)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old completed orders to monthly archive databases.")
+    parser.add_argument('command', choices=['run', 'list'])
+    parser.add_argument('--days', type=float, default=ARCHIVE_DAYS, help="Archive orders older than this")
+    parser.add_argument('--batch', type=int, default=ARCHIVE_BATCH, help="Orders moved per transaction")
+    parser.add_argument('--database', default='database.db')
+    args = parser.parse_args()
+
+    # Only the command line needs main, the order history imports this module
+    from main import open_database
+    db = open_database(args.database)
+    try:
+        if args.command == 'list':
+            with db.read() as conn:
+                for month in archive_months(conn):
+                    with attached(conn, month):
+                        count = conn.execute("SELECT COUNT(*) FROM archive.`Order`").fetchone()[0]
+                    print(f"{month}{count:>10} orders")
+            return
+
+        print(f"Archived {archive_orders(db, args.days, args.batch)} orders")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+-- Schema of the monthly order archives (see archive.py). The tables have the
+-- columns of their hot counterparts, without triggers, and only the indexes
+-- the order history, receipts and report rebuilds use.
+
+CREATE TABLE "Order" (
+    "id" INTEGER NOT NULL PRIMARY KEY,
+    "createdAt" DATETIME NOT NULL,
+    "updatedAt" DATETIME NOT NULL,
+    "status" INTEGER NOT NULL,
+    "userId" INTEGER NOT NULL,
+    "itemsCount" INTEGER NOT NULL,
+    "total" REAL NOT NULL,
+    "placedAt" DATETIME,
+    "holdExpiresAt" DATETIME
+);
+
+CREATE TABLE "OrderItem" (
+    "id" INTEGER NOT NULL PRIMARY KEY,
+    "createdAt" DATETIME NOT NULL,
+    "updatedAt" DATETIME NOT NULL,
+    "comment" TEXT,
+    "amount" INTEGER NOT NULL,
+    "orderId" INTEGER NOT NULL,
+    "productId" INTEGER NOT NULL
+);
+
+CREATE TABLE "IngredientOrderItemTopping" (
+    "id" INTEGER NOT NULL PRIMARY KEY,
+    "amount" INTEGER NOT NULL,
+    "ingredientId" INTEGER NOT NULL,
+    "orderItemId" INTEGER NOT NULL
+);
+
+CREATE TABLE "OrderReceipt" (
+    "orderId" INTEGER NOT NULL PRIMARY KEY,
+    "userId" INTEGER NOT NULL,
+    "receipt" TEXT NOT NULL,
+    "createdAt" DATETIME NOT NULL
+);
+
+CREATE TABLE "KitchenJob" (
+    "orderId" INTEGER NOT NULL PRIMARY KEY,
+    "prepSeconds" INTEGER NOT NULL,
+    "queuedAt" DATETIME NOT NULL,
+    "dueAt" DATETIME NOT NULL,
+    "station" TEXT,
+    "claimedAt" DATETIME,
+    "bakingAt" DATETIME,
+    "readyAt" DATETIME
+);
+
+CREATE INDEX "Order_userId_createdAt_idx" ON "Order"("userId", "createdAt");
+CREATE INDEX "OrderItem_orderId_productId_amount_idx" ON "OrderItem"("orderId", "productId", "amount");
+CREATE INDEX "IngredientOrderItemTopping_orderItemId_ingredientId_amount_idx" ON "IngredientOrderItemTopping"("orderItemId", "ingredientId", "amount");
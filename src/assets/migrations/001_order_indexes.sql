@@ -0,0 +1,10 @@
+-- Covering indexes for the order flows.
+
+-- Open order lookup and order history (userId, status, newest first)
+CREATE INDEX IF NOT EXISTS "Order_userId_status_createdAt_idx" ON "Order"("userId", "status", "createdAt");
+
+-- Items of an order, joined to Product
+CREATE INDEX IF NOT EXISTS "OrderItem_orderId_productId_amount_idx" ON "OrderItem"("orderId", "productId", "amount");
+
+-- Toppings of an order item, joined to Ingredient
+CREATE INDEX IF NOT EXISTS "IngredientOrderItemTopping_orderItemId_ingredientId_amount_idx" ON "IngredientOrderItemTopping"("orderItemId", "ingredientId", "amount");
@@ -0,0 +1,54 @@
+-- Revision counter bumped on every catalog change, used to invalidate the
+-- in-process catalog cache (see catalog.py).
+
+CREATE TABLE "CatalogRevision" (
+    "id" INTEGER NOT NULL PRIMARY KEY CHECK ("id" = 1),
+    "revision" INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO "CatalogRevision" ("id", "revision") VALUES (1, 0);
+
+CREATE TRIGGER "Product_catalogRevision_insert" AFTER INSERT ON "Product"
+BEGIN
+    UPDATE "CatalogRevision" SET "revision" = "revision" + 1;
+END;
+
+CREATE TRIGGER "Product_catalogRevision_update" AFTER UPDATE ON "Product"
+BEGIN
+    UPDATE "CatalogRevision" SET "revision" = "revision" + 1;
+END;
+
+CREATE TRIGGER "Product_catalogRevision_delete" AFTER DELETE ON "Product"
+BEGIN
+    UPDATE "CatalogRevision" SET "revision" = "revision" + 1;
+END;
+
+CREATE TRIGGER "Ingredient_catalogRevision_insert" AFTER INSERT ON "Ingredient"
+BEGIN
+    UPDATE "CatalogRevision" SET "revision" = "revision" + 1;
+END;
+
+CREATE TRIGGER "Ingredient_catalogRevision_update" AFTER UPDATE ON "Ingredient"
+BEGIN
+    UPDATE "CatalogRevision" SET "revision" = "revision" + 1;
+END;
+
+CREATE TRIGGER "Ingredient_catalogRevision_delete" AFTER DELETE ON "Ingredient"
+BEGIN
+    UPDATE "CatalogRevision" SET "revision" = "revision" + 1;
+END;
+
+CREATE TRIGGER "ProductIngredient_catalogRevision_insert" AFTER INSERT ON "ProductIngredient"
+BEGIN
+    UPDATE "CatalogRevision" SET "revision" = "revision" + 1;
+END;
+
+CREATE TRIGGER "ProductIngredient_catalogRevision_update" AFTER UPDATE ON "ProductIngredient"
+BEGIN
+    UPDATE "CatalogRevision" SET "revision" = "revision" + 1;
+END;
+
+CREATE TRIGGER "ProductIngredient_catalogRevision_delete" AFTER DELETE ON "ProductIngredient"
+BEGIN
+    UPDATE "CatalogRevision" SET "revision" = "revision" + 1;
+END;
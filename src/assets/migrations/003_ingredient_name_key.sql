@@ -0,0 +1,2 @@
+-- Ingredients are identified by name when importing catalogs (see catalog_io.py)
+CREATE UNIQUE INDEX IF NOT EXISTS "Ingredient_name_key" ON "Ingredient"("name");
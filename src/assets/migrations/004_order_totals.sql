@@ -0,0 +1,45 @@
+-- Item count and total stored on the order, kept up to date by triggers on
+-- OrderItem, so order history doesn't have to aggregate OrderItem rows.
+
+ALTER TABLE "Order" ADD COLUMN "itemsCount" INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE "Order" ADD COLUMN "total" REAL NOT NULL DEFAULT 0;
+
+UPDATE "Order" SET
+    "itemsCount" = (SELECT COUNT(*) FROM "OrderItem" oi WHERE oi."orderId" = "Order"."id"),
+    "total" = COALESCE((
+        SELECT SUM(oi."amount" * p."price")
+        FROM "OrderItem" oi JOIN "Product" p ON p."id" = oi."productId"
+        WHERE oi."orderId" = "Order"."id"
+    ), 0);
+
+CREATE TRIGGER "OrderItem_orderTotals_insert" AFTER INSERT ON "OrderItem"
+BEGIN
+    UPDATE "Order" SET
+        "itemsCount" = "itemsCount" + 1,
+        "total" = "total" + NEW."amount" * (SELECT "price" FROM "Product" WHERE "id" = NEW."productId")
+    WHERE "id" = NEW."orderId";
+END;
+
+CREATE TRIGGER "OrderItem_orderTotals_delete" AFTER DELETE ON "OrderItem"
+BEGIN
+    UPDATE "Order" SET
+        "itemsCount" = "itemsCount" - 1,
+        "total" = "total" - OLD."amount" * (SELECT "price" FROM "Product" WHERE "id" = OLD."productId")
+    WHERE "id" = OLD."orderId";
+END;
+
+CREATE TRIGGER "OrderItem_orderTotals_update" AFTER UPDATE OF "amount", "productId", "orderId" ON "OrderItem"
+BEGIN
+    UPDATE "Order" SET
+        "itemsCount" = "itemsCount" - 1,
+        "total" = "total" - OLD."amount" * (SELECT "price" FROM "Product" WHERE "id" = OLD."productId")
+    WHERE "id" = OLD."orderId";
+    UPDATE "Order" SET
+        "itemsCount" = "itemsCount" + 1,
+        "total" = "total" + NEW."amount" * (SELECT "price" FROM "Product" WHERE "id" = NEW."productId")
+    WHERE "id" = NEW."orderId";
+END;
+
+-- Order history, newest first, paged by (createdAt, id). Covers every status
+-- except open carts.
+CREATE INDEX IF NOT EXISTS "Order_userId_createdAt_placed_idx" ON "Order"("userId", "createdAt") WHERE "status" <> 0;
@@ -0,0 +1,48 @@
+-- Receipt of every placed order, frozen when the order is placed: line items
+-- with the prices as they were at purchase time, as JSON.
+
+CREATE TABLE "OrderReceipt" (
+    "orderId" INTEGER NOT NULL PRIMARY KEY,
+    "userId" INTEGER NOT NULL,
+    "receipt" TEXT NOT NULL,
+    "createdAt" DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT "OrderReceipt_orderId_fkey" FOREIGN KEY ("orderId") REFERENCES "Order" ("id") ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+CREATE TRIGGER "OrderReceipt_immutable" BEFORE UPDATE ON "OrderReceipt"
+BEGIN
+    SELECT RAISE(ABORT, 'Receipts can not be changed');
+END;
+
+-- Orders placed before this migration get a receipt with today's prices,
+-- which is the best we can do
+INSERT INTO "OrderReceipt" ("orderId", "userId", "receipt")
+SELECT
+    o."id",
+    o."userId",
+    json_object(
+        'orderId', o."id",
+        'createdAt', o."createdAt",
+        'placedAt', o."updatedAt",
+        'items', json((
+            SELECT json_group_array(json_object(
+                'name', p."name",
+                'amount', oi."amount",
+                'price', p."price",
+                'lineTotal', oi."amount" * p."price",
+                'comment', oi."comment",
+                'toppings', json((
+                    SELECT json_group_array(json_object('name', i."name", 'amount', t."amount"))
+                    FROM "IngredientOrderItemTopping" t
+                    JOIN "Ingredient" i ON i."id" = t."ingredientId"
+                    WHERE t."orderItemId" = oi."id"
+                ))
+            ))
+            FROM "OrderItem" oi
+            JOIN "Product" p ON p."id" = oi."productId"
+            WHERE oi."orderId" = o."id"
+        )),
+        'total', o."total"
+    )
+FROM "Order" o
+WHERE o."status" <> 0;
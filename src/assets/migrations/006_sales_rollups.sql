@@ -0,0 +1,97 @@
+-- Sales per hour, day and month, updated by a trigger when an order is
+-- placed, so reports never have to aggregate OrderItem rows. `reports.py
+-- rebuild` recomputes them from scratch.
+
+ALTER TABLE "Order" ADD COLUMN "placedAt" DATETIME;
+
+UPDATE "Order" SET "placedAt" = "updatedAt" WHERE "status" <> 0;
+
+-- Rollup periods and the strftime format of their buckets
+CREATE TABLE "RollupPeriod" (
+    "period" TEXT NOT NULL PRIMARY KEY,
+    "format" TEXT NOT NULL
+) WITHOUT ROWID;
+
+INSERT INTO "RollupPeriod" ("period", "format") VALUES
+    ('hour', '%Y-%m-%d %H:00'),
+    ('day', '%Y-%m-%d'),
+    ('month', '%Y-%m');
+
+CREATE TABLE "SalesRollup" (
+    "period" TEXT NOT NULL,
+    "bucket" TEXT NOT NULL,
+    "orders" INTEGER NOT NULL,
+    "revenue" REAL NOT NULL,
+    PRIMARY KEY ("period", "bucket")
+) WITHOUT ROWID;
+
+CREATE TABLE "ProductSalesRollup" (
+    "period" TEXT NOT NULL,
+    "bucket" TEXT NOT NULL,
+    "productId" INTEGER NOT NULL,
+    "units" INTEGER NOT NULL,
+    "revenue" REAL NOT NULL,
+    PRIMARY KEY ("period", "bucket", "productId")
+) WITHOUT ROWID;
+
+CREATE TABLE "ToppingUsageRollup" (
+    "period" TEXT NOT NULL,
+    "bucket" TEXT NOT NULL,
+    "ingredientId" INTEGER NOT NULL,
+    "amount" INTEGER NOT NULL,
+    PRIMARY KEY ("period", "bucket", "ingredientId")
+) WITHOUT ROWID;
+
+CREATE TRIGGER "Order_salesRollups_placed" AFTER UPDATE OF "status" ON "Order"
+WHEN OLD."status" = 0 AND NEW."status" <> 0
+BEGIN
+    INSERT INTO "SalesRollup" ("period", "bucket", "orders", "revenue")
+    SELECT rp."period", strftime(rp."format", NEW."placedAt"), 1, NEW."total"
+    FROM "RollupPeriod" rp
+    WHERE true
+    ON CONFLICT ("period", "bucket") DO UPDATE SET
+        "orders" = "orders" + excluded."orders",
+        "revenue" = "revenue" + excluded."revenue";
+
+    INSERT INTO "ProductSalesRollup" ("period", "bucket", "productId", "units", "revenue")
+    SELECT rp."period", strftime(rp."format", NEW."placedAt"), oi."productId", SUM(oi."amount"), SUM(oi."amount" * p."price")
+    FROM "RollupPeriod" rp, "OrderItem" oi
+    JOIN "Product" p ON p."id" = oi."productId"
+    WHERE oi."orderId" = NEW."id"
+    GROUP BY rp."period", oi."productId"
+    ON CONFLICT ("period", "bucket", "productId") DO UPDATE SET
+        "units" = "units" + excluded."units",
+        "revenue" = "revenue" + excluded."revenue";
+
+    INSERT INTO "ToppingUsageRollup" ("period", "bucket", "ingredientId", "amount")
+    SELECT rp."period", strftime(rp."format", NEW."placedAt"), t."ingredientId", SUM(t."amount" * oi."amount")
+    FROM "RollupPeriod" rp, "OrderItem" oi
+    JOIN "IngredientOrderItemTopping" t ON t."orderItemId" = oi."id"
+    WHERE oi."orderId" = NEW."id"
+    GROUP BY rp."period", t."ingredientId"
+    ON CONFLICT ("period", "bucket", "ingredientId") DO UPDATE SET
+        "amount" = "amount" + excluded."amount";
+END;
+
+-- Orders placed before this migration
+INSERT INTO "SalesRollup" ("period", "bucket", "orders", "revenue")
+SELECT rp."period", strftime(rp."format", o."placedAt"), COUNT(*), SUM(o."total")
+FROM "RollupPeriod" rp, "Order" o
+WHERE o."status" <> 0
+GROUP BY 1, 2;
+
+INSERT INTO "ProductSalesRollup" ("period", "bucket", "productId", "units", "revenue")
+SELECT rp."period", strftime(rp."format", o."placedAt"), oi."productId", SUM(oi."amount"), SUM(oi."amount" * p."price")
+FROM "RollupPeriod" rp, "Order" o
+JOIN "OrderItem" oi ON oi."orderId" = o."id"
+JOIN "Product" p ON p."id" = oi."productId"
+WHERE o."status" <> 0
+GROUP BY 1, 2, 3;
+
+INSERT INTO "ToppingUsageRollup" ("period", "bucket", "ingredientId", "amount")
+SELECT rp."period", strftime(rp."format", o."placedAt"), t."ingredientId", SUM(t."amount" * oi."amount")
+FROM "RollupPeriod" rp, "Order" o
+JOIN "OrderItem" oi ON oi."orderId" = o."id"
+JOIN "IngredientOrderItemTopping" t ON t."orderItemId" = oi."id"
+WHERE o."status" <> 0
+GROUP BY 1, 2, 3;
@@ -0,0 +1,60 @@
+-- How many of each product the current stock is enough for, the minimum over
+-- its ingredients of inStock / amount. NULL for products without ingredients.
+-- Kept up to date by triggers, which only touch the products using the
+-- ingredient or recipe line that changed.
+
+ALTER TABLE "Product" ADD COLUMN "maxBuildable" INTEGER;
+
+CREATE INDEX IF NOT EXISTS "ProductIngredient_ingredientId_idx" ON "ProductIngredient"("ingredientId");
+
+UPDATE "Product" SET "maxBuildable" = (
+    SELECT MIN(i."inStock" / pi."amount")
+    FROM "ProductIngredient" pi
+    JOIN "Ingredient" i ON i."id" = pi."ingredientId"
+    WHERE pi."productId" = "Product"."id"
+);
+
+CREATE TRIGGER "Ingredient_maxBuildable_update" AFTER UPDATE OF "inStock" ON "Ingredient"
+WHEN OLD."inStock" IS NOT NEW."inStock"
+BEGIN
+    UPDATE "Product" SET "maxBuildable" = (
+        SELECT MIN(i."inStock" / pi."amount")
+        FROM "ProductIngredient" pi
+        JOIN "Ingredient" i ON i."id" = pi."ingredientId"
+        WHERE pi."productId" = "Product"."id"
+    )
+    WHERE "id" IN (SELECT "productId" FROM "ProductIngredient" WHERE "ingredientId" = NEW."id");
+END;
+
+CREATE TRIGGER "ProductIngredient_maxBuildable_insert" AFTER INSERT ON "ProductIngredient"
+BEGIN
+    UPDATE "Product" SET "maxBuildable" = (
+        SELECT MIN(i."inStock" / pi."amount")
+        FROM "ProductIngredient" pi
+        JOIN "Ingredient" i ON i."id" = pi."ingredientId"
+        WHERE pi."productId" = "Product"."id"
+    )
+    WHERE "id" = NEW."productId";
+END;
+
+CREATE TRIGGER "ProductIngredient_maxBuildable_update" AFTER UPDATE OF "amount", "productId", "ingredientId" ON "ProductIngredient"
+BEGIN
+    UPDATE "Product" SET "maxBuildable" = (
+        SELECT MIN(i."inStock" / pi."amount")
+        FROM "ProductIngredient" pi
+        JOIN "Ingredient" i ON i."id" = pi."ingredientId"
+        WHERE pi."productId" = "Product"."id"
+    )
+    WHERE "id" IN (OLD."productId", NEW."productId");
+END;
+
+CREATE TRIGGER "ProductIngredient_maxBuildable_delete" AFTER DELETE ON "ProductIngredient"
+BEGIN
+    UPDATE "Product" SET "maxBuildable" = (
+        SELECT MIN(i."inStock" / pi."amount")
+        FROM "ProductIngredient" pi
+        JOIN "Ingredient" i ON i."id" = pi."ingredientId"
+        WHERE pi."productId" = "Product"."id"
+    )
+    WHERE "id" = OLD."productId";
+END;
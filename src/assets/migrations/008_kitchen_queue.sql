@@ -0,0 +1,51 @@
+-- Kitchen queue. Order.status goes 0 (open) -> 1 (queued) -> 2 (preparing)
+-- -> 3 (baking) -> 4 (ready). Placing an order adds a KitchenJob in the same
+-- transaction, which kitchen stations claim one at a time.
+
+-- Estimated seconds to prepare one of the product, each topping adds 20
+ALTER TABLE "Product" ADD COLUMN "prepSeconds" INTEGER NOT NULL DEFAULT 180;
+
+CREATE TABLE "KitchenJob" (
+    "orderId" INTEGER NOT NULL PRIMARY KEY,
+    "prepSeconds" INTEGER NOT NULL,
+    "queuedAt" DATETIME NOT NULL,
+    -- When the order would be prepared if started right away. Jobs are taken
+    -- earliest due first, so a small order isn't stuck behind a big one
+    -- placed just before it, while older orders still go first
+    "dueAt" DATETIME NOT NULL,
+    "station" TEXT,
+    "claimedAt" DATETIME,
+    "bakingAt" DATETIME,
+    "readyAt" DATETIME,
+    CONSTRAINT "KitchenJob_orderId_fkey" FOREIGN KEY ("orderId") REFERENCES "Order" ("id") ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+-- The queue: only unclaimed jobs, in the order they are taken
+CREATE INDEX IF NOT EXISTS "KitchenJob_queue_idx" ON "KitchenJob"("dueAt", "orderId") WHERE "claimedAt" IS NULL;
+-- Jobs being worked on, and finished jobs by time for the throughput
+CREATE INDEX IF NOT EXISTS "KitchenJob_active_idx" ON "KitchenJob"("claimedAt") WHERE "claimedAt" IS NOT NULL AND "readyAt" IS NULL;
+CREATE INDEX IF NOT EXISTS "KitchenJob_readyAt_idx" ON "KitchenJob"("readyAt") WHERE "readyAt" IS NOT NULL;
+
+CREATE TRIGGER "Order_kitchenJob_placed" AFTER UPDATE OF "status" ON "Order"
+WHEN OLD."status" = 0 AND NEW."status" = 1
+BEGIN
+    INSERT INTO "KitchenJob" ("orderId", "prepSeconds", "queuedAt", "dueAt")
+    SELECT
+        NEW."id",
+        e."seconds",
+        NEW."placedAt",
+        strftime('%Y-%m-%d %H:%M:%f', NEW."placedAt", '+' || e."seconds" || ' seconds')
+    FROM (
+        SELECT COALESCE(SUM(oi."amount" * (p."prepSeconds" + 20 * (
+            SELECT COALESCE(SUM(t."amount"), 0)
+            FROM "IngredientOrderItemTopping" t
+            WHERE t."orderItemId" = oi."id"
+        ))), 0) AS "seconds"
+        FROM "OrderItem" oi
+        JOIN "Product" p ON p."id" = oi."productId"
+        WHERE oi."orderId" = NEW."id"
+    ) e;
+END;
+
+-- Orders placed before there was a kitchen queue have long been served
+UPDATE "Order" SET "status" = 4 WHERE "status" = 1;
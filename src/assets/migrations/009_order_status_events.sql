@@ -0,0 +1,21 @@
+-- Log of Order.status changes, written in the transaction that makes the
+-- change. Every process tails it once and fans the events out to its
+-- subscribers (see events.py). Only the last 10000 events are kept.
+
+CREATE TABLE "OrderStatusEvent" (
+    "id" INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+    "orderId" INTEGER NOT NULL,
+    "userId" INTEGER NOT NULL,
+    "status" INTEGER NOT NULL,
+    "createdAt" DATETIME NOT NULL
+);
+
+CREATE TRIGGER "Order_statusEvent_update" AFTER UPDATE OF "status" ON "Order"
+WHEN OLD."status" IS NOT NEW."status"
+BEGIN
+    INSERT INTO "OrderStatusEvent" ("orderId", "userId", "status", "createdAt")
+    VALUES (NEW."id", NEW."userId", NEW."status", NEW."updatedAt");
+
+    DELETE FROM "OrderStatusEvent"
+    WHERE "id" <= (SELECT MAX("id") FROM "OrderStatusEvent") - 10000;
+END;
@@ -0,0 +1,128 @@
+-- Stock holds. Items in an open cart hold their ingredients instead of
+-- taking them out of stock, and stock is only taken when the order is
+-- placed. Holds are dropped with their item, and all of a cart's holds
+-- expire at Order.holdExpiresAt, which every change to the cart pushes
+-- back. Ingredient.held is the sum of the active holds, kept by triggers, so
+-- the available stock is inStock - held without adding anything up.
+
+ALTER TABLE "Ingredient" ADD COLUMN "held" INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE "Order" ADD COLUMN "holdExpiresAt" DATETIME;
+
+CREATE TABLE "StockHold" (
+    "orderItemId" INTEGER NOT NULL,
+    "ingredientId" INTEGER NOT NULL,
+    "orderId" INTEGER NOT NULL,
+    "amount" INTEGER NOT NULL,
+    PRIMARY KEY ("orderItemId", "ingredientId")
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS "StockHold_orderId_idx" ON "StockHold"("orderId");
+-- Carts whose holds can expire, for the sweeper
+CREATE INDEX IF NOT EXISTS "Order_holdExpiresAt_open_idx" ON "Order"("holdExpiresAt") WHERE "status" = 0 AND "holdExpiresAt" IS NOT NULL;
+
+CREATE TRIGGER "StockHold_held_insert" AFTER INSERT ON "StockHold"
+BEGIN
+    UPDATE "Ingredient" SET "held" = "held" + NEW."amount" WHERE "id" = NEW."ingredientId";
+END;
+
+CREATE TRIGGER "StockHold_held_update" AFTER UPDATE OF "amount" ON "StockHold"
+BEGIN
+    UPDATE "Ingredient" SET "held" = "held" - OLD."amount" + NEW."amount" WHERE "id" = NEW."ingredientId";
+END;
+
+CREATE TRIGGER "StockHold_held_delete" AFTER DELETE ON "StockHold"
+BEGIN
+    UPDATE "Ingredient" SET "held" = "held" - OLD."amount" WHERE "id" = OLD."ingredientId";
+END;
+
+-- Last line of defence, holds are checked against the stock before they are made
+CREATE TRIGGER "Ingredient_held_check" BEFORE UPDATE OF "held" ON "Ingredient"
+WHEN NEW."held" > OLD."held" AND NEW."held" > NEW."inStock"
+BEGIN
+    SELECT RAISE(ABORT, 'Not enough in stock to hold');
+END;
+
+-- Removing an item releases its holds, changing its amount scales them
+CREATE TRIGGER "OrderItem_stockHold_delete" AFTER DELETE ON "OrderItem"
+BEGIN
+    DELETE FROM "StockHold" WHERE "orderItemId" = OLD."id";
+END;
+
+CREATE TRIGGER "OrderItem_stockHold_amount" AFTER UPDATE OF "amount" ON "OrderItem"
+WHEN OLD."amount" <> NEW."amount"
+BEGIN
+    UPDATE "StockHold" SET "amount" = "amount" / OLD."amount" * NEW."amount" WHERE "orderItemId" = NEW."id";
+END;
+
+-- maxBuildable counts only the stock that isn't held
+DROP TRIGGER "Ingredient_maxBuildable_update";
+DROP TRIGGER "ProductIngredient_maxBuildable_insert";
+DROP TRIGGER "ProductIngredient_maxBuildable_update";
+DROP TRIGGER "ProductIngredient_maxBuildable_delete";
+
+CREATE TRIGGER "Ingredient_maxBuildable_update" AFTER UPDATE OF "inStock", "held" ON "Ingredient"
+WHEN OLD."inStock" IS NOT NEW."inStock" OR OLD."held" IS NOT NEW."held"
+BEGIN
+    UPDATE "Product" SET "maxBuildable" = (
+        SELECT MAX(MIN((i."inStock" - i."held") / pi."amount"), 0)
+        FROM "ProductIngredient" pi
+        JOIN "Ingredient" i ON i."id" = pi."ingredientId"
+        WHERE pi."productId" = "Product"."id"
+    )
+    WHERE "id" IN (SELECT "productId" FROM "ProductIngredient" WHERE "ingredientId" = NEW."id");
+END;
+
+CREATE TRIGGER "ProductIngredient_maxBuildable_insert" AFTER INSERT ON "ProductIngredient"
+BEGIN
+    UPDATE "Product" SET "maxBuildable" = (
+        SELECT MAX(MIN((i."inStock" - i."held") / pi."amount"), 0)
+        FROM "ProductIngredient" pi
+        JOIN "Ingredient" i ON i."id" = pi."ingredientId"
+        WHERE pi."productId" = "Product"."id"
+    )
+    WHERE "id" = NEW."productId";
+END;
+
+CREATE TRIGGER "ProductIngredient_maxBuildable_update" AFTER UPDATE OF "amount", "productId", "ingredientId" ON "ProductIngredient"
+BEGIN
+    UPDATE "Product" SET "maxBuildable" = (
+        SELECT MAX(MIN((i."inStock" - i."held") / pi."amount"), 0)
+        FROM "ProductIngredient" pi
+        JOIN "Ingredient" i ON i."id" = pi."ingredientId"
+        WHERE pi."productId" = "Product"."id"
+    )
+    WHERE "id" IN (OLD."productId", NEW."productId");
+END;
+
+CREATE TRIGGER "ProductIngredient_maxBuildable_delete" AFTER DELETE ON "ProductIngredient"
+BEGIN
+    UPDATE "Product" SET "maxBuildable" = (
+        SELECT MAX(MIN((i."inStock" - i."held") / pi."amount"), 0)
+        FROM "ProductIngredient" pi
+        JOIN "Ingredient" i ON i."id" = pi."ingredientId"
+        WHERE pi."productId" = "Product"."id"
+    )
+    WHERE "id" = OLD."productId";
+END;
+
+-- Open carts took their stock when items were added, give it back. Placing
+-- them checks the stock again.
+UPDATE "Ingredient" SET "inStock" = "inStock" + u."amount"
+FROM (
+    SELECT "ingredientId", SUM("amount") AS "amount"
+    FROM (
+        SELECT pi."ingredientId", oi."amount" * pi."amount" AS "amount"
+        FROM "Order" o
+        JOIN "OrderItem" oi ON oi."orderId" = o."id"
+        JOIN "ProductIngredient" pi ON pi."productId" = oi."productId"
+        WHERE o."status" = 0
+        UNION ALL
+        SELECT t."ingredientId", oi."amount" * t."amount"
+        FROM "Order" o
+        JOIN "OrderItem" oi ON oi."orderId" = o."id"
+        JOIN "IngredientOrderItemTopping" t ON t."orderItemId" = oi."id"
+        WHERE o."status" = 0
+    )
+    GROUP BY "ingredientId"
+) u
+WHERE "Ingredient"."id" = u."ingredientId";
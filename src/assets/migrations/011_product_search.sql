@@ -0,0 +1,83 @@
+-- Full-text search over the menu: product names, descriptions and the names
+-- of their ingredients. The rowid is the product id. Kept in sync by
+-- triggers on Product, ProductIngredient and Ingredient names. Prefix
+-- indexes make the search-as-you-type prefix queries cheap.
+
+CREATE VIRTUAL TABLE "ProductSearch" USING fts5(
+    "name", "description", "ingredients",
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+
+CREATE TRIGGER "Product_search_insert" AFTER INSERT ON "Product"
+BEGIN
+    INSERT INTO "ProductSearch" ("rowid", "name", "description", "ingredients")
+    VALUES (NEW."id", NEW."name", NEW."description", '');
+END;
+
+CREATE TRIGGER "Product_search_update" AFTER UPDATE OF "name", "description" ON "Product"
+BEGIN
+    UPDATE "ProductSearch" SET
+        "name" = NEW."name",
+        "description" = NEW."description"
+    WHERE "rowid" = NEW."id";
+END;
+
+CREATE TRIGGER "Product_search_delete" AFTER DELETE ON "Product"
+BEGIN
+    DELETE FROM "ProductSearch" WHERE "rowid" = OLD."id";
+END;
+
+CREATE TRIGGER "ProductIngredient_search_insert" AFTER INSERT ON "ProductIngredient"
+BEGIN
+    UPDATE "ProductSearch" SET "ingredients" = (
+        SELECT COALESCE(group_concat(i."name", ' '), '')
+        FROM "ProductIngredient" pi
+        JOIN "Ingredient" i ON i."id" = pi."ingredientId"
+        WHERE pi."productId" = NEW."productId"
+    )
+    WHERE "rowid" = NEW."productId";
+END;
+
+CREATE TRIGGER "ProductIngredient_search_update" AFTER UPDATE OF "productId", "ingredientId" ON "ProductIngredient"
+BEGIN
+    UPDATE "ProductSearch" SET "ingredients" = (
+        SELECT COALESCE(group_concat(i."name", ' '), '')
+        FROM "ProductIngredient" pi
+        JOIN "Ingredient" i ON i."id" = pi."ingredientId"
+        WHERE pi."productId" = "ProductSearch"."rowid"
+    )
+    WHERE "rowid" IN (OLD."productId", NEW."productId");
+END;
+
+CREATE TRIGGER "ProductIngredient_search_delete" AFTER DELETE ON "ProductIngredient"
+BEGIN
+    UPDATE "ProductSearch" SET "ingredients" = (
+        SELECT COALESCE(group_concat(i."name", ' '), '')
+        FROM "ProductIngredient" pi
+        JOIN "Ingredient" i ON i."id" = pi."ingredientId"
+        WHERE pi."productId" = OLD."productId"
+    )
+    WHERE "rowid" = OLD."productId";
+END;
+
+CREATE TRIGGER "Ingredient_search_update" AFTER UPDATE OF "name" ON "Ingredient"
+WHEN OLD."name" IS NOT NEW."name"
+BEGIN
+    UPDATE "ProductSearch" SET "ingredients" = (
+        SELECT COALESCE(group_concat(i."name", ' '), '')
+        FROM "ProductIngredient" pi
+        JOIN "Ingredient" i ON i."id" = pi."ingredientId"
+        WHERE pi."productId" = "ProductSearch"."rowid"
+    )
+    WHERE "rowid" IN (SELECT "productId" FROM "ProductIngredient" WHERE "ingredientId" = NEW."id");
+END;
+
+INSERT INTO "ProductSearch" ("rowid", "name", "description", "ingredients")
+SELECT p."id", p."name", p."description", (
+    SELECT COALESCE(group_concat(i."name", ' '), '')
+    FROM "ProductIngredient" pi
+    JOIN "Ingredient" i ON i."id" = pi."ingredientId"
+    WHERE pi."productId" = p."id"
+)
+FROM "Product" p;
@@ -0,0 +1,11 @@
+-- Version of every user row, used to invalidate the in-process user map
+-- (see users.py). Statements that change a user bump it themselves so they
+-- can return the new row, the trigger bumps it for every other update.
+
+ALTER TABLE "User" ADD COLUMN "version" INTEGER NOT NULL DEFAULT 0;
+
+CREATE TRIGGER "User_version_update" AFTER UPDATE ON "User"
+WHEN NEW."version" = OLD."version"
+BEGIN
+    UPDATE "User" SET "version" = "version" + 1 WHERE "id" = NEW."id";
+END;
@@ -0,0 +1,13 @@
+-- Completed orders older than a while are moved to one archive database per
+-- month (see archive.py). OrderArchive tells which months hold archived
+-- orders of a user, so the order history only attaches the archives it needs.
+
+CREATE TABLE "OrderArchive" (
+    "userId" INTEGER NOT NULL,
+    "month" TEXT NOT NULL,
+    "orders" INTEGER NOT NULL,
+    PRIMARY KEY ("userId", "month")
+) WITHOUT ROWID;
+
+-- Completed orders, oldest first, for the archival job
+CREATE INDEX IF NOT EXISTS "Order_createdAt_ready_idx" ON "Order"("createdAt") WHERE "status" = 4;
@@ -0,0 +1,16 @@
+-- Only bump the catalog revision when the catalog itself changes. Stock,
+-- holds and maxBuildable change on every cart and order, and are read apart
+-- from the cached catalog (see catalog.py).
+
+DROP TRIGGER "Product_catalogRevision_update";
+DROP TRIGGER "Ingredient_catalogRevision_update";
+
+CREATE TRIGGER "Product_catalogRevision_update" AFTER UPDATE OF "name", "description", "price", "prepSeconds" ON "Product"
+BEGIN
+    UPDATE "CatalogRevision" SET "revision" = "revision" + 1;
+END;
+
+CREATE TRIGGER "Ingredient_catalogRevision_update" AFTER UPDATE OF "name", "isTopping" ON "Ingredient"
+BEGIN
+    UPDATE "CatalogRevision" SET "revision" = "revision" + 1;
+END;
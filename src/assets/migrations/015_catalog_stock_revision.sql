@@ -0,0 +1,25 @@
+-- Revision of the stock, so the catalog cache only reads the products and
+-- ingredients whose stock changed since it last looked (see catalog.py).
+-- Every change of maxBuildable, inStock or held bumps the counter and stamps
+-- the changed row with it.
+
+ALTER TABLE "CatalogRevision" ADD COLUMN "stockRevision" INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE "Product" ADD COLUMN "stockRevision" INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE "Ingredient" ADD COLUMN "stockRevision" INTEGER NOT NULL DEFAULT 0;
+
+CREATE INDEX "Product_stockRevision_idx" ON "Product"("stockRevision");
+CREATE INDEX "Ingredient_stockRevision_idx" ON "Ingredient"("stockRevision");
+
+CREATE TRIGGER "Product_stockRevision_update" AFTER UPDATE OF "maxBuildable" ON "Product"
+WHEN OLD."maxBuildable" IS NOT NEW."maxBuildable"
+BEGIN
+    UPDATE "CatalogRevision" SET "stockRevision" = "stockRevision" + 1;
+    UPDATE "Product" SET "stockRevision" = (SELECT "stockRevision" FROM "CatalogRevision") WHERE "id" = NEW."id";
+END;
+
+CREATE TRIGGER "Ingredient_stockRevision_update" AFTER UPDATE OF "inStock", "held" ON "Ingredient"
+WHEN OLD."inStock" IS NOT NEW."inStock" OR OLD."held" IS NOT NEW."held"
+BEGIN
+    UPDATE "CatalogRevision" SET "stockRevision" = "stockRevision" + 1;
+    UPDATE "Ingredient" SET "stockRevision" = (SELECT "stockRevision" FROM "CatalogRevision") WHERE "id" = NEW."id";
+END;
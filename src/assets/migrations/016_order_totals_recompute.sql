@@ -0,0 +1,54 @@
+-- The order totals triggers added and subtracted amount * the current price,
+-- so a price change while a cart was open made the total drift, even below
+-- zero once the item was removed. They now count the order's items again,
+-- a handful of rows found by the OrderItem orderId index.
+
+DROP TRIGGER "OrderItem_orderTotals_insert";
+DROP TRIGGER "OrderItem_orderTotals_delete";
+DROP TRIGGER "OrderItem_orderTotals_update";
+
+CREATE TRIGGER "OrderItem_orderTotals_insert" AFTER INSERT ON "OrderItem"
+BEGIN
+    UPDATE "Order" SET
+        "itemsCount" = (SELECT COUNT(*) FROM "OrderItem" WHERE "orderId" = "Order"."id"),
+        "total" = COALESCE((
+            SELECT SUM(oi."amount" * p."price")
+            FROM "OrderItem" oi JOIN "Product" p ON p."id" = oi."productId"
+            WHERE oi."orderId" = "Order"."id"
+        ), 0)
+    WHERE "id" = NEW."orderId";
+END;
+
+CREATE TRIGGER "OrderItem_orderTotals_delete" AFTER DELETE ON "OrderItem"
+BEGIN
+    UPDATE "Order" SET
+        "itemsCount" = (SELECT COUNT(*) FROM "OrderItem" WHERE "orderId" = "Order"."id"),
+        "total" = COALESCE((
+            SELECT SUM(oi."amount" * p."price")
+            FROM "OrderItem" oi JOIN "Product" p ON p."id" = oi."productId"
+            WHERE oi."orderId" = "Order"."id"
+        ), 0)
+    WHERE "id" = OLD."orderId";
+END;
+
+CREATE TRIGGER "OrderItem_orderTotals_update" AFTER UPDATE OF "amount", "productId", "orderId" ON "OrderItem"
+BEGIN
+    UPDATE "Order" SET
+        "itemsCount" = (SELECT COUNT(*) FROM "OrderItem" WHERE "orderId" = "Order"."id"),
+        "total" = COALESCE((
+            SELECT SUM(oi."amount" * p."price")
+            FROM "OrderItem" oi JOIN "Product" p ON p."id" = oi."productId"
+            WHERE oi."orderId" = "Order"."id"
+        ), 0)
+    WHERE "id" IN (OLD."orderId", NEW."orderId");
+END;
+
+-- Open carts may have drifted already
+UPDATE "Order" SET
+    "itemsCount" = (SELECT COUNT(*) FROM "OrderItem" WHERE "orderId" = "Order"."id"),
+    "total" = COALESCE((
+        SELECT SUM(oi."amount" * p."price")
+        FROM "OrderItem" oi JOIN "Product" p ON p."id" = oi."productId"
+        WHERE oi."orderId" = "Order"."id"
+    ), 0)
+WHERE "status" = 0;
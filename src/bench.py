@@ -0,0 +1,230 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import helpers
+import passwords
+from catalog import catalog
+from db import Database
+from flows.login import login_flow
+from flows.order import modify_order_flow, order_pizza_flow, place_order_flow
+from flows.orders import orders_flow
+from helpers import session_io
+from main import open_database
+
+FLOWS = ['login_flow', 'order_pizza_flow', 'modify_order_flow', 'place_order_flow', 'orders_flow']
+
+
+class ScriptedIO:
+    """Session I/O that answers prompts from a script and discards output."""
+
+    def __init__(self, lines: list):
+        self.lines = list(lines)
+        self.written = 0
+
+    def write(self, text: str) -> None:
+        self.written += len(text)
+
+    def read_line(self, prompt: str = "") -> str:
+        if not self.lines:
+            raise EOFError("Script ran out of input")
+        return self.lines.pop(0)
+
+
+def prepare_database(path: str, customers: int, password: str) -> None:
+    """Create a seeded database with customers and plenty of stock.
+
+    Args:
+        path (str): Path of the new database.
+        customers (int): Number of customers to create.
+        password (str): Password of every customer.
+    """
+
+    db = open_database(path)
+    hashed_password = passwords.hash_password(password)
+    with db.write() as conn:
+        conn.executemany(
+            "INSERT INTO User (email, password, firstName, lastName, isAdmin, updatedAt) VALUES (?, ?, ?, ?, ?, ?)",
+            [(f"customer{i}@bench.test", hashed_password, "Customer", str(i), False, datetime.now())
+             for i in range(customers)])
+        conn.execute("UPDATE Ingredient SET inStock = 1000000000")
+    db.close()
+
+
+def run_scripted(fn, lines: list, *args):
+    """Run a flow with scripted input in the current thread."""
+
+    token = session_io.set(ScriptedIO(lines))
+    try:
+        return fn(*args)
+    finally:
+        session_io.reset(token)
+
+
+def customer_session(db: Database, customer: int, iterations: int, password: str, latencies: dict) -> None:
+    """Drive one customer through the flows `iterations` times.
+
+    Latencies are appended, in seconds, to `latencies[flow name]`.
+    """
+
+    def timed(name, fn, lines, *args):
+        start = time.perf_counter()
+        result = run_scripted(fn, lines, *args)
+        latencies[name].append(time.perf_counter() - start)
+        return result
+
+    with db.read() as conn:
+        menu = catalog.refresh(conn)
+    # Indexes in the prompts are 1-based, the last topping entry is "Done"
+    done = str(len(menu.toppings) + 1)
+
+    for _ in range(iterations):
+        # Have an account: yes, email, password
+        user = timed('login_flow', login_flow,
+                     ['1', f"customer{customer}@bench.test", password], db)
+
+        # Second pizza, 1 of it, one extra topping, no comment, no more pizzas
+        timed('order_pizza_flow', order_pizza_flow,
+              ['2', '1', 'y', '1', '1', done, '', 'n'], user, db)
+
+        # First item, change amount to 2, go back, go back
+        timed('modify_order_flow', modify_order_flow,
+              ['1', '2', '2', '4', '2'], user, db)
+
+        timed('place_order_flow', place_order_flow, ['y', 'n'], user, db)
+
+        # View the newest order, press enter
+        timed('orders_flow', orders_flow, ['1', ''], user, db)
+
+
+def run_worker(path: str, customers: range, iterations: int, password: str, rounds: int) -> dict:
+    """Run customers in threads against the database, in this process.
+
+    Returns:
+        dict: Latencies per flow, errors and busy counters.
+    """
+
+    passwords.ROUNDS = rounds
+    # Every customer logs in over and over, which is not what we're measuring
+    passwords.limiter = passwords.RateLimiter(burst=10**9, per_minute=10**9)
+
+    db = Database(path)
+    latencies = {name: [] for name in FLOWS}
+    errors = []
+
+    def session(customer):
+        try:
+            customer_session(db, customer, iterations, password, latencies)
+        except Exception as e:
+            errors.append(f"customer {customer}: {e!r}")
+
+    threads = [threading.Thread(target=session, args=(c,)) for c in customers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    db.close()
+    return {"latencies": latencies, "errors": errors, **helpers.transaction_stats}
+
+
+def _process_worker(args):
+    return run_worker(*args)
+
+
+def percentile(values: list, p: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))]
+
+
+def run_benchmark(customers: int, iterations: int, processes: int, rounds: int, path: str = None) -> dict:
+    """Run the benchmark and summarise the results.
+
+    Args:
+        customers (int): Number of simulated customers, each in its own thread.
+        iterations (int): Times each customer goes through all flows.
+        processes (int): Number of processes to spread the customers over.
+        rounds (int): bcrypt work factor for the customers' passwords.
+        path (str, optional): Database to use, a temporary one by default.
+
+    Returns:
+        dict: Machine-readable results.
+    """
+
+    password = "benchmark-password"
+    passwords.ROUNDS = rounds
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = path or os.path.join(tmp, 'bench.db')
+        prepare_database(path, customers, password)
+
+        chunks = [range(p, customers, processes) for p in range(processes)]
+        jobs = [(path, chunk, iterations, password, rounds) for chunk in chunks]
+
+        start = time.perf_counter()
+        if processes == 1:
+            results = [run_worker(*jobs[0])]
+        else:
+            with multiprocessing.get_context('spawn').Pool(processes) as pool:
+                results = pool.map(_process_worker, jobs)
+        elapsed = time.perf_counter() - start
+
+    flows = {}
+    for name in FLOWS:
+        values = sorted(v for r in results for v in r["latencies"][name])
+        flows[name] = {
+            "count": len(values),
+            "throughput_per_s": len(values) / elapsed,
+            "mean_ms": sum(values) / len(values) * 1000 if values else None,
+            "p50_ms": percentile(values, 50) * 1000 if values else None,
+            "p95_ms": percentile(values, 95) * 1000 if values else None,
+            "p99_ms": percentile(values, 99) * 1000 if values else None,
+        }
+
+    return {
+        "config": {
+            "customers": customers,
+            "iterations": iterations,
+            "processes": processes,
+            "bcrypt_rounds": rounds,
+            "python": sys.version.split()[0],
+        },
+        "elapsed_s": elapsed,
+        "sessions_per_s": customers * iterations / elapsed,
+        "flows": flows,
+        "busy_retries": sum(r["busy_retries"] for r in results),
+        "busy_failures": sum(r["busy_failures"] for r in results),
+        "errors": [e for r in results for e in r["errors"]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the real flows with scripted customers and report latencies as JSON.")
+    parser.add_argument('--customers', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--rounds', type=int, default=4, help="bcrypt work factor (default: 4, the minimum)")
+    parser.add_argument('--output', help="Write the results to a file instead of stdout")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.customers, args.iterations, args.processes, args.rounds)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
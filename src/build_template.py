@@ -0,0 +1,49 @@
+import argparse
+import os
+import sqlite3
+
+from helpers import create_tables, migrate, populate_db
+from main import TEMPLATE_PATH
+
+# Tables whose planner statistics are known when the template is built. The
+# order tables start out empty, statistics saying so would soon be wrong.
+ANALYZED_TABLES = ['Product', 'Ingredient', 'ProductIngredient']
+
+
+def build_template(path: str = TEMPLATE_PATH) -> None:
+    """Build the seeded, migrated and analyzed template database.
+
+    Args:
+        path (str, optional): Path of the template. Defaults to `TEMPLATE_PATH`.
+    """
+
+    tmp = f"{path}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+
+    conn = create_tables(tmp)
+    try:
+        populate_db(conn)
+        migrate(conn)
+        for table in ANALYZED_TABLES:
+            conn.execute(f'ANALYZE "{table}"')
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the template database copied on first start.")
+    parser.add_argument('--output', default=TEMPLATE_PATH)
+    args = parser.parse_args()
+
+    build_template(args.output)
+    print(f"Built {args.output} (schema version "
+          f"{sqlite3.connect(args.output).execute('PRAGMA user_version').fetchone()[0]})")
+
+
+if __name__ == '__main__':
+    main()
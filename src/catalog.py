@@ -0,0 +1,192 @@
+import json
+import re
+import sqlite3
+import threading
+from typing import NamedTuple
+
+from repository import (get_ingredient_stock, get_product_stock, iter_ingredients, iter_product_ingredients,
+                        iter_products)
+
+# Weights of the ProductSearch columns (name, description, ingredients) when ranking matches
+SEARCH_WEIGHTS = (10.0, 1.0, 2.0)
+
+
+# Catalog and stock revision, see CatalogRevision
+CATALOG_REVISION = "SELECT revision, stockRevision FROM CatalogRevision WHERE id = 1"
+
+
+class Menu(NamedTuple):
+    """Snapshot of the catalog, never changed once made.
+
+    Flows take one from `Catalog.refresh` and index only into it, so a
+    refresh by another session can't make a choice point at another product
+    than the label that was picked.
+    """
+
+    products: tuple
+    toppings: tuple
+    ingredients: dict
+    recipes: dict
+    product_labels: tuple
+    topping_labels: tuple
+    # How many of each product the stock is enough for, and the available
+    # stock of each ingredient, by id
+    max_buildable: dict
+    available: dict
+    # Ids of the products the labels show as sold out
+    sold_out: frozenset
+    # JSON of every product up to its maxBuildable value, and of the toppings
+    product_json: tuple
+    toppings_json: bytes
+
+    def render_json(self) -> bytes:
+        """The menu as JSON, with the current maxBuildable of every product."""
+
+        products = b", ".join(
+            part + (b"null" if (n := self.max_buildable.get(p.id)) is None else str(n).encode()) + b"}"
+            for part, p in zip(self.product_json, self.products))
+        return b'{"products": [' + products + b'], "toppings": ' + self.toppings_json + b'}'
+
+
+# Before the first refresh
+EMPTY_MENU = Menu((), (), {}, {}, (), (), {}, {}, frozenset(), (), b"[]")
+
+
+class Catalog:
+    """In-process cache of the menu: products, toppings, recipes and labels.
+
+    The cache is only reloaded when the catalog has actually changed. A cheap
+    `PRAGMA data_version` / `total_changes` check tells whether anything was
+    committed since the last lookup, and only then is the catalog revision
+    (bumped by triggers on Product, Ingredient and ProductIngredient) read.
+    This keeps several terminals or processes sharing the database consistent.
+
+    The stock changes with every cart and order, so it has a revision of its
+    own, stamped on every product and ingredient whose stock changed. Only
+    those rows are read, and the labels are only rendered again when a
+    product sells out or comes back. The menu JSON is rendered once per
+    catalog change, with the stock filled in per request.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+        self._menu = EMPTY_MENU
+        # Last seen (data_version, total_changes, revisions) per connection
+        self._seen = {}
+        self._revisions = None
+        self._lock = threading.Lock()
+
+    def refresh(self, conn: sqlite3.Connection) -> Menu:
+        """Get the menu, up to date with the database.
+
+        Args:
+            conn (sqlite3.Connection): Database connection.
+
+        Returns:
+            Menu: Snapshot of the catalog.
+        """
+
+        with self._lock:
+            key = (conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+            seen_key, seen_revisions = self._seen.get(id(conn), (None, None))
+            if key == seen_key and seen_revisions == self._revisions:
+                self.hits += 1
+                return self._menu
+
+            # Read before the rows, anything changed later is read next time
+            revisions = tuple(conn.execute(CATALOG_REVISION).fetchone())
+            self._seen[id(conn)] = (key, revisions)
+
+            if self._revisions is None or revisions[0] != self._revisions[0]:
+                self.misses += 1
+                self._menu = self._update_stock(self._load(conn), get_product_stock(conn),
+                                                get_ingredient_stock(conn), render=True)
+            else:
+                self.hits += 1
+                if revisions[1] != self._revisions[1]:
+                    since = self._revisions[1]
+                    self._menu = self._update_stock(self._menu, get_product_stock(conn, since),
+                                                    get_ingredient_stock(conn, since))
+
+            self._revisions = revisions
+            return self._menu
+
+    def _load(self, conn: sqlite3.Connection) -> Menu:
+        """Load the whole catalog from the database, without the stock."""
+
+        products = tuple(iter_products(conn))
+        ingredients = {i.id: i for i in iter_ingredients(conn)}
+
+        recipes = {p.id: [] for p in products}
+        for r in iter_product_ingredients(conn):
+            recipes.setdefault(r.productId, []).append({
+                "id": r.ingredientId,
+                "name": ingredients[r.ingredientId].name,
+                "amount": r.amount,
+            })
+
+        toppings = tuple(i for i in ingredients.values() if i.isTopping)
+
+        # maxBuildable goes last, everything up to its value is kept
+        product_json = tuple(json.dumps({
+            "id": p.id,
+            "name": p.name,
+            "description": p.description,
+            "price": p.price,
+            "ingredients": recipes[p.id],
+            "maxBuildable": None,
+        })[:-len("null}")].encode('utf-8') for p in products)
+
+        return EMPTY_MENU._replace(
+            products=products, toppings=toppings, ingredients=ingredients, recipes=recipes,
+            topping_labels=tuple(i.name for i in toppings), product_json=product_json,
+            toppings_json=json.dumps([{"id": i.id, "name": i.name} for i in toppings]).encode('utf-8'))
+
+    @staticmethod
+    def _update_stock(menu: Menu, max_buildable: dict, available: dict, render: bool = False) -> Menu:
+        """Apply changed stock, and render the labels again if a product sold out or came back."""
+
+        sold_out = (menu.sold_out - max_buildable.keys()) | {i for i, n in max_buildable.items() if n == 0}
+        render = render or sold_out != menu.sold_out
+        menu = menu._replace(max_buildable={**menu.max_buildable, **max_buildable},
+                             available={**menu.available, **available}, sold_out=sold_out)
+        if not render:
+            return menu
+
+        return menu._replace(product_labels=tuple(
+            f"{p.price} kr - {p.name}{' (SOLD OUT)' if p.id in sold_out else ''}\n - {p.description}"
+            for p in menu.products))
+
+
+def search_products(conn: sqlite3.Connection, text: str, limit: int = 50) -> list:
+    """Search the menu by product name, description and ingredients.
+
+    Every word of the text matches as a prefix, so results can be shown
+    while the customer is still typing.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        text (str): Search text.
+        limit (int, optional): Max number of results. Defaults to 50.
+
+    Returns:
+        list: Ids of the matching products, best match first.
+    """
+
+    if not (words := re.findall(r"\w+", text)):
+        return []
+
+    query = " ".join(f'"{word}"*' for word in words)
+    return [row[0] for row in conn.execute(f"""
+        SELECT rowid
+        FROM ProductSearch
+        WHERE ProductSearch MATCH ?
+        ORDER BY bm25(ProductSearch, {', '.join(map(str, SEARCH_WEIGHTS))})
+        LIMIT ?
+    """, (query, limit))]
+
+
+# Shared by all flows in this process
+catalog = Catalog()
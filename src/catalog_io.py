@@ -0,0 +1,300 @@
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+from datetime import datetime
+from itertools import islice
+
+from db import Database
+from main import open_database
+
+# Records written per executemany call
+BATCH_SIZE = 500
+
+CSV_FIELDS = ['type', 'name', 'price', 'description', 'in_stock', 'is_topping', 'ingredients']
+
+# Fields a record of each type must have
+REQUIRED_FIELDS = {
+    "ingredient": ("name",),
+    "product": ("name", "price"),
+}
+
+UPSERT_INGREDIENT = """
+    INSERT INTO Ingredient
+        (name, inStock, isTopping, updatedAt)
+    VALUES
+        (:name, COALESCE(:in_stock, 0), COALESCE(:is_topping, false), :now)
+    ON CONFLICT (name) DO UPDATE SET
+        inStock = COALESCE(:in_stock, inStock),
+        isTopping = COALESCE(:is_topping, isTopping),
+        updatedAt = :now
+    WHERE inStock IS NOT COALESCE(:in_stock, inStock)
+          OR isTopping IS NOT COALESCE(:is_topping, isTopping)
+"""
+
+UPSERT_PRODUCT = """
+    INSERT INTO Product
+        (name, price, description, updatedAt)
+    VALUES
+        (:name, :price, :description, :now)
+    ON CONFLICT (name) DO UPDATE SET
+        price = :price,
+        description = :description,
+        updatedAt = :now
+    WHERE price IS NOT :price
+          OR description IS NOT :description
+"""
+
+UPSERT_PRODUCT_INGREDIENT = """
+    INSERT INTO ProductIngredient
+        (productId, ingredientId, amount, updatedAt)
+    SELECT
+        p.id, i.id, :amount, :now
+    FROM Product p, Ingredient i
+    WHERE p.name = :product
+          AND i.name = :ingredient
+    ON CONFLICT (productId, ingredientId) DO UPDATE SET
+        amount = :amount,
+        updatedAt = :now
+    WHERE amount IS NOT :amount
+"""
+
+# Drop recipe lines that are no longer in the product's ingredient list
+DELETE_REMOVED_INGREDIENTS = """
+    DELETE FROM ProductIngredient
+    WHERE productId = (SELECT id FROM Product WHERE name = :product)
+          AND ingredientId NOT IN (
+              SELECT i.id
+              FROM json_each(:ingredients) j JOIN Ingredient i ON
+                  i.name = j.value
+          )
+"""
+
+
+def check_record(record, where: str) -> dict:
+    """Check that a record has the fields its type needs.
+
+    Args:
+        record: Catalog record.
+        where (str): Where the record is from, for the error, e.g. `line 3`.
+
+    Raises:
+        ValueError: If the record is invalid, naming the missing field.
+
+    Returns:
+        dict: The record.
+    """
+
+    if not isinstance(record, dict):
+        raise ValueError(f"{where}: expected an object")
+    if (kind := record.get("type")) not in REQUIRED_FIELDS:
+        raise ValueError(f"{where}: unknown record type {kind!r}")
+    for name in REQUIRED_FIELDS[kind]:
+        if record.get(name) is None:
+            raise ValueError(f"{where}: missing field '{name}'")
+    if kind == "product":
+        for ingredient in record.get("ingredients") or []:
+            if not isinstance(ingredient, dict) or ingredient.get("name") is None or ingredient.get("amount") is None:
+                raise ValueError(f"{where}: ingredients of '{record['name']}' need a 'name' and an 'amount'")
+    return record
+
+
+def read_jsonl(f):
+    """Read catalog records, one JSON object per line."""
+
+    for number, line in enumerate(f, 1):
+        if line.strip():
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"line {number}: {e}")
+            yield check_record(record, f"line {number}")
+
+
+def read_csv(f):
+    """Read catalog records from CSV with `CSV_FIELDS` columns.
+
+    Product ingredients are written as `name:amount;name:amount`.
+    """
+
+    reader = csv.DictReader(f)
+    for row in reader:
+        where = f"line {reader.line_num}"
+        record = {"type": row.get("type"), "name": row.get("name") or None}
+        try:
+            if row.get("type") == "ingredient":
+                if row.get("in_stock"):
+                    record["in_stock"] = int(row["in_stock"])
+                if row.get("is_topping"):
+                    record["is_topping"] = row["is_topping"].lower() in ("1", "true", "yes")
+            else:
+                record["price"] = float(row["price"]) if row.get("price") else None
+                record["description"] = row.get("description") or None
+                record["ingredients"] = [
+                    {"name": name, "amount": int(amount)}
+                    for name, amount in (part.rsplit(":", 1) for part in (row.get("ingredients") or "").split(";") if part)
+                ]
+        except ValueError as e:
+            raise ValueError(f"{where}: {e}")
+        yield check_record(record, where)
+
+
+def write_jsonl(f, records) -> None:
+    for record in records:
+        f.write(json.dumps(record))
+        f.write("\n")
+
+
+def write_csv(f, records) -> None:
+    writer = csv.DictWriter(f, CSV_FIELDS)
+    writer.writeheader()
+    for record in records:
+        if record["type"] == "product":
+            record = {**record, "ingredients": ";".join(f"{i['name']}:{i['amount']}" for i in record["ingredients"])}
+        writer.writerow(record)
+
+
+FORMATS = {
+    "jsonl": (read_jsonl, write_jsonl),
+    "csv": (read_csv, write_csv),
+}
+
+
+def import_catalog(db: Database, records) -> dict:
+    """Upsert catalog records in one transaction.
+
+    Records are dicts with a `type` of `ingredient` (`name`, `in_stock`,
+    `is_topping`) or `product` (`name`, `price`, `description` and
+    `ingredients`, a list of `{"name", "amount"}`). Ingredients must come
+    before the products that use them. Rows that didn't change aren't written.
+
+    Args:
+        db (Database): Database connection manager.
+        records (iterable): Catalog records, read lazily.
+
+    Raises:
+        ValueError: If a record is invalid.
+
+    Returns:
+        dict: Number of ingredients and products read, and rows written.
+    """
+
+    now = datetime.now()
+    stats = {"ingredients": 0, "products": 0, "changes": 0}
+
+    def run(cur: sqlite3.Cursor) -> dict:
+        changes_before = cur.connection.total_changes
+        known_ingredients = {row[0] for row in cur.execute("SELECT name FROM Ingredient")}
+
+        # Readers check their records by line, records from elsewhere by number
+        records_iter = (check_record(record, f"record {number}") for number, record in enumerate(records, 1))
+        while batch := list(islice(records_iter, BATCH_SIZE)):
+            ingredients, products, recipe_lines = [], [], []
+
+            for record in batch:
+                if record["type"] == "ingredient":
+                    ingredients.append({
+                        "name": record["name"],
+                        "in_stock": record.get("in_stock"),
+                        "is_topping": record.get("is_topping"),
+                        "now": now,
+                    })
+                    known_ingredients.add(record["name"])
+                else:
+                    products.append({
+                        "name": record["name"],
+                        "price": record["price"],
+                        "description": record.get("description"),
+                        "ingredients": json.dumps([i["name"] for i in (record.get("ingredients") or [])]),
+                        "now": now,
+                    })
+                    for ingredient in record.get("ingredients") or []:
+                        if ingredient["name"] not in known_ingredients:
+                            raise ValueError(f"Unknown ingredient '{ingredient['name']}' in '{record['name']}'")
+                        recipe_lines.append({
+                            "product": record["name"],
+                            "ingredient": ingredient["name"],
+                            "amount": ingredient["amount"],
+                            "now": now,
+                        })
+
+            cur.executemany(UPSERT_INGREDIENT, ingredients)
+            cur.executemany(UPSERT_PRODUCT, products)
+            cur.executemany(DELETE_REMOVED_INGREDIENTS,
+                            [{"product": p["name"], "ingredients": p["ingredients"]} for p in products])
+            cur.executemany(UPSERT_PRODUCT_INGREDIENT, recipe_lines)
+
+            stats["ingredients"] += len(ingredients)
+            stats["products"] += len(products)
+
+        stats["changes"] = cur.connection.total_changes - changes_before
+        return stats
+
+    return db.transaction(run)
+
+
+def export_catalog(db: Database):
+    """Stream the catalog as records in the `import_catalog` format.
+
+    Args:
+        db (Database): Database connection manager.
+
+    Yields:
+        dict: Ingredient records, then product records.
+    """
+
+    with db.read() as conn:
+        for row in conn.execute("SELECT name, inStock, isTopping FROM Ingredient ORDER BY id"):
+            yield {"type": "ingredient", "name": row["name"], "in_stock": row["inStock"],
+                   "is_topping": bool(row["isTopping"])}
+
+        for row in conn.execute("""
+            SELECT
+                p.name, p.price, p.description,
+                (
+                    SELECT json_group_array(json_object('name', i.name, 'amount', pi.amount))
+                    FROM ProductIngredient pi
+                    JOIN Ingredient i ON
+                        i.id = pi.ingredientId
+                    WHERE pi.productId = p.id
+                ) AS ingredients
+            FROM Product p
+            ORDER BY p.id
+        """):
+            yield {"type": "product", "name": row["name"], "price": row["price"],
+                   "description": row["description"], "ingredients": json.loads(row["ingredients"])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import or export the product catalog.")
+    parser.add_argument('command', choices=['import', 'export'])
+    parser.add_argument('file', help="Catalog file, - for stdin/stdout")
+    parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension")
+    parser.add_argument('--database', default='database.db')
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.file.endswith(".csv") else "jsonl")
+    reader, writer = FORMATS[fmt]
+    db = open_database(args.database)
+
+    try:
+        if args.command == 'import':
+            f = sys.stdin if args.file == '-' else open(args.file, newline='', encoding='utf-8')
+            with f:
+                try:
+                    stats = import_catalog(db, reader(f))
+                except ValueError as e:
+                    parser.exit(1, f"Import failed, nothing was written: {e}\n")
+            print(f"Imported {stats['ingredients']} ingredients and {stats['products']} products "
+                  f"({stats['changes']} rows changed)", file=sys.stderr)
+        else:
+            f = sys.stdout if args.file == '-' else open(args.file, 'w', newline='', encoding='utf-8')
+            with f:
+                writer(f, export_catalog(db))
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
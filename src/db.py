@@ -0,0 +1,141 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import metrics
+from helpers import run_transaction
+
+
+class Database:
+    """Connection manager for the SQLite database.
+
+    The database runs in WAL mode, so readers and the writer don't block each
+    other. Reads (catalog, history, ...) use read-only connections from a pool,
+    while every write goes through a single writer connection.
+    """
+
+    def __init__(self, path: str = 'database.db', readers: int = 4, busy_timeout: int = 5000,
+                 mmap_size: int = 256 * 1024 * 1024, cache_size: int = -16000, cached_statements: int = 256):
+        """Open the writer connection and prepare the reader pool.
+
+        Args:
+            path (str, optional): Path to the database. Defaults to 'database.db'.
+            readers (int, optional): Max number of read-only connections. Defaults to 4.
+            busy_timeout (int, optional): Milliseconds to wait for a lock. Defaults to 5000.
+            mmap_size (int, optional): Bytes of the database to memory map. Defaults to 256 MiB.
+            cache_size (int, optional): Page cache size, negative values are KiB. Defaults to -16000.
+            cached_statements (int, optional): Prepared statements cached per connection. Defaults to 256.
+        """
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.cached_statements = cached_statements
+
+        self._writer = self._connect()
+        self._writer.execute("PRAGMA journal_mode = WAL")
+        self._writer_lock = threading.RLock()
+
+        self._readers = queue.LifoQueue()
+        self._reader_slots = threading.BoundedSemaphore(readers)
+
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        """Open a connection with the tuned pragmas."""
+
+        conn = sqlite3.connect(
+            f"file:{self.path}?mode=ro" if readonly else f"file:{self.path}",
+            uri=True,
+            timeout=self.busy_timeout / 1000,
+            cached_statements=self.cached_statements,
+            # Connections are handed between threads, but only used by one at a time
+            check_same_thread=False,
+            factory=metrics.connection_factory(),
+        )
+        conn.row_factory = sqlite3.Row
+        if metrics.enabled:
+            conn.set_trace_callback(metrics.trace)
+
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        return conn
+
+    @contextmanager
+    def read(self):
+        """Borrow a read-only connection from the pool.
+
+        Yields:
+            sqlite3.Connection: Read-only connection.
+        """
+
+        with self._reader_slots:
+            try:
+                conn = self._readers.get_nowait()
+            except queue.Empty:
+                conn = self._connect(readonly=True)
+
+            try:
+                yield conn
+            finally:
+                self._readers.put(conn)
+
+    @contextmanager
+    def _locked_writer(self):
+        """Hold the writer lock, timing the wait when instrumented."""
+
+        with metrics.timer('fastpizza_db_lock_wait_seconds', lock='writer'):
+            self._writer_lock.acquire()
+        try:
+            yield
+        finally:
+            self._writer_lock.release()
+
+    @contextmanager
+    def write(self):
+        """Use the writer connection, committing when done.
+
+        Changes are rolled back if an exception is raised.
+
+        Yields:
+            sqlite3.Connection: Writer connection.
+        """
+
+        with self._locked_writer():
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+
+    def transaction(self, fn, attempts: int = 5):
+        """Run `fn(cur)` in a `BEGIN IMMEDIATE` transaction on the writer.
+
+        See `helpers.run_transaction`.
+
+        Args:
+            fn (callable): Function doing the work, called with a cursor.
+            attempts (int, optional): Number of tries if the database is busy. Defaults to 5.
+
+        Returns:
+            Whatever `fn` returns.
+        """
+
+        with self._locked_writer():
+            return run_transaction(self._writer, fn, attempts)
+
+    def close(self) -> None:
+        """Close all connections."""
+
+        with self._writer_lock:
+            # Refresh the planner statistics of tables that have grown a lot
+            self._writer.execute("PRAGMA optimize")
+            self._writer.close()
+
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,191 @@
+import queue
+import sqlite3
+import threading
+from typing import NamedTuple
+
+import metrics
+from db import Database
+
+# Events a subscriber may have waiting before it is dropped
+QUEUE_SIZE = 100
+# Seconds between looks for new events
+POLL_INTERVAL = 0.2
+# Max number of events read per look
+BATCH_SIZE = 500
+
+
+class StatusEvent(NamedTuple):
+    """A change of an order's status."""
+    id: int
+    orderId: int
+    userId: int
+    status: int
+    createdAt: str
+
+
+class SubscriberDropped(Exception):
+    """Raised to a subscriber that fell too far behind and was dropped."""
+
+
+class Subscription:
+    """Status events for one subscriber, in a bounded queue.
+
+    Use as a context manager, or `close` it when done.
+    """
+
+    def __init__(self, bus: 'StatusBus', user_id: int, size: int):
+        self.bus = bus
+        self.user_id = user_id
+        self.dropped = False
+        self._events = queue.Queue(size)
+
+    def get(self, timeout: float = None) -> StatusEvent:
+        """Wait for the next event.
+
+        Args:
+            timeout (float, optional): Seconds to wait. Defaults to waiting forever.
+
+        Raises:
+            SubscriberDropped: When the subscriber was dropped and has no events left.
+
+        Returns:
+            StatusEvent: The event, or None on timeout.
+        """
+
+        try:
+            return self._events.get_nowait()
+        except queue.Empty:
+            if self.dropped:
+                raise SubscriberDropped
+        try:
+            return self._events.get(timeout=timeout if timeout is None else max(timeout, 0))
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        self.bus.unsubscribe(self)
+
+    def __enter__(self) -> 'Subscription':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StatusBus:
+    """Fans order status changes out to subscribers in this process.
+
+    One thread tails the OrderStatusEvent table, which triggers fill in the
+    same transaction as every status change, no matter which process made
+    it. A `PRAGMA data_version` check tells whether anything was committed
+    since the last look, so an idle bus runs no queries, and subscribers
+    never query the database at all. A subscriber whose queue is full is
+    dropped instead of buffering without limit.
+    """
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.published = 0
+        self.dropped = 0
+
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._db = None
+        self._stop = None
+        self._thread = None
+
+    def subscribe(self, db: Database, user_id: int = None, size: int = QUEUE_SIZE) -> Subscription:
+        """Subscribe to status changes, starting the bus if needed.
+
+        Subscribe before reading the current status, so no change is missed.
+
+        Args:
+            db (Database): Database connection manager.
+            user_id (int, optional): Only changes of this user's orders. Defaults to all orders.
+            size (int, optional): Events that may wait before the subscriber is dropped. Defaults to `QUEUE_SIZE`.
+
+        Returns:
+            Subscription: The subscription.
+        """
+
+        subscription = Subscription(self, user_id, size)
+        with self._lock:
+            if self._db is not db:
+                self._start(db)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event: StatusEvent) -> None:
+        """Hand an event to every subscriber interested in it."""
+
+        if metrics.enabled:
+            metrics.increment('fastpizza_status_events_total')
+
+        with self._lock:
+            self.published += 1
+            for subscription in list(self._subscribers):
+                if subscription.user_id is not None and subscription.user_id != event.userId:
+                    continue
+                try:
+                    subscription._events.put_nowait(event)
+                except queue.Full:
+                    subscription.dropped = True
+                    self._subscribers.discard(subscription)
+                    self.dropped += 1
+                    if metrics.enabled:
+                        metrics.increment('fastpizza_status_subscribers_dropped_total')
+
+    def _start(self, db: Database) -> None:
+        """Tail the events of a database, instead of the one tailed so far."""
+
+        if self._stop:
+            self._stop.set()
+
+        with db.read() as conn:
+            last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM OrderStatusEvent").fetchone()[0]
+
+        self._db = db
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(db, last_id, self._stop),
+                                        name='status-bus', daemon=True)
+        self._thread.start()
+
+    def _run(self, db: Database, last_id: int, stop: threading.Event) -> None:
+        # Last seen (data_version, total_changes) per connection
+        seen = {}
+
+        while not stop.wait(self.poll_interval):
+            try:
+                with db.read() as conn:
+                    key = (conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+                    if seen.get(id(conn)) == key:
+                        continue
+                    seen[id(conn)] = key
+
+                    events = [StatusEvent(*row) for row in conn.execute("""
+                        SELECT id, orderId, userId, status, createdAt
+                        FROM OrderStatusEvent
+                        WHERE id > ?
+                        ORDER BY id
+                        LIMIT ?
+                    """, (last_id, BATCH_SIZE))]
+            except sqlite3.Error:
+                # Try again on the next look
+                seen.clear()
+                continue
+
+            if len(events) == BATCH_SIZE:
+                # There are more events, so don't skip the next look
+                seen.clear()
+
+            for event in events:
+                self.publish(event)
+                last_id = event.id
+
+
+# Shared by all sessions in this process
+bus = StatusBus()
@@ -1,14 +1,19 @@
-import sqlite3
+from db import Database
+from helpers import LOGOUT, output, prompt_for_bool, prompt_for_string, prompt_from_list
+from passwords import PasswordBusy, hash_password
+from repository import User, delete_user, update_user_name, update_user_password
+from users import users
 
-import bcrypt
-from helpers import LOGOUT, prompt_for_bool, prompt_for_string, prompt_from_list
 
-
-def change_password_flow(user: dict, conn: sqlite3.Connection) -> None:
+def change_password_flow(user: User, db: Database) -> User:
     """Change password flow.
 
     Args:
-        user (dict): User data.
+        user (User): Logged in user.
+        db (Database): Database connection manager.
+
+    Returns:
+        User: The user, updated.
     """
 
     password = ""
@@ -16,51 +21,66 @@ def change_password_flow(user: dict, conn: sqlite3.Connection) -> None:
         password = prompt_for_string("Please enter your new password:")
         if len(password) >= 8:
             break
-        print("Password must be at least 8 characters long.")
+        output("Password must be at least 8 characters long.")
 
     repeat_password = ""
     while True:
         repeat_password = prompt_for_string("Repeat Password:")
         if len(repeat_password) < 8:
-            print("Password must be at least 8 characters long.")
+            output("Password must be at least 8 characters long.")
             continue
         if repeat_password != password:
-            print("Passwords do not match. Password has not been changed.")
-            return change_password_flow(user, conn)
+            output("Passwords do not match. Password has not been changed.")
+            return change_password_flow(user, db)
 
         break
 
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    try:
+        hashed_password = hash_password(password)
+    except PasswordBusy:
+        output("The system is busy right now. Password has not been changed.")
+        return user
 
-    cur = conn.cursor()
-    cur.execute("UPDATE User SET password = ? WHERE id = ?",
-                (hashed_password, user["id"]))
-    conn.commit()
+    with db.write() as conn:
+        user = update_user_password(conn, user.id, hashed_password)
+    if not user:
+        # Deleted in another session
+        raise LOGOUT
+    users.put(user)
 
-    print("Password changed successfully!")
+    output("Password changed successfully!")
+    return user
 
-def change_name_flow(user: dict, conn: sqlite3.Connection) -> None:
+def change_name_flow(user: User, db: Database) -> User:
     """Change name flow.
 
     Args:
-        user (dict): User data.
+        user (User): Logged in user.
+        db (Database): Database connection manager.
+
+    Returns:
+        User: The user, updated.
     """
 
     first_name = prompt_for_string("New first name:")
     last_name = prompt_for_string("New last name:")
 
-    cur = conn.cursor()
-    cur.execute("UPDATE User SET firstName = ?, lastName = ? WHERE id = ?",
-                (first_name, last_name, user["id"]))
-    conn.commit()
+    with db.write() as conn:
+        user = update_user_name(conn, user.id, first_name, last_name)
+    if not user:
+        # Deleted in another session
+        raise LOGOUT
+    users.put(user)
 
-    print("Name changed successfully! Please log in again to see the changes.")
+    output("Name changed successfully!")
+    return user
 
-def account_flow(user: dict, conn: sqlite3.Connection) -> None:
+def account_flow(user: User, db: Database) -> None:
     """Account flow.
 
     Args:
-        user (dict): User data.
+        user (User): Logged in user.
+        db (Database): Database connection manager.
     """
 
     while True:
@@ -69,17 +89,18 @@ def account_flow(user: dict, conn: sqlite3.Connection) -> None:
             'Change my name',
             'Delete my account',
             'Go back',
-        ], f"{user['firstName']} {user['lastName']}'s account"):
+        ], f"{user.firstName} {user.lastName}'s account"):
             case 0:
-                change_password_flow(user, conn)
+                user = change_password_flow(user, db)
             case 1:
-                change_name_flow(user, conn)
+                user = change_name_flow(user, db)
             case 2:
                 # Delete account
                 if prompt_for_bool("Are you sure you want to delete your account?", False):
-                    c = conn.cursor()
-                    c.execute("DELETE FROM User WHERE id = ?", (user["id"],))
-                    conn.commit()
+                    with db.write() as conn:
+                        delete_user(conn, user.id)
+                    # Logs out the other sessions of the user as well
+                    users.remove(user.id)
                     raise LOGOUT
             case 3:
                 return
@@ -0,0 +1,40 @@
+from db import Database
+from helpers import output, prompt_for_bool, prompt_from_list, read_input
+from kitchen import format_kitchen_stats, get_kitchen_stats
+from reports import PERIODS, format_report, rebuild_rollups
+from repository import User
+
+
+def admin_flow(user: User, db: Database) -> None:
+    """Admin flow: sales reports, restock planning and the kitchen queue.
+
+    Args:
+        user (User): Logged in user.
+        db (Database): Database connection manager.
+    """
+
+    while True:
+        p = prompt_from_list([
+            *(f"Sales per {period}" for period in PERIODS),
+            'Restock plan',
+            'Kitchen',
+            'Rebuild sales reports',
+            'Go back'
+        ], "Admin")
+
+        if p < len(PERIODS):
+            output(f"\n{format_report(db, PERIODS[p])}")
+            read_input("\nPress enter to go back.")
+        elif p == len(PERIODS):
+            # Pulls in numpy, which only admins need
+            from forecast import format_plan, restock_plan
+            output(f"\n{format_plan(restock_plan(db))}")
+            read_input("\nPress enter to go back.")
+        elif p == len(PERIODS) + 1:
+            output(f"\n{format_kitchen_stats(get_kitchen_stats(db))}")
+            read_input("\nPress enter to go back.")
+        elif p == len(PERIODS) + 2:
+            if prompt_for_bool("Recompute all reports from the orders? This can take a while.", False):
+                output(f"Rebuilt sales reports ({rebuild_rollups(db)} rows).")
+        else:
+            return
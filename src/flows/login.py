@@ -1,29 +1,114 @@
 
-from datetime import datetime
 import re
 import sqlite3
 
-import bcrypt
-from helpers import get_user_by_email, prompt_for_bool, prompt_for_string, prompt_from_list
+from db import Database
+from helpers import output, prompt_for_bool, prompt_for_string, prompt_from_list
+from passwords import PasswordBusy, RateLimited, check_password, hash_password, needs_rehash
+from repository import User, get_user_by_email, insert_user, update_user_password
 
 
-def login_flow(conn: sqlite3.Connection) -> dict:
+EMAIL_PATTERN = re.compile(r"[^@]+@[^@]+\.[^@]+")
+
+
+def authenticate(db: Database, email: str, password: str, source: str = None) -> User:
+    """Check a user's email and password.
+
+    Hashes made with an older work factor are upgraded on success.
+
+    Args:
+        db (Database): Database connection manager.
+        email (str): Email of the user.
+        password (str): Plain text password.
+        source (str, optional): Who is logging in, used for rate limiting. Defaults to the email.
+
+    Raises:
+        RateLimited: If there have been too many attempts from the source.
+        PasswordBusy: If the system is too busy to check the password.
+
+    Returns:
+        User: The user, or None if the email or password is wrong.
+    """
+
+    with db.read() as conn:
+        user = get_user_by_email(conn, email)
+
+    if not user:
+        return None
+
+    if not check_password(password, user.password, source=source or email):
+        return None
+
+    # Upgrade hashes made with an older work factor, no harm if it has to wait
+    if needs_rehash(user.password):
+        try:
+            hashed_password = hash_password(password)
+        except PasswordBusy:
+            hashed_password = None
+
+        if hashed_password:
+            with db.write() as conn:
+                user = update_user_password(conn, user.id, hashed_password) or user
+
+    return user
+
+
+def register_user(db: Database, first_name: str, last_name: str, email: str, password: str,
+                  is_admin: bool = False) -> User:
+    """Create a new user.
+
+    Args:
+        db (Database): Database connection manager.
+        first_name (str): First name.
+        last_name (str): Last name.
+        email (str): Email, must be unique.
+        password (str): Plain text password, at least 8 characters.
+        is_admin (bool, optional): Create the user as admin. Defaults to False.
+
+    Raises:
+        ValueError: If the email or password is invalid.
+        PasswordBusy: If the system is too busy to hash the password.
+
+    Returns:
+        User: The new user, or None if a user with the email already exists.
+    """
+
+    if not EMAIL_PATTERN.match(email):
+        raise ValueError("Invalid email.")
+    if len(password) < 8:
+        raise ValueError("Password must be at least 8 characters long.")
+
+    hashed_password = hash_password(password)
+
+    try:
+        with db.write() as conn:
+            return insert_user(conn, email, hashed_password, first_name, last_name, is_admin)
+    except sqlite3.IntegrityError:
+        # Unique email
+        return None
+
+
+def login_flow(db: Database, peer: str = None) -> User:
     """Login flow for the user.
 
+    Args:
+        db (Database): Database connection manager.
+        peer (str, optional): Address of the client, failed logins are rate limited by it.
+
     Returns:
-        dict: User data.
+        User: The logged in user.
     """
-    print('Welcome to the Pizza Ordering System!')
+    output('Welcome to the Pizza Ordering System!')
 
     if prompt_from_list(['Yes', 'No'], 'Do you already have an account?') == 0:
         # Login
         email = ""
         while True:
             email = prompt_for_string("Please enter your email:")
-            if re.match(r"[^@]+@[^@]+\.[^@]+", email):
+            if EMAIL_PATTERN.match(email):
                 break
 
-            print("Invalid email. Please try again.")
+            output("Invalid email. Please try again.")
 
         password = ""
         while True:
@@ -31,21 +116,23 @@ def login_flow(conn: sqlite3.Connection) -> dict:
             if len(password) >= 8:
                 break
 
-            print("Password must be at least 8 characters long.")
+            output("Password must be at least 8 characters long.")
 
-        # Check if the user exists
-        user = get_user_by_email(conn, email)
+        # Check if the user exists and the password is correct
+        try:
+            user = authenticate(db, email, password, source=peer)
+        except RateLimited:
+            output("Too many login attempts. Please wait a minute and try again!")
+            return login_flow(db, peer)
+        except PasswordBusy:
+            output("The system is busy right now. Please try again!")
+            return login_flow(db, peer)
 
         if not user:
-            print("User does not exist. Try again!")
-            return login_flow(conn)
-
-        # Check if the password is correct
-        if not bcrypt.checkpw(password.encode('utf-8'), user["password"].encode('utf-8')):
-            print("Incorrect password. Try again!")
-            return login_flow(conn)
+            output("Incorrect email or password. Try again!")
+            return login_flow(db, peer)
 
-        print("Login successful!")
+        output("Login successful!")
         return user
 
     else:
@@ -56,15 +143,17 @@ def login_flow(conn: sqlite3.Connection) -> dict:
         email = ""
         while True:
             email = prompt_for_string("Email:")
-            if re.match(r"[^@]+@[^@]+\.[^@]+", email):
+            if EMAIL_PATTERN.match(email):
                 break
 
-            print("Invalid email. Please try again.")
+            output("Invalid email. Please try again.")
 
         # Check if the user already exists
-        if get_user_by_email(conn, email):
-            print("A user with this email already exists! Try again.")
-            return login_flow(conn)
+        with db.read() as conn:
+            exists = get_user_by_email(conn, email)
+        if exists:
+            output("A user with this email already exists! Try again.")
+            return login_flow(db, peer)
 
         password = ""
         while True:
@@ -72,30 +161,32 @@ def login_flow(conn: sqlite3.Connection) -> dict:
             if len(password) >= 8:
                 break
 
-            print("Password must be at least 8 characters long.")
+            output("Password must be at least 8 characters long.")
 
         repeat_password = ""
         while True:
             repeat_password = prompt_for_string("Repeat password:")
             if len(repeat_password) < 8:
-                print("Password must be at least 8 characters long.")
+                output("Password must be at least 8 characters long.")
                 continue
             if repeat_password != password:
-                print("Passwords do not match. Try again.")
-                return login_flow(conn)
+                output("Passwords do not match. Try again.")
+                return login_flow(db, peer)
 
             break
 
         is_admin = prompt_for_bool('!TEST! Create user as admin?')
 
         # Create the user
-        hashed_password = bcrypt.hashpw(
-            password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        try:
+            user = register_user(db, first_name, last_name, email, password, is_admin)
+        except PasswordBusy:
+            output("The system is busy right now. Please try again!")
+            return login_flow(db, peer)
 
-        c = conn.cursor()
-        c.execute("INSERT INTO User (email, password, firstName, lastName, isAdmin, updatedAt) VALUES (?, ?, ?, ?, ?, ?)",
-                  (email, hashed_password, first_name, last_name, is_admin, datetime.now()))
-        conn.commit()
+        if not user:
+            output("A user with this email already exists! Try again.")
+            return login_flow(db, peer)
 
-        print("Registration successful!")
-        return get_user_by_email(conn, email)
+        output("Registration successful!")
+        return user
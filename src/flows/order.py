@@ -1,13 +1,27 @@
 from datetime import datetime
 import sqlite3
 
-from helpers import prompt_for_bool, prompt_for_string, prompt_from_list
-
-
-def order_flow(user: dict, conn: sqlite3.Connection) -> None:
+from catalog import catalog, search_products
+from db import Database
+from flows.orders import track_order_flow
+from helpers import OutOfStock, output, prompt_for_bool, prompt_for_string, prompt_from_list, read_input
+from holds import check_amount_change, hold_expiry, hold_stock, take_stock
+from receipts import snapshot_receipt
+from repository import (User, delete_open_order_items, delete_order_item, get_open_order, get_open_order_id,
+                        get_open_order_item_order_id, get_placeable_order_id, insert_order, insert_order_item,
+                        touch_order, update_open_order_item_comment, update_order_item_amount,
+                        update_order_placed)
+
+# Products and toppings shown per page
+MENU_PAGE_SIZE = 10
+TOPPING_PAGE_SIZE = 20
+
+
+def order_flow(user: User, db: Database) -> None:
     """Order flow.
     Args:
-        user (dict): User data.
+        user (User): Logged in user.
+        db (Database): Database connection manager.
     """
 
     while True:
@@ -17,312 +31,409 @@ def order_flow(user: dict, conn: sqlite3.Connection) -> None:
             'Modify order',
             'Clear order items',
             'Go back'
-        ], f"{user['firstName']} {user['lastName']}'s orders"):
+        ], f"{user.firstName} {user.lastName}'s orders"):
             case 0:
-                order_pizza_flow(user, conn)
+                order_pizza_flow(user, db)
             case 1:
-                if place_order_flow(user, conn):
+                if place_order_flow(user, db):
                     return
             case 2:
-                modify_order_flow(user, conn)
+                modify_order_flow(user, db)
             case 3:
-                clear_order_flow(user, conn)
+                clear_order_flow(user, db)
             case 4:
                 return
 
 
-def get_open_order_items(conn: sqlite3.Connection, user_id: int) -> list:
-    """Get open order
+def _get_or_create_open_order(cur: sqlite3.Cursor, user_id: int) -> int:
+    """Get the id of the user's open order, creating it if needed.
+
+    Must run in a write transaction, so two sessions can't both create one.
+    """
+
+    if (order_id := get_open_order_id(cur, user_id)) is not None:
+        return order_id
+
+    # If no order exists, create one
+    return insert_order(cur, user_id)
+
+
+def add_order_item(db: Database, user_id: int, product_id: int, amount: int,
+                   toppings: list = (), comment: str = None) -> int:
+    """Add a product with extra toppings to the user's open order.
+
+    Stock for the recipe and the toppings is held in the same transaction,
+    and the holds of the whole cart are extended.
 
     Args:
-        conn (sqlite3.Connection): Database connection.
+        db (Database): Database connection manager.
         user_id (int): User id.
+        product_id (int): Product id.
+        amount (int): Number of products.
+        toppings (list, optional): Extra toppings, dicts with `ingredientId` and `amount`. The
+            amounts of a topping given more than once are added up.
+        comment (str, optional): Comment for the kitchen.
+
+    Raises:
+        ValueError: If the product, a topping or an amount is invalid.
+        OutOfStock: If there is not enough of an ingredient in stock.
 
     Returns:
-        list: Orders.
+        int: Id of the new order item.
     """
 
-    cur = conn.cursor()
-    # Get order item info with product info for open order
-    cur.execute("""
-        SELECT
-            oi.amount, oi.comment, p.name, p.price, o.id as orderId, oi.id as orderItemId
-        FROM `Order` o
-        JOIN OrderItem oi ON
-            o.id = oi.orderId
-        JOIN Product p ON
-            oi.productId = p.id
-        WHERE o.userId = ?
-              AND o.status = 0
-    """, (user_id,))
+    with db.read() as conn:
+        menu = catalog.refresh(conn)
+
+    if product_id not in menu.recipes:
+        raise ValueError("Unknown product!")
+    if amount < 1:
+        raise ValueError("Invalid amount!")
+
+    topping_ids = {t.id for t in menu.toppings}
+    # The same topping twice is one topping with the amounts added up
+    amounts = {}
+    for topping in toppings:
+        if topping["ingredientId"] not in topping_ids:
+            raise ValueError("Unknown topping!")
+        if topping["amount"] < 1:
+            raise ValueError("Invalid amount!")
+        amounts[topping["ingredientId"]] = amounts.get(topping["ingredientId"], 0) + topping["amount"]
+        if amounts[topping["ingredientId"]] > 10:
+            raise ValueError("You can't have more than 10 of each topping!")
+    toppings = [{"ingredientId": i, "amount": a} for i, a in amounts.items()]
+
+    # Ingredients used by the recipe and the extra toppings
+    usage = {}
+    for ingredient in menu.recipes[product_id]:
+        usage[ingredient["id"]] = amount * ingredient["amount"]
+    for topping in toppings:
+        usage[topping["ingredientId"]] = usage.get(
+            topping["ingredientId"], 0) + amount * topping["amount"]
+
+    def add(cur: sqlite3.Cursor) -> int:
+        order_id = _get_or_create_open_order(cur, user_id)
+
+        # Update order
+        now = datetime.now()
+        touch_order(cur, order_id, now, hold_expiry(now))
+        # Add order item and its toppings to database
+        order_item_id = insert_order_item(cur, order_id, product_id, amount, comment, toppings)
+        # Hold the stock, nothing is written if anything is short
+        hold_stock(cur, order_id, order_item_id, usage)
+        return order_item_id
 
-    return cur.fetchall()
+    return db.transaction(add)
 
 
-def get_order_item_toppings(conn: sqlite3.Connection, order_item_id: int) -> list:
-    """Get an order item's toppings.
+def remove_order_item(db: Database, user_id: int, order_item_id: int) -> bool:
+    """Remove an item from the user's open order.
 
     Args:
-        conn (sqlite3.Connection): Database connection.
+        db (Database): Database connection manager.
+        user_id (int): User id.
         order_item_id (int): Order item id.
 
     Returns:
-        list: Order item ingredients.
+        bool: False if the item is not in the user's open order.
     """
 
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT
-            i.name,
-            t.amount
-        FROM IngredientOrderItemTopping t
-        JOIN Ingredient i ON
-            t.ingredientId = i.id
-        WHERE t.orderItemId = ?
-    """, (order_item_id,))
+    def remove(cur: sqlite3.Cursor) -> bool:
+        if get_open_order_item_order_id(cur, user_id, order_item_id) is None:
+            return False
 
-    return cur.fetchall()
+        delete_order_item(cur, order_item_id)
+        return True
 
+    return db.transaction(remove)
 
-def order_pizza_flow(user: dict, conn: sqlite3.Connection) -> None:
-    """Order pizza flow."""
 
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT * FROM `Order`
-        WHERE userId = ? 
-              AND status = 0
-    """, (user["id"],))
+def set_order_item_amount(db: Database, user_id: int, order_item_id: int, amount: int) -> bool:
+    """Change the amount of an item in the user's open order.
 
-    # Get open order
-    if not (order := cur.fetchone()):
-        # If no order exists, create one
-        cur.execute("""
-            INSERT INTO `Order`
-                (userId, status, updatedAt)
-            VALUES
-                (?, 0, ?)
-        """, (user["id"], datetime.now()))
-        conn.commit()
-        cur.execute("""
-            SELECT * FROM `Order`
-            WHERE userId = ?
-                  AND status = 0
-        """, (user["id"],))
-        order = cur.fetchone()
-
-    # Get products
-    cur.execute("SELECT * FROM Product")
-    products = cur.fetchall()
+    Args:
+        db (Database): Database connection manager.
+        user_id (int): User id.
+        order_item_id (int): Order item id.
+        amount (int): New amount.
+
+    Raises:
+        ValueError: If the amount is invalid.
+        OutOfStock: If there is not enough of an ingredient for a larger amount.
+
+    Returns:
+        bool: False if the item is not in the user's open order.
+    """
+
+    if amount < 1:
+        raise ValueError("Invalid amount!")
+
+    def update(cur: sqlite3.Cursor) -> bool:
+        if (order_id := get_open_order_item_order_id(cur, user_id, order_item_id)) is None:
+            return False
+
+        # The item's holds are scaled by a trigger, check that they can grow first
+        check_amount_change(cur, order_item_id, amount)
+
+        now = datetime.now()
+        update_order_item_amount(cur, order_item_id, amount, now)
+        touch_order(cur, order_id, now, hold_expiry(now))
+        return True
+
+    return db.transaction(update)
+
+
+def set_order_item_comment(db: Database, user_id: int, order_item_id: int, comment: str) -> bool:
+    """Change the comment of an item in the user's open order.
+
+    Args:
+        db (Database): Database connection manager.
+        user_id (int): User id.
+        order_item_id (int): Order item id.
+        comment (str): New comment, None for no comment.
+
+    Returns:
+        bool: False if the item is not in the user's open order.
+    """
+
+    with db.write() as conn:
+        return update_open_order_item_comment(conn, user_id, order_item_id, comment)
+
+
+def clear_order(db: Database, user_id: int) -> int:
+    """Remove all items from the user's open order.
+
+    Args:
+        db (Database): Database connection manager.
+        user_id (int): User id.
+
+    Returns:
+        int: Number of items removed.
+    """
+
+    return db.transaction(lambda cur: delete_open_order_items(cur, user_id))
+
+
+def place_order(db: Database, user_id: int) -> int:
+    """Place the user's open order.
+
+    Args:
+        db (Database): Database connection manager.
+        user_id (int): User id.
+
+    Raises:
+        OutOfStock: If there is not enough of an ingredient, e.g. after the cart's holds expired.
+
+    Returns:
+        int: Id of the placed order, or None if there is nothing to place.
+    """
+
+    def place(cur: sqlite3.Cursor) -> int:
+        if (order_id := get_placeable_order_id(cur, user_id)) is None:
+            return None
+
+        # Turn the holds into stock taken
+        take_stock(cur, order_id)
+
+        now = datetime.now()
+        update_order_placed(cur, order_id, now)
+        snapshot_receipt(cur, order_id, now)
+        return order_id
+
+    return db.transaction(place)
+
+
+def order_pizza_flow(user: User, db: Database) -> None:
+    """Order pizza flow."""
 
     # Product selection
     while True:
+        # Get products
+        with db.read() as conn:
+            menu = catalog.refresh(conn)
+        products = menu.products
+
+        def search(text: str) -> list:
+            with db.read() as conn:
+                product_ids = search_products(conn, text)
+            index = {p.id: i for i, p in enumerate(products)}
+            return [index[i] for i in product_ids if i in index]
+
         choice = prompt_from_list(
-            [*list(
-                map(lambda p: f"{p['price']} kr - {p['name']}\n - {p['description']}", products)
-            ), "Cancel"],
-            "Select a pizza:"
+            [*menu.product_labels, "Cancel"],
+            "Select a pizza:",
+            page_size=MENU_PAGE_SIZE, pinned=1, search=search
         )
 
         # Check if user wants to cancel
         if choice == len(products):
             return
 
+        # Precomputed from the stock, so nothing is written for a sold out pizza
+        max_amount = menu.max_buildable.get(products[choice].id)
+        if max_amount == 0:
+            output(f"Sorry, {products[choice].name} is sold out!")
+            continue
+
         # Get product amount
         product_amount = prompt_for_string(
-            f"How many '{products[choice]['name']}' do you want?", "1")
+            f"How many '{products[choice].name}' do you want?"
+            + (f" (max {max_amount})" if max_amount is not None else ""), "1")
         try:
             product_amount = int(product_amount)
         except ValueError:
-            print("Invalid amount!")
+            output("Invalid amount!")
+            continue
+
+        if max_amount is not None and product_amount > max_amount:
+            output(f"Only enough in stock for {max_amount} '{products[choice].name}'!")
             continue
 
         # Add toppings
         selected_toppings = []
         if prompt_for_bool("Do you want to add any toppings?", False):
-            cur.execute("SELECT * FROM Ingredient WHERE isTopping = 1")
-            available_toppings = cur.fetchall()
-
             while True:
+                with db.read() as conn:
+                    topping_menu = catalog.refresh(conn)
+                available_toppings = topping_menu.toppings
+
                 topping = prompt_from_list(
-                    [*list(
-                        map(lambda i: f"{i['name']}", available_toppings)
-                    ), "Done"],
-                    "Select a topping:"
+                    [*topping_menu.topping_labels, "Done"],
+                    "Select a topping:",
+                    page_size=TOPPING_PAGE_SIZE, pinned=1,
+                    # A handful of names, no need for the index
+                    search=lambda text: [i for i, t in enumerate(available_toppings)
+                                         if text.lower() in t.name.lower()]
                 )
 
                 if topping == len(available_toppings):
                     break
 
                 topping_amount = prompt_for_string(
-                    f"How many '{available_toppings[topping]['name']}' do you want?", "1")
+                    f"How many '{available_toppings[topping].name}' do you want?", "1")
                 try:
                     topping_amount = int(topping_amount)
                 except ValueError:
-                    print("Invalid amount!")
+                    output("Invalid amount!")
                     continue
 
-                if topping_amount * product_amount > available_toppings[topping]["inStock"]:
-                    print(
-                        f"Not enough {available_toppings[topping]['name']} in stock! ({available_toppings[topping]['inStock']} left)")
+                available = topping_menu.available.get(available_toppings[topping].id, 0)
+                if topping_amount * product_amount > available:
+                    output(f"Not enough {available_toppings[topping].name} in stock! ({max(available, 0)} left)")
                     continue
                 elif topping_amount > 10:
-                    print("You can't have more than 10 of each topping!")
+                    output("You can't have more than 10 of each topping!")
                     continue
 
                 selected_toppings.append({
-                    "ingredientId": available_toppings[topping]["id"],
+                    "ingredientId": available_toppings[topping].id,
                     "amount": topping_amount
                 })
 
-                print(
-                    f"Added {topping_amount}x {available_toppings[topping]['name']} to your {products[choice]['name']}")
-
-        cur.execute("""
-            SELECT
-                i.id, i.name, i.inStock, pi.amount
-            FROM Ingredient i INNER JOIN ProductIngredient pi ON
-                i.id = pi.ingredientId
-            WHERE i.id IN (
-                SELECT
-                    pi.ingredientId
-                FROM Product p JOIN ProductIngredient pi ON
-                    pi.productId = p.id
-                WHERE p.id = ?
-            )
-        """, (products[choice]["id"],))
-        ingredients = cur.fetchall()
-
-        # Check if there are enough ingredients in stock, and update stock
-        for ingredient in ingredients:
-            used_amount = product_amount * ingredient["amount"]
-            for extra_topping in selected_toppings:
-                if extra_topping["ingredientId"] == ingredient["id"]:
-                    used_amount += extra_topping["amount"]
-
-            if ingredient["inStock"] < used_amount:
-                print(f"Not enough {ingredient['name']} in stock!")
-                return
-
-            cur.execute("""
-                UPDATE Ingredient
-                SET inStock = inStock - ?
-                WHERE id = ?
-            """, (used_amount, ingredient["id"]))
+                output(
+                    f"Added {topping_amount}x {available_toppings[topping].name} to your {products[choice].name}")
 
         # Order Item comment
         comment = prompt_for_string(
             "Do you want to add a comment? (Leave blank for no comment)", None)
 
-        # Update order
-        cur.execute("UPDATE `Order` SET updatedAt = ? WHERE id = ?",
-                    (datetime.now(), order["id"]))
-        # Add order item to database
-        cur.execute("""
-            INSERT INTO OrderItem
-                (orderId, productId, amount, comment, updatedAt)
-            VALUES
-                (?, ?, ?, ?, ?)
-        """, (order["id"], products[choice]["id"], product_amount, comment, datetime.now()))
-        # Add toppings to dabase if any
-        if len(selected_toppings) > 0:
-            # Get order item id
-            cur.execute("SELECT last_insert_rowid() as id")
-            order_item_id = cur.fetchone()["id"]
-            # Add all toppings to the database
-            for topping in selected_toppings:
-                cur.execute("""
-                    INSERT INTO IngredientOrderItemTopping
-                        (orderItemId, ingredientId, amount)
-                    VALUES
-                        (?, ?, ?)
-                """, (order_item_id, topping["ingredientId"], topping["amount"]))
-
-        # Commit transaction
-        conn.commit()
-
-        print("Your order has been updated!")
+        try:
+            add_order_item(db, user.id, products[choice].id, product_amount,
+                           selected_toppings, comment)
+        except OutOfStock as e:
+            output(f"Not enough {e.name} in stock! ({e.in_stock} left)")
+            return
+        except ValueError as e:
+            output(e)
+            continue
+
+        output("Your order has been updated!")
 
         if not prompt_for_bool("Do you want to add another pizza?", False):
             return
 
 
-def place_order_flow(user: dict, conn: sqlite3.Connection) -> None:
+def place_order_flow(user: User, db: Database) -> None:
     """Check order flow."""
 
-    items = get_open_order_items(conn, user['id'])
-
     # Get open order
-    if not items or len(items) == 0:
-        print("You haven't added anything to your order yet!")
+    with db.read() as conn:
+        order = get_open_order(conn, user.id)
+
+    if not order:
+        output("You haven't added anything to your order yet!")
         return
 
-    print("\nYour order:")
-    print("-----------")
-    for i in items:
-        print(f"{i['amount']}x {i['name']} - {i['price']*i['amount']} kr")
-        toppings = get_order_item_toppings(conn, i['orderItemId'])
-        for t in toppings:
-            print(f"   + {t['amount']}x {t['name']}")
-        if i['comment']:
-            print(f"   >>: {i['comment']}")
+    output("\nYour order:")
+    output("-----------")
+    for i in order.items:
+        output(f"{i.amount}x {i.name} - {i.lineTotal} kr")
+        for t in i.toppings:
+            output(f"   + {t.amount}x {t.name}")
+        if i.comment:
+            output(f"   >>: {i.comment}")
 
-    total_price = sum([i['amount'] * i['price'] for i in items])
-    print(f"Total: {total_price} kr")
+    output(f"Total: {order.total} kr")
 
     if prompt_for_bool("Do you want to place your order?", False):
-        cur = conn.cursor()
-        cur.execute("UPDATE `Order` SET status = 1 WHERE userId = ? AND status = 0",
-                    (user["id"],))
-        conn.commit()
-        print("Order placed successfully!")
+        try:
+            order_id = place_order(db, user.id)
+        except OutOfStock as e:
+            output(f"Not enough {e.name} in stock! ({e.in_stock} left, {e.needed} needed)")
+            return
+        if not order_id:
+            output("You haven't added anything to your order yet!")
+            return
+        output("Order placed successfully!")
+        if prompt_for_bool("Do you want to follow your order until it's ready?", False):
+            track_order_flow(user, db, order_id)
         return True
 
 
-def modify_order_flow(user: dict, conn: sqlite3.Connection) -> None:
+def modify_order_flow(user: User, db: Database) -> None:
     """Modify open order"""
 
-    items = get_open_order_items(conn, user['id'])
-
     # Get open order
-    if not items or len(items) == 0:
-        print("You haven't added anything to your order yet!")
+    with db.read() as conn:
+        order = get_open_order(conn, user.id)
+
+    if not order:
+        output("You haven't added anything to your order yet!")
         return
 
-    print("\nWhich item do you want to modify:")
-    print("---------------------------------")
-    toppings = {}
+    items = order.items
+
+    output("\nWhich item do you want to modify:")
+    output("---------------------------------")
     for i, it in enumerate(items):
-        print(f"[{i+1}] {it['amount']}x {it['name']} - {it['price']*it['amount']} kr")
-        toppings[it['orderItemId']] = get_order_item_toppings(
-            conn, it['orderItemId'])
-        for t in toppings[it['orderItemId']]:
-            print(" "*(len(str(i)) + 3) + f"   + {t['amount']}x {t['name']}")
-        if it['comment']:
-            print((" "*(len(str(i)) + 3)) + f"   >>: {it['comment']}")
-    print(f"[{i+2}] Go back")
+        output(f"[{i+1}] {it.amount}x {it.name} - {it.lineTotal} kr")
+        for t in it.toppings:
+            output(" "*(len(str(i)) + 3) + f"   + {t.amount}x {t.name}")
+        if it.comment:
+            output((" "*(len(str(i)) + 3)) + f"   >>: {it.comment}")
+    output(f"[{i+2}] Go back")
 
     try:
-        p = int(input("> ").strip())-1
+        p = int(read_input("> ").strip())-1
     except ValueError:
-        print("Invalid input!")
+        output("Invalid input!")
         return
 
     if p == len(items):
         return
     elif p > len(items) or p < 0:
-        print("Invalid input!")
+        output("Invalid input!")
         return
-    item = dict(items[p])
+    item = items[p]
 
-    item_toppings = toppings[item['orderItemId']]
+    item_toppings = item.toppings
     while True:
         display = f"Modifying:"
-        display += f"\n{item['amount']}x {item['name']} - {item['price']*item['amount']} kr"
+        display += f"\n{item.amount}x {item.name} - {item.price*item.amount} kr"
         for t in item_toppings:
-            display += f"\n   + {t['amount']}x {t['name']}"
-        if item['comment']:
-            display += f"\n   >>: {item['comment']}"
+            display += f"\n   + {t.amount}x {t.name}"
+        if item.comment:
+            display += f"\n   >>: {item.comment}"
 
         match prompt_from_list([
             "Remove item",
@@ -334,66 +445,63 @@ def modify_order_flow(user: dict, conn: sqlite3.Connection) -> None:
                 if not prompt_for_bool("Are you sure you want to remove this item?", False):
                     continue
 
-                cur = conn.cursor()
-                cur.execute("DELETE FROM OrderItem WHERE id = ?",
-                            (item["orderItemId"],))
-                conn.commit()
-                print("Item removed from order!")
+                if not remove_order_item(db, user.id, item.orderItemId):
+                    output("This item is no longer in your order!")
+                    break
+
+                output("Item removed from order!")
                 break
             case 1:  # Change amount
                 amount = None
                 while amount is None:
                     amount = prompt_for_string(
-                        f"Enter new amount for {item['name']}", item['amount'])
+                        f"Enter new amount for {item.name}", item.amount)
 
                     try:
                         amount = int(amount)
+                        found = set_order_item_amount(db, user.id, item.orderItemId, amount)
                     except ValueError:
-                        print("Invalid input!")
+                        output("Invalid input!")
                         amount = None
+                    except OutOfStock as e:
+                        output(f"Not enough {e.name} in stock! ({e.in_stock} left)")
+                        amount = None
+
+                # Removed in the meantime, e.g. from the API or when its hold expired
+                if not found:
+                    output("This item is no longer in your order!")
+                    break
 
-                cur = conn.cursor()
-                cur.execute("UPDATE OrderItem SET amount = ? WHERE id = ?",
-                            (amount, item["orderItemId"]))
-                conn.commit()
-                item['amount'] = amount
-                print("Amount updated!")
+                item = item._replace(amount=amount)
+                output("Amount updated!")
             case 2:  # Change comment
                 comment = prompt_for_string(
                     "New comment: (leave blank for no comment)", None)
-                cur = conn.cursor()
-                cur.execute("UPDATE OrderItem SET comment = ? WHERE id = ?",
-                            (comment, item["orderItemId"]))
-                conn.commit()
-                item['comment'] = comment
-                print("Comment updated!")
+                if not set_order_item_comment(db, user.id, item.orderItemId, comment):
+                    output("This item is no longer in your order!")
+                    break
+
+                item = item._replace(comment=comment)
+                output("Comment updated!")
             case 3:  # Go back
-                return modify_order_flow(user, conn)
+                return modify_order_flow(user, db)
 
 
-def clear_order_flow(user: dict, conn: sqlite3.Connection) -> None:
+def clear_order_flow(user: User, db: Database) -> None:
     """Clear order flow.
 
     Args:
-        user (dict): User data.
+        user (User): Logged in user.
+        db (Database): Database connection manager.
     """
 
-    items = get_open_order_items(conn, user["id"])
+    with db.read() as conn:
+        order = get_open_order(conn, user.id)
 
-    if len(items) == 0:
-        print("You haven't added anything to your order yet!")
+    if not order:
+        output("You haven't added anything to your order yet!")
         return
 
-    if prompt_for_bool(f"Are you sure you want to clear {len(items)} items from your order?", False):
-        cur = conn.cursor()
-        # Delete all OrderItems of current order user has open
-        cur.execute("""
-            DELETE FROM OrderItem
-            WHERE orderId = (
-                SELECT id FROM `Order`
-                WHERE status = 0
-                      AND userId = ?
-            )
-        """, (user["id"],))
-        conn.commit()
-        print("Your order has been cleared!")
+    if prompt_for_bool(f"Are you sure you want to clear {len(order.items)} items from your order?", False):
+        clear_order(db, user.id)
+        output("Your order has been cleared!")
@@ -1,65 +1,160 @@
-import sqlite3
+import time
 
-from helpers import prompt_from_list
+from archive import get_archived_orders
+from db import Database
+from events import SubscriberDropped, bus
+from helpers import output, prompt_from_list, read_input
+from kitchen import READY, STATUS_NAMES
+from receipts import receipts
+from repository import User, get_user_order_status, iter_past_orders
 
+# Orders shown per page of the order history
+PAGE_SIZE = 10
+# Seconds an order is followed before giving up
+TRACK_SECONDS = 30 * 60
 
-def orders_flow(user: dict, conn: sqlite3.Connection) -> None:
+
+def get_past_orders(db: Database, user_id: int, limit: int = 10, before: tuple = None) -> list:
+    """Get a page of the user's placed orders, newest first.
+
+    Pages are keyed on `(createdAt, id)`, so every page costs the same no
+    matter how many orders the user has. Orders moved to the monthly
+    archives are merged in.
+
+    Args:
+        db (Database): Database connection manager.
+        user_id (int): User id.
+        limit (int, optional): Max number of orders. Defaults to 10.
+        before (tuple, optional): `(createdAt, id)` of the last order on the previous page.
+
+    Returns:
+        list: `PastOrder`s with `id`, `status`, `itemsCount`, `total` and `createdAt`.
+    """
+
+    with db.read() as conn:
+        orders = list(iter_past_orders(conn, user_id, limit, before))
+        # Archived orders are older than most hot ones, after a full page
+        # only the months from its last order on can have any in between
+        archived = get_archived_orders(conn, user_id, limit, before,
+                                       (orders[-1].createdAt, orders[-1].id) if len(orders) == limit else None)
+
+    if not archived:
+        return orders
+    return sorted(orders + archived, key=lambda o: (o.createdAt, o.id), reverse=True)[:limit]
+
+
+def get_receipt(db: Database, user_id: int, order_id: int) -> tuple:
+    """Get the receipt of one of the user's placed orders.
+
+    Receipts are frozen when the order is placed and served from memory.
+
+    Args:
+        db (Database): Database connection manager.
+        user_id (int): User id, the order must belong to the user.
+        order_id (int): Order id.
+
+    Returns:
+        tuple: The receipt as a dict and rendered as text, or None.
+    """
+
+    with db.read() as conn:
+        return receipts.get(conn, user_id, order_id)
+
+
+def get_order_status(db: Database, user_id: int, order_id: int) -> int:
+    """Get the status of one of the user's orders.
+
+    Args:
+        db (Database): Database connection manager.
+        user_id (int): User id, the order must belong to the user.
+        order_id (int): Order id.
+
+    Returns:
+        int: The status, or None if there is no such order.
+    """
+
+    with db.read() as conn:
+        return get_user_order_status(conn, user_id, order_id)
+
+
+def track_order_flow(user: User, db: Database, order_id: int) -> None:
+    """Show the status changes of an order until it is ready.
+
+    Args:
+        user (User): Logged in user.
+        db (Database): Database connection manager.
+        order_id (int): Order id.
+    """
+
+    with bus.subscribe(db, user.id) as events:
+        status = get_order_status(db, user.id, order_id)
+        output(f"Order #{order_id}: {STATUS_NAMES[status]}")
+
+        deadline = time.monotonic() + TRACK_SECONDS
+        while status != READY:
+            try:
+                event = events.get(deadline - time.monotonic())
+            except SubscriberDropped:
+                event = None
+            if event is None:
+                output("Stopped following the order, see 'View past orders' for its status.")
+                return
+            if event.orderId == order_id and event.status != status:
+                status = event.status
+                output(f"Order #{order_id}: {STATUS_NAMES[status]}")
+
+    output("Your order is ready!")
+
+
+def orders_flow(user: User, db: Database) -> None:
     """Orders flow.
     Args:
-        user (dict): User data.
+        user (User): Logged in user.
+        db (Database): Database connection manager.
     """
 
-    print("Past orders:")
-
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT
-            o.id, COUNT(oi.id) AS itemsCount, o.createdAt
-        FROM `Order` o JOIN `OrderItem` oi ON o.id = oi.orderId
-        WHERE
-            userId = ?
-            AND status = 1
-        GROUP BY o.id
-        ORDER BY
-            o.createdAt DESC
-        LIMIT 10
-    """, (user["id"],))
-
-    orders = cur.fetchall()
-
-    if len(orders) == 0:
-        print("No orders yet.")
-        return
+    # (createdAt, id) cursors of the pages before the current one
+    pages = []
+    before = None
 
-    p = prompt_from_list([
-        *list(map(lambda order: f"{order['createdAt']} ({order['itemsCount']} items)", orders)),
-        "Go back"
-    ], "Choose an order to view:")
+    while True:
+        output("Past orders:")
 
-    if p == len(orders):
-        return
+        orders = get_past_orders(db, user.id, PAGE_SIZE + 1, before)
+        has_older = len(orders) > PAGE_SIZE
+        orders = orders[:PAGE_SIZE]
+
+        if len(orders) == 0:
+            output("No orders yet.")
+            return
 
-    order = orders[p]
-
-    print("Receipt:\n")
-    print("--------")
-    print(f"Order #{order['id']}")
-    print(f"Created at {order['createdAt']}")
-    print("Items:")
-    cur.execute("""
-        SELECT
-            p.name, oi.amount, p.price
-        FROM `OrderItem` oi JOIN Product p ON oi.productId = p.id
-        WHERE
-            orderId = ?
-    """, (order["id"],))
-
-    items = cur.fetchall()
-
-    for item in items:
-        print(f"- {item['amount']}x {item['name']} @ {item['price']} kr")
-    print(
-        f"Total: {sum(map(lambda item: item['amount'] * item['price'], items))}")
-    print("--------")
-
-    input("\nPress enter to go back.")
+        choices = list(map(
+            lambda order: f"{order.createdAt} ({order.itemsCount} items) - {STATUS_NAMES[order.status]}",
+            orders))
+        if has_older:
+            choices.append("Older orders")
+        if pages:
+            choices.append("Newer orders")
+        choices.append("Go back")
+
+        p = prompt_from_list(choices, "Choose an order to view:")
+
+        if p >= len(orders):
+            match choices[p]:
+                case "Older orders":
+                    pages.append(before)
+                    before = (orders[-1].createdAt, orders[-1].id)
+                case "Newer orders":
+                    before = pages.pop()
+                case _:
+                    return
+            continue
+
+        # None for orders from before receipts, or whose archive is missing
+        if receipt := get_receipt(db, user.id, orders[p].id):
+            output(receipt[1])
+        else:
+            output("The receipt for this order is unavailable.")
+
+        read_input("\nPress enter to go back.")
+        return
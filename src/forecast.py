@@ -0,0 +1,196 @@
+import argparse
+import math
+from datetime import date, timedelta
+
+import numpy as np
+
+from db import Database
+
+# Forecasting methods: exponential smoothing or a simple moving average
+METHODS = ['ewma', 'sma']
+# Stock lasting longer than this many days has no stock-out date
+HORIZON_DAYS = 3650
+
+
+def load_consumption(db: Database, days: int, today: date = None) -> tuple:
+    """Load daily ingredient consumption from the sales rollups.
+
+    Units sold per product and day are expanded into ingredients through the
+    current recipes with one matrix product, and topping usage is added on top.
+
+    Args:
+        db (Database): Database connection manager.
+        days (int): Number of days of history, ending today.
+        today (date, optional): Last day of the history. Defaults to today.
+
+    Returns:
+        tuple: Ingredient rows (`id`, `name`, `inStock`) and a
+            `(len(ingredients), days)` array of consumption, oldest day first.
+    """
+
+    today = today or date.today()
+    first = today - timedelta(days=days - 1)
+    # Days after `today` (a past date, or rollups from a skewed clock) are left out
+    params = {"first": first.isoformat(), "end": (today + timedelta(days=1)).isoformat()}
+
+    with db.read() as conn:
+        ingredients = conn.execute("SELECT id, name, inStock FROM Ingredient ORDER BY id").fetchall()
+        product_ids = np.array(conn.execute("SELECT id FROM Product ORDER BY id").fetchall(), dtype=np.int64).reshape(-1)
+        recipes = conn.execute("SELECT productId, ingredientId, amount FROM ProductIngredient").fetchall()
+        # (day index, id, amount) rows, the day index counted from `first`
+        sales = conn.execute("""
+            SELECT
+                CAST(julianday(bucket) - julianday(:first) AS INTEGER), productId, units
+            FROM ProductSalesRollup
+            WHERE period = 'day'
+                  AND bucket >= :first
+                  AND bucket < :end
+        """, params).fetchall()
+        toppings = conn.execute("""
+            SELECT
+                CAST(julianday(bucket) - julianday(:first) AS INTEGER), ingredientId, amount
+            FROM ToppingUsageRollup
+            WHERE period = 'day'
+                  AND bucket >= :first
+                  AND bucket < :end
+        """, params).fetchall()
+
+    ingredient_ids = np.array([row["id"] for row in ingredients], dtype=np.int64)
+
+    def index_of(ids: np.ndarray, values: np.ndarray) -> tuple:
+        """Positions of values in sorted ids, and which values were found.
+
+        Rollups and recipes can refer to products or ingredients that have since been deleted.
+        """
+        if len(ids) == 0:
+            return np.zeros(len(values), dtype=int), np.zeros(len(values), dtype=bool)
+        index = np.searchsorted(ids, values).clip(max=len(ids) - 1)
+        return index, ids[index] == values
+
+    def scatter(rows: list, row_ids: np.ndarray, column_ids: np.ndarray, shape: tuple) -> np.ndarray:
+        """Sum (row, column id, amount) rows into an array.
+
+        Rows are positions if `row_ids` is None, ids otherwise.
+        """
+        matrix = np.zeros(shape)
+        rows = np.array(rows, dtype=float).reshape(-1, 3)
+        if row_ids is None:
+            row, row_known = rows[:, 0].astype(int), np.ones(len(rows), dtype=bool)
+        else:
+            row, row_known = index_of(row_ids, rows[:, 0].astype(np.int64))
+        column, column_known = index_of(column_ids, rows[:, 1].astype(np.int64))
+        known = row_known & column_known
+        np.add.at(matrix, (row[known], column[known]), rows[known, 2])
+        return matrix
+
+    # products x ingredients
+    recipe = scatter(recipes, product_ids, ingredient_ids, (len(product_ids), len(ingredient_ids)))
+
+    # days x products, expanded to days x ingredients
+    consumption = scatter(sales, None, product_ids, (days, len(product_ids))) @ recipe
+    consumption += scatter(toppings, None, ingredient_ids, (days, len(ingredient_ids)))
+
+    return ingredients, consumption.T
+
+
+def forecast_demand(consumption: np.ndarray, method: str = 'ewma', alpha: float = 0.3, window: int = 28) -> np.ndarray:
+    """Forecast the daily demand of every ingredient.
+
+    Args:
+        consumption (np.ndarray): `(ingredients, days)` array, oldest day first.
+        method (str, optional): 'ewma' or 'sma'. Defaults to 'ewma'.
+        alpha (float, optional): Smoothing factor for 'ewma'. Defaults to 0.3.
+        window (int, optional): Days averaged by 'sma'. Defaults to 28.
+
+    Returns:
+        np.ndarray: Expected consumption per day, per ingredient.
+    """
+
+    days = consumption.shape[1]
+    if days == 0:
+        return np.zeros(consumption.shape[0])
+
+    if method == 'sma':
+        return consumption[:, -window:].mean(axis=1)
+
+    # The smoothed level after the last day is a weighted sum of all days,
+    # with the first day as the initial level
+    weights = alpha * (1 - alpha) ** np.arange(days - 1, -1, -1)
+    weights[0] = (1 - alpha) ** (days - 1)
+    return consumption @ weights
+
+
+def restock_plan(db: Database, days: int = 365, method: str = 'ewma', alpha: float = 0.3, window: int = 28,
+                 lead_days: int = 3, cover_days: int = 14, today: date = None) -> list:
+    """Plan restocking of every ingredient.
+
+    Args:
+        db (Database): Database connection manager.
+        days (int, optional): Days of history to forecast from. Defaults to 365.
+        method (str, optional): 'ewma' or 'sma'. Defaults to 'ewma'.
+        alpha (float, optional): Smoothing factor for 'ewma'. Defaults to 0.3.
+        window (int, optional): Days averaged by 'sma'. Defaults to 28.
+        lead_days (int, optional): Days from ordering stock to receiving it. Defaults to 3.
+        cover_days (int, optional): Days a restock should last after arriving. Defaults to 14.
+        today (date, optional): Last day of the history. Defaults to today.
+
+    Returns:
+        list: One dict per ingredient with `name`, `inStock`, `demandPerDay`,
+            `stockOut` (date, or None if the stock lasts beyond `HORIZON_DAYS`) and `restock`,
+            soonest stock-out first.
+    """
+
+    today = today or date.today()
+    ingredients, consumption = load_consumption(db, days, today)
+    demand = forecast_demand(consumption, method, alpha, window)
+
+    in_stock = np.array([row["inStock"] for row in ingredients], dtype=float)
+    with np.errstate(divide='ignore'):
+        days_left = np.where(demand > 0, in_stock / demand, np.inf)
+    days_left[days_left > HORIZON_DAYS] = np.inf
+    restock = np.ceil(np.maximum(demand * (lead_days + cover_days) - in_stock, 0))
+
+    plan = [{
+        "name": row["name"],
+        "inStock": row["inStock"],
+        "demandPerDay": float(demand[i]),
+        "stockOut": today + timedelta(days=math.floor(days_left[i])) if np.isfinite(days_left[i]) else None,
+        "restock": int(restock[i]),
+    } for i, row in enumerate(ingredients)]
+
+    return sorted(plan, key=lambda p: (p["stockOut"] is None, p["stockOut"] or today))
+
+
+def format_plan(plan: list) -> str:
+    """Render a restock plan as text."""
+
+    lines = [f"{'Ingredient':<20}{'In stock':>10}{'Per day':>10}  {'Runs out':<12}{'Restock':>8}"]
+    for p in plan:
+        stock_out = p['stockOut'].isoformat() if p['stockOut'] else "-"
+        lines.append(f"{p['name']:<20}{p['inStock']:>10}{p['demandPerDay']:>10.1f}  {stock_out:<12}{p['restock']:>8}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Forecast ingredient consumption and plan restocking.")
+    parser.add_argument('--days', type=int, default=365, help="Days of history to use")
+    parser.add_argument('--method', choices=METHODS, default='ewma')
+    parser.add_argument('--alpha', type=float, default=0.3, help="Smoothing factor for ewma")
+    parser.add_argument('--window', type=int, default=28, help="Days averaged by sma")
+    parser.add_argument('--lead-days', type=int, default=3, help="Days until a restock arrives")
+    parser.add_argument('--cover-days', type=int, default=14, help="Days a restock should last")
+    parser.add_argument('--database', default='database.db')
+    args = parser.parse_args()
+
+    # Only the command line needs main, the admin flow imports this module
+    from main import open_database
+    db = open_database(args.database)
+    try:
+        print(format_plan(restock_plan(db, args.days, args.method, args.alpha, args.window,
+                                       args.lead_days, args.cover_days)))
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,36 @@
+import contextvars
 import sqlite3
 import json
+import os
+import random
+import re
+import sys
+import threading
+import time
 from datetime import datetime
 
+import metrics
+
 
 class LOGOUT(Exception):
     """Exception to be raised when the user logs out."""
     pass
 
+
+class EXIT(Exception):
+    """Exception to be raised when the user exits the program."""
+    pass
+
+
+class OutOfStock(Exception):
+    """Exception to be raised when an ingredient does not have enough stock."""
+
+    def __init__(self, name: str, in_stock: int, needed: int):
+        super().__init__(f"Not enough {name} in stock ({in_stock} left, {needed} needed)")
+        self.name = name
+        self.in_stock = in_stock
+        self.needed = needed
+
 ############
 # DB STUFF #
 ############
@@ -21,28 +45,30 @@ def populate_db(conn: sqlite3.Connection):
     with open('assets/test_data.json', 'r') as f:
         data = json.load(f)
 
+    now = datetime.now()
     cur = conn.cursor()
 
     # Create ingredients
-    for ingredient in data['ingredients']:
-        cur.execute('INSERT INTO Ingredient (id, name, inStock, isTopping, updatedAt) VALUES (?, ?, ?, ?, ?)',
-                    (ingredient['id'], ingredient['name'], ingredient['in_stock'], ingredient['is_topping'], datetime.now()))
+    cur.executemany('INSERT INTO Ingredient (id, name, inStock, isTopping, updatedAt) VALUES (?, ?, ?, ?, ?)',
+                    [(i['id'], i['name'], i['in_stock'], i['is_topping'], now) for i in data['ingredients']])
 
     # Create products
-    for product in data['products']:
-        cur.execute('INSERT INTO Product (id, name, price, description, updatedAt) VALUES (?, ?, ?, ?, ?)',
-                    (product['id'], product['name'], product['price'], product['description'], datetime.now()))
-        for ingredient in product['ingredients']:
-            cur.execute('INSERT INTO ProductIngredient (productId, ingredientId, amount, updatedAt) VALUES (?, ?, ?, ?)',
-                        (product['id'], ingredient['id'], ingredient['amount'], datetime.now()))
+    cur.executemany('INSERT INTO Product (id, name, price, description, updatedAt) VALUES (?, ?, ?, ?, ?)',
+                    [(p['id'], p['name'], p['price'], p['description'], now) for p in data['products']])
+    cur.executemany('INSERT INTO ProductIngredient (productId, ingredientId, amount, updatedAt) VALUES (?, ?, ?, ?)',
+                    [(p['id'], i['id'], i['amount'], now) for p in data['products'] for i in p['ingredients']])
 
     conn.commit()
 
 
-def create_tables():
-    """Create the database and all tables."""
+def create_tables(path: str = 'database.db') -> sqlite3.Connection:
+    """Create the database and all tables.
 
-    conn = sqlite3.connect('database.db')
+    Args:
+        path (str, optional): Path to the database. Defaults to 'database.db'.
+    """
+
+    conn = sqlite3.connect(path)
 
     c = conn.cursor()
 
@@ -55,49 +81,200 @@ def create_tables():
     return conn
 
 
-def get_user_by_email(conn: sqlite3.Connection, email: str) -> dict:
-    """Get a user by their email.
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply pending schema migrations from assets/migrations.
+
+    Migrations are SQL files named `<number>_<name>.sql`. The number of the
+    last applied migration is stored in `PRAGMA user_version`, so every
+    migration runs exactly once, on new and existing databases alike.
 
     Args:
-        email (str): Email of the user.
+        conn (sqlite3.Connection): Connection to the database.
 
     Returns:
-        dict: User data.
+        int: Schema version after migrating.
     """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
 
-    c = conn.cursor()
-    c.execute("SELECT * FROM User WHERE email = ?", (email,))
-    return c.fetchone()
+    migrations = []
+    for filename in os.listdir('assets/migrations'):
+        if match := re.match(r"(\d+)_.*\.sql$", filename):
+            migrations.append((int(match.group(1)), filename))
+
+    for number, filename in sorted(migrations):
+        if number <= version:
+            continue
+
+        with open(f'assets/migrations/{filename}') as f:
+            sql = f.read()
+
+        # Run the migration and bump the version in the same transaction
+        try:
+            conn.executescript(
+                f"BEGIN;\n{sql}\nPRAGMA user_version = {number};\nCOMMIT;")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+        version = number
+
+    return version
+
+
+# Transactions retried because the database was busy, see `run_transaction`
+transaction_stats = {"busy_retries": 0, "busy_failures": 0}
+_transaction_stats_lock = threading.Lock()
+
+
+def is_busy(error: sqlite3.OperationalError) -> bool:
+    """Check if an error was caused by another connection holding a lock."""
+    message = str(error)
+    return "database is locked" in message or "database is busy" in message
+
+
+def run_transaction(conn: sqlite3.Connection, fn, attempts: int = 5, backoff: float = 0.05):
+    """Run `fn(cur)` in a `BEGIN IMMEDIATE` transaction.
+
+    The write lock is taken up front, so reads done by `fn` cannot be changed
+    by another connection before the transaction commits. If the database is
+    busy the transaction is retried with exponential backoff.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database.
+        fn (callable): Function doing the work, called with a cursor.
+        attempts (int, optional): Number of tries before giving up. Defaults to 5.
+        backoff (float, optional): Initial backoff in seconds. Defaults to 0.05.
+
+    Returns:
+        Whatever `fn` returns.
+    """
+
+    for attempt in range(attempts):
+        try:
+            # Blocks for up to busy_timeout while another connection writes
+            with metrics.timer('fastpizza_db_lock_wait_seconds', lock='database'):
+                conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn.cursor())
+                conn.commit()
+                return result
+            except BaseException:
+                conn.rollback()
+                raise
+        except sqlite3.OperationalError as e:
+            if not is_busy(e):
+                raise
+
+            with _transaction_stats_lock:
+                if attempt == attempts - 1:
+                    transaction_stats["busy_failures"] += 1
+                    raise
+                transaction_stats["busy_retries"] += 1
+
+            with metrics.timer('fastpizza_db_lock_wait_seconds', lock='database'):
+                time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+##############
+# SESSION IO #
+##############
+
+
+class ConsoleIO:
+    """Session I/O on the local terminal."""
+
+    def __init__(self):
+        # Client address when the shop runs as the shell of an SSH login
+        self.peer = os.environ.get('SSH_CLIENT', '').split(' ')[0] or None
+
+    def write(self, text: str) -> None:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+    def read_line(self, prompt: str = "") -> str:
+        return input(prompt)
+
+
+# I/O of the session running in the current thread/task
+session_io = contextvars.ContextVar('session_io', default=ConsoleIO())
+
+
+def output(*values, sep: str = ' ', end: str = '\n') -> None:
+    """Write to the current session, like `print`."""
+    session_io.get().write(sep.join(map(str, values)) + end)
+
+
+def read_input(prompt: str = "") -> str:
+    """Read a line from the current session, like `input`.
+
+    Raises:
+        EOFError: If the session has ended.
+    """
+    return session_io.get().read_line(prompt)
 
 ########
 # MISC #
 ########
 
 
-def prompt_from_list(choices: list, prompt: str = 'Please choose an option: ') -> int:
+def prompt_from_list(choices: list, prompt: str = 'Please choose an option: ', page_size: int = None,
+                     pinned: int = 0, search=None) -> int:
     """Prompt the user with a list of choices.
 
+    Each page is rendered and written at once. Choices keep their numbers on
+    every page and in search results.
+
     Args:
         choices (list): List of choices.
         prompt (str, optional): Prompt to display. Defaults to 'Please choose an option: '.
+        page_size (int, optional): Show this many choices at a time, 'n' and 'p' page. Defaults to all.
+        pinned (int, optional): Number of choices at the end (like "Cancel") shown on every page. Defaults to 0.
+        search (callable, optional): Called with any other text, returns the indexes of the matching
+            choices to show instead. An empty line shows all choices again. Defaults to no search.
 
     Returns:
         int: Index of the selected choice.
     """
 
+    pinned_indexes = list(range(len(choices) - pinned, len(choices)))
+    shown = list(range(len(choices) - pinned))
+    heading = prompt
+    page = 0
+
     while True:
-        print(f"\n{prompt}")
-        # Print the choices
-        for i, choice in enumerate(choices):
-            print(f'[{i+1}] {choice}')
+        pages = max(1, -(-len(shown) // page_size)) if page_size else 1
+        visible = shown[page * page_size:(page + 1) * page_size] if page_size else shown
+
+        lines = [f"\n{heading}"]
+        lines.extend(f'[{i+1}] {choices[i]}' for i in (*visible, *pinned_indexes))
+        if pages > 1:
+            lines.append(f"Page {page + 1}/{pages}, 'n' for the next page, 'p' for the previous")
+        if search:
+            lines.append("Type to search")
+        output("\n".join(lines))
 
         # Prompt the user
+        answer = read_input("> ").strip()
         try:
-            choice = int(input("> ").strip())
+            choice = int(answer)
             if choice >= 1 and choice < len(choices)+1:
                 return choice-1
+            continue
         except ValueError:
-            print('Invalid choice. Please try again.')
+            pass
+
+        if page_size and answer.lower() in ('n', 'p'):
+            page = min(max(page + (1 if answer.lower() == 'n' else -1), 0), pages - 1)
+        elif search and answer:
+            if matches := search(answer):
+                shown, heading, page = matches, f"{prompt} (matching '{answer}')", 0
+            else:
+                output(f"Nothing matches '{answer}'.")
+        elif search:
+            shown, heading, page = list(range(len(choices) - pinned)), prompt, 0
+        else:
+            output('Invalid choice. Please try again.')
 
 
 def prompt_for_string(prompt: str, default: str = "") -> str:
@@ -112,8 +289,8 @@ def prompt_for_string(prompt: str, default: str = "") -> str:
     p = f"\n{prompt}"
     if default != "":
         p += f" [{default}]"
-    print(p)
-    c = input("> ")
+    output(p)
+    c = read_input("> ")
     if len(c) == 0:
         return default
     return c
@@ -128,7 +305,7 @@ def prompt_for_bool(prompt: str, default: bool = True) -> bool:
     Returns:
         bool: User input.
     """
-    p = input(
+    p = read_input(
         f"\n{prompt} [Y/n] " if default else f"\n{prompt} [y/N] ").strip().lower()
 
     if default:
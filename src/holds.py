@@ -0,0 +1,210 @@
+import os
+import sqlite3
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+import metrics
+from db import Database
+from helpers import OutOfStock, is_busy
+
+# Minutes an untouched cart holds its stock
+HOLD_MINUTES = float(os.environ.get('FASTPIZZA_HOLD_MINUTES', 15))
+# Seconds between sweeps for expired carts
+SWEEP_INTERVAL = 30.0
+# Carts released per transaction, so the sweeper never holds the write lock for long
+SWEEP_BATCH = 100
+
+# Ingredients a whole order uses, params: {"order_id"}
+ORDER_USAGE = """
+    SELECT ingredientId, SUM(amount) AS amount
+    FROM (
+        SELECT pi.ingredientId, oi.amount * pi.amount AS amount
+        FROM OrderItem oi
+        JOIN ProductIngredient pi ON
+            pi.productId = oi.productId
+        WHERE oi.orderId = :order_id
+        UNION ALL
+        SELECT t.ingredientId, oi.amount * t.amount
+        FROM OrderItem oi
+        JOIN IngredientOrderItemTopping t ON
+            t.orderItemId = oi.id
+        WHERE oi.orderId = :order_id
+    )
+    GROUP BY ingredientId
+"""
+
+
+def hold_expiry(now: datetime = None) -> datetime:
+    """When the holds of a cart changed now expire."""
+    return (now or datetime.now()) + timedelta(minutes=HOLD_MINUTES)
+
+
+def check_available(cur: sqlite3.Cursor, usage: dict) -> None:
+    """Check that enough of every ingredient is in stock and not held.
+
+    Args:
+        cur (sqlite3.Cursor): Cursor in a write transaction.
+        usage (dict): Amount needed per ingredient id.
+
+    Raises:
+        OutOfStock: If an ingredient does not have enough available.
+    """
+
+    if not usage:
+        return
+
+    cur.execute(f"SELECT id, name, inStock - held FROM Ingredient WHERE id IN ({', '.join('?' * len(usage))})",
+                tuple(usage))
+    for ingredient_id, name, available in cur.fetchall():
+        if available < usage[ingredient_id]:
+            raise OutOfStock(name, max(available, 0), usage[ingredient_id])
+
+
+def hold_stock(cur: sqlite3.Cursor, order_id: int, order_item_id: int, usage: dict) -> None:
+    """Hold the ingredients of a new order item, all or nothing.
+
+    Must run inside a write transaction (see `run_transaction`).
+
+    Args:
+        cur (sqlite3.Cursor): Cursor in a write transaction.
+        order_id (int): Id of the open order.
+        order_item_id (int): Id of the new order item.
+        usage (dict): Amount to hold per ingredient id.
+
+    Raises:
+        OutOfStock: If an ingredient does not have enough available.
+    """
+
+    check_available(cur, usage)
+    cur.executemany("""
+        INSERT INTO StockHold
+            (orderItemId, ingredientId, orderId, amount)
+        VALUES
+            (?, ?, ?, ?)
+    """, [(order_item_id, ingredient_id, order_id, amount) for ingredient_id, amount in usage.items()])
+
+
+def check_amount_change(cur: sqlite3.Cursor, order_item_id: int, amount: int) -> None:
+    """Check that an order item's holds can grow to a new amount.
+
+    The holds themselves are scaled by a trigger when the amount is updated.
+
+    Raises:
+        OutOfStock: If an ingredient does not have enough available.
+    """
+
+    cur.execute("""
+        SELECT h.ingredientId, h.amount / oi.amount * (? - oi.amount)
+        FROM OrderItem oi
+        JOIN StockHold h ON
+            h.orderItemId = oi.id
+        WHERE oi.id = ?
+    """, (amount, order_item_id))
+    check_available(cur, {ingredient_id: extra for ingredient_id, extra in cur.fetchall() if extra > 0})
+
+
+def take_stock(cur: sqlite3.Cursor, order_id: int) -> None:
+    """Take the ingredients of an order that is being placed out of stock.
+
+    The order's own holds count as available, so this also works for carts
+    whose holds have expired, as long as the stock is still there.
+
+    Args:
+        cur (sqlite3.Cursor): Cursor in the placing transaction.
+        order_id (int): Order id.
+
+    Raises:
+        OutOfStock: If an ingredient does not have enough available.
+    """
+
+    usage = {row[0]: row[1] for row in cur.execute(ORDER_USAGE, {"order_id": order_id}).fetchall()}
+
+    cur.execute("DELETE FROM StockHold WHERE orderId = ?", (order_id,))
+    check_available(cur, usage)
+
+    cur.executemany("UPDATE Ingredient SET inStock = inStock - ? WHERE id = ?",
+                    [(amount, ingredient_id) for ingredient_id, amount in usage.items()])
+
+
+def sweep_expired_holds(db: Database, now: datetime = None, batch: int = SWEEP_BATCH) -> int:
+    """Release the holds of carts that haven't been touched for `HOLD_MINUTES`.
+
+    The carts keep their items, placing them checks the stock again.
+
+    Args:
+        db (Database): Database connection manager.
+        now (datetime, optional): Current time. Defaults to now.
+        batch (int, optional): Carts released per transaction. Defaults to `SWEEP_BATCH`.
+
+    Returns:
+        int: Number of carts released.
+    """
+
+    now = now or datetime.now()
+
+    def sweep(cur: sqlite3.Cursor) -> int:
+        order_ids = [row[0] for row in cur.execute("""
+            SELECT id
+            FROM `Order`
+            WHERE status = 0
+                  AND holdExpiresAt < ?
+            ORDER BY holdExpiresAt
+            LIMIT ?
+        """, (now, batch)).fetchall()]
+        if not order_ids:
+            return 0
+
+        params = ', '.join('?' * len(order_ids))
+        cur.execute(f"DELETE FROM StockHold WHERE orderId IN ({params})", order_ids)
+        cur.execute(f"UPDATE `Order` SET holdExpiresAt = NULL WHERE id IN ({params})", order_ids)
+        return len(order_ids)
+
+    released = 0
+    while count := db.transaction(sweep):
+        released += count
+        if count < batch:
+            break
+
+    if released and metrics.enabled:
+        metrics.increment('fastpizza_expired_carts_total', released)
+    return released
+
+
+class HoldSweeper:
+    """Background thread releasing the holds of abandoned carts."""
+
+    def __init__(self, db: Database, interval: float = SWEEP_INTERVAL):
+        self.db = db
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> 'HoldSweeper':
+        self._thread = threading.Thread(target=self._run, name='hold-sweeper', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                sweep_expired_holds(self.db)
+            except sqlite3.OperationalError as e:
+                if is_busy(e):
+                    # There is always the next sweep
+                    continue
+                self._failed()
+            except Exception:
+                # Keep sweeping, or abandoned carts would hold their stock forever
+                self._failed()
+
+    @staticmethod
+    def _failed() -> None:
+        traceback.print_exc()
+        if metrics.enabled:
+            metrics.increment('fastpizza_hold_sweep_errors_total')
@@ -0,0 +1,328 @@
+import argparse
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import metrics
+from db import Database
+from events import SubscriberDropped, bus
+
+# Order.status values
+OPEN, QUEUED, PREPARING, BAKING, READY = range(5)
+STATUS_NAMES = ['Open', 'Queued', 'Preparing', 'Baking', 'Ready']
+
+# Seconds an order spends in the oven
+BAKE_SECONDS = 240
+# Seconds an idle station waits before looking at the queue again
+POLL_INTERVAL = 1.0
+
+# Take the next job off the queue, earliest due first. One statement, so no
+# two stations (or kitchen processes) can take the same job, and the
+# subquery only walks the queue index.
+CLAIM_JOB = """
+    UPDATE KitchenJob SET
+        station = :station,
+        claimedAt = :now
+    WHERE orderId = (
+        SELECT orderId
+        FROM KitchenJob
+        WHERE claimedAt IS NULL
+        ORDER BY dueAt, orderId
+        LIMIT 1
+    )
+    RETURNING
+        orderId, prepSeconds, (julianday(:now) - julianday(queuedAt)) * 86400 AS waitSeconds
+"""
+
+SET_ORDER_STATUS = """
+    UPDATE `Order` SET
+        status = :status,
+        updatedAt = :now
+    WHERE id = :order_id
+"""
+
+
+def claim_job(db: Database, station: str) -> sqlite3.Row:
+    """Take the next order off the kitchen queue and start preparing it.
+
+    Args:
+        db (Database): Database connection manager.
+        station (str): Name of the station taking the order.
+
+    Returns:
+        sqlite3.Row: `orderId`, `prepSeconds` and `waitSeconds` (time spent
+            in the queue), or None if the queue is empty.
+    """
+
+    def claim(cur: sqlite3.Cursor) -> sqlite3.Row:
+        now = datetime.now()
+        if not (jobs := cur.execute(CLAIM_JOB, {"station": station, "now": now}).fetchall()):
+            return None
+        cur.execute(SET_ORDER_STATUS, {"status": PREPARING, "now": now, "order_id": jobs[0]["orderId"]})
+        return jobs[0]
+
+    return db.transaction(claim)
+
+
+def start_baking(db: Database, order_id: int) -> None:
+    """Mark a prepared order as being in the oven."""
+
+    def bake(cur: sqlite3.Cursor) -> None:
+        now = datetime.now()
+        cur.execute("UPDATE KitchenJob SET bakingAt = ? WHERE orderId = ?", (now, order_id))
+        cur.execute(SET_ORDER_STATUS, {"status": BAKING, "now": now, "order_id": order_id})
+
+    db.transaction(bake)
+
+
+def finish_job(db: Database, order_id: int) -> float:
+    """Mark an order as ready.
+
+    Returns:
+        float: Seconds from placing the order until now.
+    """
+
+    def finish(cur: sqlite3.Cursor) -> float:
+        now = datetime.now()
+        (seconds,), = cur.execute("""
+            UPDATE KitchenJob SET
+                readyAt = :now
+            WHERE orderId = :order_id
+            RETURNING (julianday(:now) - julianday(queuedAt)) * 86400
+        """, {"now": now, "order_id": order_id}).fetchall()
+        cur.execute(SET_ORDER_STATUS, {"status": READY, "now": now, "order_id": order_id})
+        return seconds
+
+    return db.transaction(finish)
+
+
+def release_claims(db: Database) -> int:
+    """Put orders left in progress by a stopped kitchen back in the queue.
+
+    Returns:
+        int: Number of orders put back.
+    """
+
+    def release(cur: sqlite3.Cursor) -> int:
+        cur.execute("""
+            UPDATE `Order` SET
+                status = :status,
+                updatedAt = :now
+            WHERE id IN (
+                SELECT orderId
+                FROM KitchenJob
+                WHERE claimedAt IS NOT NULL
+                      AND readyAt IS NULL
+            )
+        """, {"status": QUEUED, "now": datetime.now()})
+        cur.execute("""
+            UPDATE KitchenJob SET
+                station = NULL,
+                claimedAt = NULL,
+                bakingAt = NULL
+            WHERE claimedAt IS NOT NULL
+                  AND readyAt IS NULL
+        """)
+        return cur.rowcount
+
+    return db.transaction(release)
+
+
+def get_kitchen_stats(db: Database, hours: float = 1, now: datetime = None) -> sqlite3.Row:
+    """Get the state of the kitchen queue and its recent throughput.
+
+    Args:
+        db (Database): Database connection manager.
+        hours (float, optional): Length of the window finished orders are counted in. Defaults to 1.
+        now (datetime, optional): End of the window. Defaults to now.
+
+    Returns:
+        sqlite3.Row: `queued`, `inProgress` and `oldestWaitSeconds` for the
+            queue, and for the orders finished in the window: `ready`,
+            `queueWaitSeconds` (average), `maxQueueWaitSeconds` and `orderSeconds`
+            (average time from placing to ready).
+    """
+
+    now = now or datetime.now()
+    with db.read() as conn:
+        return conn.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM KitchenJob WHERE claimedAt IS NULL) AS queued,
+                (SELECT COUNT(*) FROM KitchenJob WHERE claimedAt IS NOT NULL AND readyAt IS NULL) AS inProgress,
+                (
+                    SELECT (julianday(:now) - julianday(MIN(queuedAt))) * 86400
+                    FROM KitchenJob
+                    WHERE claimedAt IS NULL
+                ) AS oldestWaitSeconds,
+                COUNT(*) AS ready,
+                AVG((julianday(claimedAt) - julianday(queuedAt)) * 86400) AS queueWaitSeconds,
+                MAX((julianday(claimedAt) - julianday(queuedAt)) * 86400) AS maxQueueWaitSeconds,
+                AVG((julianday(readyAt) - julianday(queuedAt)) * 86400) AS orderSeconds
+            FROM KitchenJob
+            WHERE readyAt >= :since
+        """, {"now": now, "since": now - timedelta(hours=hours)}).fetchone()
+
+
+def format_kitchen_stats(stats: sqlite3.Row, hours: float = 1) -> str:
+    """Render kitchen stats as text."""
+
+    def minutes(seconds: float) -> str:
+        return f"{seconds / 60:.1f} min" if seconds is not None else "-"
+
+    return "\n".join([
+        "Kitchen:",
+        f"{'Queued':<24}{stats['queued']:>10}",
+        f"{'In progress':<24}{stats['inProgress']:>10}",
+        f"{'Oldest in queue':<24}{minutes(stats['oldestWaitSeconds']):>10}",
+        f"\nLast {hours:g} hour(s):",
+        f"{'Ready':<24}{stats['ready']:>10}",
+        f"{'Queue wait':<24}{minutes(stats['queueWaitSeconds']):>10}",
+        f"{'Longest queue wait':<24}{minutes(stats['maxQueueWaitSeconds']):>10}",
+        f"{'Placed to ready':<24}{minutes(stats['orderSeconds']):>10}",
+    ])
+
+
+class Kitchen:
+    """Kitchen stations working through the queue, one thread each.
+
+    A station prepares one order at a time and then waits with it for a free
+    oven. Stations that can't get an oven don't take new orders, so the ovens
+    set the pace and no more than `stations` orders are in progress.
+
+    Only one kitchen should run per database: starting it puts the orders
+    left in progress by the last one back in the queue.
+    """
+
+    def __init__(self, db: Database, stations: int = 4, ovens: int = 2, bake_seconds: float = BAKE_SECONDS,
+                 speed: float = 1, poll_interval: float = POLL_INTERVAL):
+        """Set up the kitchen, without starting it.
+
+        Args:
+            db (Database): Database connection manager.
+            stations (int, optional): Number of stations preparing orders. Defaults to 4.
+            ovens (int, optional): Number of orders that can bake at once. Defaults to 2.
+            bake_seconds (float, optional): Seconds an order bakes. Defaults to `BAKE_SECONDS`.
+            speed (float, optional): How much faster than real time orders are prepared and baked. Defaults to 1.
+            poll_interval (float, optional): Seconds between looks at an empty queue. Defaults to `POLL_INTERVAL`.
+        """
+        self.db = db
+        self.stations = stations
+        self.bake_seconds = bake_seconds
+        self.speed = speed
+        self.poll_interval = poll_interval
+
+        self._ovens = threading.BoundedSemaphore(ovens)
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self) -> None:
+        """Start the stations."""
+
+        release_claims(self.db)
+        for i in range(self.stations):
+            thread = threading.Thread(target=self._run_station, args=(f"station-{i + 1}",),
+                                      name=f"kitchen-station-{i + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        """Stop the stations. Orders in progress are picked up again on the next start."""
+
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+    def _wait(self, seconds: float) -> bool:
+        """Spend kitchen time, returns True if the kitchen was stopped meanwhile."""
+        return self._stop.wait(seconds / self.speed)
+
+    def _run_station(self, station: str) -> None:
+        while not self._stop.is_set():
+            if not self.work_one(station):
+                self._stop.wait(self.poll_interval)
+
+    def work_one(self, station: str) -> bool:
+        """Take one order off the queue and make it.
+
+        Args:
+            station (str): Name of the station.
+
+        Returns:
+            bool: False if the queue was empty.
+        """
+
+        if not (job := claim_job(self.db, station)):
+            return False
+        if metrics.enabled:
+            metrics.observe('fastpizza_kitchen_queue_wait_seconds', job["waitSeconds"])
+
+        if self._wait(job["prepSeconds"]):
+            return True
+
+        prepared = time.perf_counter()
+        while not self._ovens.acquire(timeout=self.poll_interval):
+            if self._stop.is_set():
+                return True
+        try:
+            if metrics.enabled:
+                metrics.observe('fastpizza_kitchen_oven_wait_seconds', time.perf_counter() - prepared)
+            start_baking(self.db, job["orderId"])
+            if self._wait(self.bake_seconds):
+                return True
+        finally:
+            self._ovens.release()
+
+        seconds = finish_job(self.db, job["orderId"])
+        if metrics.enabled:
+            metrics.observe('fastpizza_kitchen_order_seconds', seconds)
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the kitchen, show its queue and throughput, or watch orders.")
+    parser.add_argument('command', choices=['run', 'stats', 'watch'])
+    parser.add_argument('--stations', type=int, default=4, help="Orders prepared at once")
+    parser.add_argument('--ovens', type=int, default=2, help="Orders baked at once")
+    parser.add_argument('--bake-seconds', type=float, default=BAKE_SECONDS)
+    parser.add_argument('--speed', type=float, default=1, help="Run the kitchen this many times faster")
+    parser.add_argument('--hours', type=float, default=1, help="Hours of finished orders in the stats")
+    parser.add_argument('--database', default='database.db')
+    args = parser.parse_args()
+
+    # Only the command line needs main, the admin flow imports this module
+    from main import open_database
+    db = open_database(args.database)
+    try:
+        if args.command == 'stats':
+            print(format_kitchen_stats(get_kitchen_stats(db, args.hours), args.hours))
+            return
+
+        if args.command == 'watch':
+            # Kitchen display, every status change of every order
+            with bus.subscribe(db) as events:
+                try:
+                    while event := events.get():
+                        print(f"{event.createdAt} Order #{event.orderId}: {STATUS_NAMES[event.status]}", flush=True)
+                except (SubscriberDropped, KeyboardInterrupt):
+                    pass
+            return
+
+        metrics.start()
+        kitchen = Kitchen(db, args.stations, args.ovens, args.bake_seconds, args.speed)
+        kitchen.start()
+        print(f"Kitchen running with {args.stations} stations and {args.ovens} ovens")
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            kitchen.stop()
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,66 +1,179 @@
+import time
+_started = time.perf_counter()
+
+import argparse
+import importlib
+import os
 import sqlite3
-from os import path
-from flows.account import account_flow
-from flows.order import order_flow
-from flows.orders import orders_flow
-from flows.login import login_flow
-from helpers import create_tables, populate_db, prompt_from_list, LOGOUT
+import sys
+
+import metrics
+from db import Database
+from holds import HoldSweeper
+from helpers import create_tables, migrate, output, populate_db, prompt_from_list, session_io, EXIT, LOGOUT
+from repository import User
+from users import users
+
+# Seeded and analyzed database copied by `open_database`, made by build_template.py
+TEMPLATE_PATH = 'assets/template.db'
+
+# Main menu entries and their flows, as (module, function). Flows are
+# imported when first used, so they don't slow down startup.
+MENU_FLOWS = {
+    'Account': ('flows.account', 'account_flow'),
+    'Order': ('flows.order', 'order_flow'),
+    'View past orders': ('flows.orders', 'orders_flow'),
+    'Admin': ('flows.admin', 'admin_flow'),
+}
+
 
-conn: sqlite3.Connection = None  # Will be set
+def load_flow(module: str, name: str):
+    """Import a flow function."""
+    return getattr(importlib.import_module(module), name)
 
 
-def main_menu_flow(user: dict) -> None:
+def main_menu_flow(user: User, db: Database) -> None:
     """Main menu flow.
 
     Args:
-        user (dict): User data.
+        user (User): Logged in user.
+        db (Database): Database connection manager.
+
+    Raises:
+        LOGOUT: When the user logs out, or the account was deleted.
     """
 
-    print(user['isAdmin'])
+    # Changes made in other sessions show up without logging in again
+    with db.read() as conn:
+        user = users.get(conn, user.id)
+    if not user:
+        output("\nYour account has been deleted.")
+        raise LOGOUT
 
-    match prompt_from_list([
+    choices = [
         'Account',
         'Order',
         'View past orders',
-        *(['Admin', 'Logout'] if user['isAdmin'] else ['Logout']),
+        *(['Admin'] if user.isAdmin else []),
+        'Logout',
         'Exit'
-    ], f'Hello {user["firstName"]}, what would you like to do?'):
-        case 0:
-            account_flow(user, conn)
-        case 1:
-            order_flow(user, conn)
-        case 2:
-            orders_flow(user, conn)
-        case 3:
+    ]
+
+    match choice := choices[prompt_from_list(choices, f'Hello {user.firstName}, what would you like to do?')]:
+        case 'Logout':
             raise LOGOUT
-        case 4:
-            print("\nGoodbye!")
-            exit(0)
+        case 'Exit':
+            output("\nGoodbye!")
+            raise EXIT
 
+    module, name = MENU_FLOWS[choice]
+    flow = load_flow(module, name)
+    with metrics.timer('fastpizza_flow_seconds', flow=name):
+        flow(user, db)
 
-def main():
-    global conn
 
-    # Database setup
-    if not path.exists('database.db'):
-        # Database does not exist
-        conn = create_tables()
-        # Populate the database with test data (Products, Ingredients, etc.)
-        populate_db(conn)
+def session_flow(db: Database) -> None:
+    """Run a session: login and the main menu, until the user exits.
 
-    if not conn:
-        conn = sqlite3.connect('database.db')
+    Args:
+        db (Database): Database connection manager.
 
-    conn.row_factory = sqlite3.Row
+    Raises:
+        EXIT: When the user exits.
+    """
+
+    login_flow = load_flow('flows.login', 'login_flow')
 
     while True:
-        user = login_flow(conn)
+        user = users.acquire(login_flow(db, session_io.get().peer))
         try:
             while True:
-                main_menu_flow(user)
+                main_menu_flow(user, db)
         except LOGOUT:
             # Only happens when the user logs out, this makes the user login again
             pass
+        finally:
+            users.release(user.id)
+
+
+def open_database(path: str = 'database.db') -> Database:
+    """Create, populate and migrate the database as needed.
+
+    Args:
+        path (str, optional): Path to the database. Defaults to 'database.db'.
+
+    Returns:
+        Database: Database connection manager.
+    """
+
+    # Database setup
+    if not os.path.exists(path):
+        if os.path.exists(TEMPLATE_PATH):
+            # Copy the prebuilt database, page by page
+            template = sqlite3.connect(f"file:{TEMPLATE_PATH}?mode=ro", uri=True)
+            conn = sqlite3.connect(path)
+            template.backup(conn)
+            template.close()
+        else:
+            # Database does not exist
+            conn = create_tables(path)
+            # Populate the database with test data (Products, Ingredients, etc.)
+            populate_db(conn)
+        conn.close()
+
+    db = Database(path)
+
+    # Bring new and existing databases up to the latest schema
+    with db.write() as conn:
+        migrate(conn)
+
+    return db
+
+
+class StartupProfileIO:
+    """Console I/O that reports the time to the first prompt and exits there."""
+
+    def __init__(self, io, phases: list):
+        self.io = io
+        self.phases = phases
+        self.peer = io.peer
+
+    def write(self, text: str) -> None:
+        self.io.write(text)
+
+    def read_line(self, prompt: str = "") -> str:
+        self.phases.append(("first prompt", time.perf_counter()))
+
+        report = ["\nStartup profile:"]
+        last = _started
+        for phase, at in self.phases:
+            report.append(f"  {phase:<16}{(at - last) * 1000:8.1f} ms")
+            last = at
+        report.append(f"  {'total':<16}{(last - _started) * 1000:8.1f} ms")
+        print("\n".join(report), file=sys.stderr)
+        raise EXIT
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FastPizza in the terminal.")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="Report the time to the first prompt and exit")
+    args = parser.parse_args()
+
+    phases = [("imports", time.perf_counter())]
+
+    metrics.start()
+    db = open_database()
+    HoldSweeper(db).start()
+    phases.append(("open database", time.perf_counter()))
+
+    if args.profile_startup:
+        session_io.set(StartupProfileIO(session_io.get(), phases))
+
+    try:
+        session_flow(db)
+    except EXIT:
+        exit(0)
 
 
 if __name__ == '__main__':
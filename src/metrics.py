@@ -0,0 +1,266 @@
+import atexit
+import bisect
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import nullcontext
+from functools import lru_cache
+
+# Instrumentation is off unless FASTPIZZA_METRICS is set, and then costs
+# nothing but a flag check at the instrumented places
+enabled = os.environ.get('FASTPIZZA_METRICS', '') not in ('', '0', 'false', 'no')
+# Statements slower than this are written to the slow query log
+SLOW_QUERY_MS = float(os.environ.get('FASTPIZZA_SLOW_QUERY_MS', 100))
+SLOW_QUERY_LOG = os.environ.get('FASTPIZZA_SLOW_QUERY_LOG', 'slow-queries.log')
+# Prometheus text file to write every EXPORT_INTERVAL seconds (for the
+# node_exporter textfile collector), if set
+EXPORT_FILE = os.environ.get('FASTPIZZA_METRICS_FILE')
+EXPORT_INTERVAL = float(os.environ.get('FASTPIZZA_METRICS_INTERVAL', 15))
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Buckets of metrics that are measured in minutes rather than milliseconds
+KITCHEN_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 900, 1200, 1800, 2700, 3600)
+METRIC_BUCKETS = {
+    'fastpizza_kitchen_queue_wait_seconds': KITCHEN_BUCKETS,
+    'fastpizza_kitchen_oven_wait_seconds': KITCHEN_BUCKETS,
+    'fastpizza_kitchen_order_seconds': KITCHEN_BUCKETS,
+}
+
+HELP = {
+    'fastpizza_sql_seconds': "Time executing SQL statements, by statement",
+    'fastpizza_sql_statements_total': "Statements run by SQLite, including by triggers, by kind",
+    'fastpizza_flow_seconds': "Time spent in main menu flows, by flow",
+    'fastpizza_bcrypt_seconds': "Time spent on password hashing and checks, including the queue",
+    'fastpizza_db_lock_wait_seconds': "Time blocked waiting for the database write lock",
+    'fastpizza_kitchen_queue_wait_seconds': "Time from placing an order until a kitchen station takes it",
+    'fastpizza_kitchen_oven_wait_seconds': "Time prepared orders wait for a free oven",
+    'fastpizza_kitchen_order_seconds': "Time from placing an order until it is ready, its count is the throughput",
+    'fastpizza_status_events_total': "Order status changes handed to the subscribers in this process",
+    'fastpizza_status_subscribers_dropped_total': "Status subscribers dropped for falling behind",
+    'fastpizza_expired_carts_total': "Abandoned carts whose stock holds were released by the sweeper",
+    'fastpizza_hold_sweep_errors_total': "Hold sweeps that failed with an error other than a busy database",
+    'fastpizza_archived_orders_total': "Completed orders moved to the monthly archive databases",
+}
+
+# First keyword of a statement, after any comments
+STATEMENT_KIND = re.compile(r"(?:\s+|--[^\n]*(?:\n|$))*([A-Za-z]+)")
+
+slow_query_log = logging.getLogger('fastpizza.slow_query')
+
+
+class Histogram:
+    """Prometheus style histogram with fixed buckets."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+# (metric name, label pairs) -> Histogram or count
+_histograms = {}
+_counters = {}
+_lock = threading.Lock()
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    """Record a duration in a histogram."""
+
+    key = (name, tuple(labels.items()))
+    with _lock:
+        if (histogram := _histograms.get(key)) is None:
+            histogram = _histograms[key] = Histogram(METRIC_BUCKETS.get(name, BUCKETS))
+        histogram.observe(seconds)
+
+
+def increment(name: str, value: int = 1, **labels) -> None:
+    """Add to a counter, one by default."""
+
+    key = (name, tuple(labels.items()))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+class _Timer:
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+_disabled_timer = nullcontext()
+
+
+def timer(name: str, **labels):
+    """Context manager recording the time spent in it, if instrumentation is enabled."""
+    return _Timer(name, labels) if enabled else _disabled_timer
+
+
+@lru_cache(maxsize=1024)
+def statement_label(sql: str) -> str:
+    """Statement text with whitespace collapsed, used as label."""
+    return " ".join(sql.split())
+
+
+def _record_statement(sql: str, seconds: float) -> None:
+    statement = statement_label(sql)
+    observe('fastpizza_sql_seconds', seconds, statement=statement)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        slow_query_log.warning("%.1f ms %s", seconds * 1000, statement)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor timing every statement it executes.
+
+    Rows fetched after the first one are not part of the time.
+    """
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record_statement(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record_statement(sql, time.perf_counter() - start)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors are instrumented.
+
+    `sqlite3.Connection.execute` and friends create their cursor without
+    going through `cursor`, so they are overridden to use it.
+    """
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def trace(statement: str) -> None:
+    """Trace callback counting every statement SQLite runs, by kind.
+
+    Unlike the cursor timings this includes implicit BEGIN/COMMITs, scripts and
+    the statements triggers run, which are traced again with the text of the
+    statement that fired them.
+    """
+    match = STATEMENT_KIND.match(statement)
+    increment('fastpizza_sql_statements_total', kind=match.group(1).upper() if match else 'OTHER')
+
+
+def connection_factory():
+    """Connection class for `sqlite3.connect`."""
+    return InstrumentedConnection if enabled else sqlite3.Connection
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs: tuple, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in pairs]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def render() -> str:
+    """Render all metrics in the Prometheus text format."""
+
+    with _lock:
+        histograms = sorted((key, (h.buckets, list(h.counts), h.sum, h.count)) for key, h in _histograms.items())
+        counters = sorted(_counters.items())
+
+    lines = []
+    seen = set()
+
+    def header(name, kind):
+        if name not in seen:
+            seen.add(name)
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, pairs), (buckets, counts, total, count) in histograms:
+        header(name, 'histogram')
+        cumulative = 0
+        for bound, n in zip((*buckets, '+Inf'), counts):
+            cumulative += n
+            le = f'le="{bound}"'
+            lines.append(f"{name}_bucket{_labels(pairs, le)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(pairs)} {total}")
+        lines.append(f"{name}_count{_labels(pairs)} {count}")
+
+    for (name, pairs), value in counters:
+        header(name, 'counter')
+        lines.append(f"{name}{_labels(pairs)} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+def write_file(path: str) -> None:
+    """Write the metrics to a file, atomically."""
+
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(render())
+    os.replace(tmp, path)
+
+
+def start() -> None:
+    """Set up the slow query log and the metrics file, if instrumentation is enabled.
+
+    Called once by the entry points (terminal, server, API).
+    """
+
+    if not enabled:
+        return
+
+    if not slow_query_log.handlers:
+        handler = logging.FileHandler(SLOW_QUERY_LOG) if SLOW_QUERY_LOG != '-' else logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        slow_query_log.addHandler(handler)
+        slow_query_log.propagate = False
+
+    if EXPORT_FILE:
+        def export():
+            while True:
+                time.sleep(EXPORT_INTERVAL)
+                write_file(EXPORT_FILE)
+
+        threading.Thread(target=export, name='metrics-export', daemon=True).start()
+        atexit.register(write_file, EXPORT_FILE)
+
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import metrics
+
+# bcrypt work factor for new hashes, older hashes are upgraded on login
+ROUNDS = int(os.environ.get('FASTPIZZA_BCRYPT_ROUNDS', 12))
+# 'thread' or 'process'
+POOL = os.environ.get('FASTPIZZA_BCRYPT_POOL', 'thread')
+WORKERS = int(os.environ.get('FASTPIZZA_BCRYPT_WORKERS', os.cpu_count() or 2))
+# Max number of hashing jobs running or waiting, and how many seconds a
+# further job waits for a free slot before it is refused
+QUEUE_SIZE = int(os.environ.get('FASTPIZZA_BCRYPT_QUEUE', WORKERS * 4))
+QUEUE_TIMEOUT = float(os.environ.get('FASTPIZZA_BCRYPT_QUEUE_TIMEOUT', 5))
+# Password checks allowed per source in a burst, and refilled per minute
+RATE_BURST = int(os.environ.get('FASTPIZZA_LOGIN_BURST', 5))
+RATE_PER_MINUTE = float(os.environ.get('FASTPIZZA_LOGIN_RATE', 10))
+
+
+class PasswordBusy(Exception):
+    """Exception to be raised when the hashing queue is full."""
+    pass
+
+
+class RateLimited(Exception):
+    """Exception to be raised when a source checks passwords too often."""
+    pass
+
+
+class RateLimiter:
+    """Token bucket rate limiter per source (email, remote address, ...)."""
+
+    def __init__(self, burst: int, per_minute: float, max_sources: int = 10000):
+        self.burst = burst
+        self.rate = per_minute / 60
+        self.max_sources = max_sources
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, source: str) -> bool:
+        """Take a token for a source.
+
+        Args:
+            source (str): Source of the request.
+
+        Returns:
+            bool: False if the source is over its limit.
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) >= self.max_sources:
+                self._prune(now)
+
+            tokens, last = self._buckets.get(source, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets[source] = (tokens, now)
+                return False
+
+            self._buckets[source] = (tokens - 1, now)
+            return True
+
+    def _prune(self, now: float) -> None:
+        """Forget sources whose bucket has refilled."""
+
+        for source, (tokens, last) in list(self._buckets.items()):
+            if tokens + (now - last) * self.rate >= self.burst:
+                del self._buckets[source]
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(QUEUE_SIZE)
+limiter = RateLimiter(RATE_BURST, RATE_PER_MINUTE)
+
+
+def _get_executor():
+    """Start the worker pool on first use."""
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if POOL == 'process':
+                _executor = ProcessPoolExecutor(max_workers=WORKERS)
+            else:
+                _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='bcrypt')
+        return _executor
+
+
+def _run(fn, *args):
+    """Run a bcrypt call in the worker pool and wait for the result."""
+
+    with metrics.timer('fastpizza_bcrypt_seconds', op=fn.__name__.strip('_')):
+        if not _slots.acquire(timeout=QUEUE_TIMEOUT):
+            raise PasswordBusy("Too many password checks in progress")
+
+        try:
+            future = _get_executor().submit(fn, *args)
+        except BaseException:
+            _slots.release()
+            raise
+
+        future.add_done_callback(lambda _: _slots.release())
+        return future.result()
+
+
+# bcrypt is imported on first use, so it doesn't slow down startup
+def _hash(password: bytes, rounds: int) -> bytes:
+    import bcrypt
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check(password: bytes, hashed: bytes) -> bool:
+    import bcrypt
+    return bcrypt.checkpw(password, hashed)
+
+
+def hash_password(password: str) -> str:
+    """Hash a password at the configured work factor.
+
+    Args:
+        password (str): Plain text password.
+
+    Returns:
+        str: bcrypt hash.
+    """
+    return _run(_hash, password.encode('utf-8'), ROUNDS).decode('utf-8')
+
+
+def check_password(password: str, hashed: str, source: str = None) -> bool:
+    """Check a password against a hash.
+
+    Args:
+        password (str): Plain text password.
+        hashed (str): bcrypt hash.
+        source (str, optional): Who is asking, used for rate limiting.
+
+    Raises:
+        RateLimited: If the source has checked too many passwords lately.
+        PasswordBusy: If too many checks are already queued.
+
+    Returns:
+        bool: True if the password matches.
+    """
+
+    if source is not None and not limiter.take(source):
+        raise RateLimited("Too many attempts")
+
+    return _run(_check, password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def needs_rehash(hashed: str) -> bool:
+    """Check if a hash was made with a lower work factor than configured.
+
+    Args:
+        hashed (str): bcrypt hash, e.g. `$2b$12$...`.
+
+    Returns:
+        bool: True if the hash should be upgraded.
+    """
+
+    try:
+        return int(hashed.split('$')[2]) < ROUNDS
+    except (IndexError, ValueError):
+        return True
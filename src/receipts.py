@@ -0,0 +1,141 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from archive import get_archived_receipt
+
+# Max number of receipts kept in memory
+CACHE_SIZE = int(os.environ.get('FASTPIZZA_RECEIPT_CACHE', 1024))
+
+SNAPSHOT_RECEIPT = """
+    INSERT INTO OrderReceipt
+        (orderId, userId, receipt, createdAt)
+    SELECT
+        o.id,
+        o.userId,
+        json_object(
+            'orderId', o.id,
+            'createdAt', o.createdAt,
+            'placedAt', :now,
+            'items', json((
+                SELECT json_group_array(json_object(
+                    'name', p.name,
+                    'amount', oi.amount,
+                    'price', p.price,
+                    'lineTotal', oi.amount * p.price,
+                    'comment', oi.comment,
+                    'toppings', json((
+                        SELECT json_group_array(json_object('name', i.name, 'amount', t.amount))
+                        FROM IngredientOrderItemTopping t
+                        JOIN Ingredient i ON
+                            i.id = t.ingredientId
+                        WHERE t.orderItemId = oi.id
+                    ))
+                ))
+                FROM OrderItem oi
+                JOIN Product p ON
+                    p.id = oi.productId
+                WHERE oi.orderId = o.id
+            )),
+            'total', o.total
+        ),
+        :now
+    FROM `Order` o
+    WHERE o.id = :order_id
+"""
+
+
+def snapshot_receipt(cur: sqlite3.Cursor, order_id: int, now: datetime) -> None:
+    """Store the receipt of an order that is being placed.
+
+    Must run in the transaction that places the order, after its total is final.
+
+    Args:
+        cur (sqlite3.Cursor): Cursor in the placing transaction.
+        order_id (int): Order id.
+        now (datetime): Time the order was placed.
+    """
+    cur.execute(SNAPSHOT_RECEIPT, {"order_id": order_id, "now": now})
+
+
+def render_receipt(receipt: dict) -> str:
+    """Format a receipt for the terminal."""
+
+    lines = [
+        "Receipt:\n",
+        "--------",
+        f"Order #{receipt['orderId']}",
+        f"Created at {receipt['createdAt']}",
+        "Items:",
+    ]
+    for item in receipt['items']:
+        lines.append(f"- {item['amount']}x {item['name']} @ {item['price']} kr")
+        for topping in item['toppings']:
+            lines.append(f"   + {topping['amount']}x {topping['name']}")
+        if item['comment']:
+            lines.append(f"   >>: {item['comment']}")
+    lines.append(f"Total: {receipt['total']}")
+    lines.append("--------")
+    return "\n".join(lines)
+
+
+class ReceiptCache:
+    """In-process LRU cache of placed orders' receipts.
+
+    Receipts never change once stored, so there is nothing to invalidate:
+    entries are only evicted when the cache is full.
+    """
+
+    def __init__(self, size: int = CACHE_SIZE):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+
+        # orderId -> (userId, receipt, rendered receipt), least recently used first
+        self._receipts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, conn: sqlite3.Connection, user_id: int, order_id: int) -> tuple:
+        """Get the receipt of one of the user's orders.
+
+        Args:
+            conn (sqlite3.Connection): Database connection, used on a miss.
+            user_id (int): User id, the order must belong to the user.
+            order_id (int): Order id.
+
+        Returns:
+            tuple: The receipt as a dict and rendered as text, or None if there is no such receipt.
+        """
+
+        with self._lock:
+            if (entry := self._receipts.get(order_id)) is not None:
+                self._receipts.move_to_end(order_id)
+                self.hits += 1
+                return entry[1:] if entry[0] == user_id else None
+
+        row = conn.execute(
+            "SELECT userId, receipt FROM OrderReceipt WHERE orderId = ?", (order_id,)).fetchone()
+        if not row:
+            # Moved to an archive with its order
+            row = get_archived_receipt(conn, user_id, order_id)
+        if not row:
+            return None
+
+        receipt = json.loads(row[1])
+        entry = (row[0], receipt, render_receipt(receipt))
+
+        with self._lock:
+            self.misses += 1
+            self._receipts[order_id] = entry
+            self._receipts.move_to_end(order_id)
+            while len(self._receipts) > self.size:
+                self._receipts.popitem(last=False)
+
+        return entry[1:] if entry[0] == user_id else None
+
+
+# Shared by all flows in this process
+receipts = ReceiptCache()
@@ -0,0 +1,241 @@
+import argparse
+import sqlite3
+
+from archive import archive_months, attached
+from db import Database
+
+# Rollup periods, see the RollupPeriod table
+PERIODS = ['hour', 'day', 'month']
+
+# Recompute every rollup from the placed orders. Product revenue uses today's
+# prices, the incremental rollups use the prices at purchase time.
+CLEAR_ROLLUPS = [
+    "DELETE FROM SalesRollup",
+    "DELETE FROM ProductSalesRollup",
+    "DELETE FROM ToppingUsageRollup",
+]
+
+# Rollup rows of the orders in a schema (`main` or an attached `archive`), per
+# rollup table, with the statement adding archived rows to the hot ones
+ROLLUP_ROWS = [
+    ("SalesRollup", """
+    SELECT
+        rp.period, strftime(rp.format, o.placedAt), COUNT(*), SUM(o.total)
+    FROM main.RollupPeriod rp, {schema}.`Order` o
+    WHERE o.status <> 0
+    GROUP BY 1, 2
+    """, """
+    INSERT INTO SalesRollup
+        (period, bucket, orders, revenue)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (period, bucket) DO UPDATE SET
+        orders = orders + excluded.orders,
+        revenue = revenue + excluded.revenue
+    """),
+    ("ProductSalesRollup", """
+    SELECT
+        rp.period, strftime(rp.format, o.placedAt), oi.productId, SUM(oi.amount), SUM(oi.amount * p.price)
+    FROM main.RollupPeriod rp, {schema}.`Order` o
+    JOIN {schema}.OrderItem oi ON
+        oi.orderId = o.id
+    JOIN main.Product p ON
+        p.id = oi.productId
+    WHERE o.status <> 0
+    GROUP BY 1, 2, 3
+    """, """
+    INSERT INTO ProductSalesRollup
+        (period, bucket, productId, units, revenue)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (period, bucket, productId) DO UPDATE SET
+        units = units + excluded.units,
+        revenue = revenue + excluded.revenue
+    """),
+    ("ToppingUsageRollup", """
+    SELECT
+        rp.period, strftime(rp.format, o.placedAt), t.ingredientId, SUM(t.amount * oi.amount)
+    FROM main.RollupPeriod rp, {schema}.`Order` o
+    JOIN {schema}.OrderItem oi ON
+        oi.orderId = o.id
+    JOIN {schema}.IngredientOrderItemTopping t ON
+        t.orderItemId = oi.id
+    WHERE o.status <> 0
+    GROUP BY 1, 2, 3
+    """, """
+    INSERT INTO ToppingUsageRollup
+        (period, bucket, ingredientId, amount)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (period, bucket, ingredientId) DO UPDATE SET
+        amount = amount + excluded.amount
+    """),
+]
+
+
+def rebuild_rollups(db: Database) -> int:
+    """Recompute the sales rollups from scratch, in one transaction.
+
+    Archived orders are included. Their rows are read on a reader connection
+    with each monthly archive attached, since nothing can be attached inside
+    the transaction, and added to the rows of the hot orders.
+
+    Args:
+        db (Database): Database connection manager.
+
+    Returns:
+        int: Number of rollup rows written.
+    """
+
+    def rebuild(cur: sqlite3.Cursor) -> int:
+        for statement in CLEAR_ROLLUPS:
+            cur.execute(statement)
+
+        for table, rows, _ in ROLLUP_ROWS:
+            cur.execute(f"INSERT INTO {table} {rows.format(schema='main')}")
+
+        with db.read() as conn:
+            for month in archive_months(conn):
+                with attached(conn, month):
+                    for _, rows, upsert in ROLLUP_ROWS:
+                        cur.executemany(upsert, conn.execute(rows.format(schema='archive')).fetchall())
+
+        return sum(cur.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table, _, _ in ROLLUP_ROWS)
+
+    return db.transaction(rebuild)
+
+
+def get_sales(db: Database, period: str, limit: int = 12) -> list:
+    """Get orders and revenue for the latest buckets of a period.
+
+    Args:
+        db (Database): Database connection manager.
+        period (str): One of `PERIODS`.
+        limit (int, optional): Number of buckets. Defaults to 12.
+
+    Returns:
+        list: Buckets with `bucket`, `orders` and `revenue`, newest first.
+    """
+
+    with db.read() as conn:
+        return conn.execute("""
+            SELECT
+                bucket, orders, revenue
+            FROM SalesRollup
+            WHERE period = ?
+            ORDER BY bucket DESC
+            LIMIT ?
+        """, (period, limit)).fetchall()
+
+
+def get_product_sales(db: Database, period: str, since: str) -> list:
+    """Get units sold and revenue per product from a bucket onwards.
+
+    Args:
+        db (Database): Database connection manager.
+        period (str): One of `PERIODS`.
+        since (str): First bucket to include.
+
+    Returns:
+        list: Products with `name`, `units` and `revenue`, best selling first.
+    """
+
+    with db.read() as conn:
+        return conn.execute("""
+            SELECT
+                p.name, r.units, r.revenue
+            FROM (
+                SELECT
+                    productId, SUM(units) AS units, SUM(revenue) AS revenue
+                FROM ProductSalesRollup
+                WHERE period = ?
+                      AND bucket >= ?
+                GROUP BY productId
+            ) r
+            JOIN Product p ON
+                p.id = r.productId
+            ORDER BY r.units DESC
+        """, (period, since)).fetchall()
+
+
+def get_topping_usage(db: Database, period: str, since: str) -> list:
+    """Get the amount of each topping used from a bucket onwards.
+
+    Args:
+        db (Database): Database connection manager.
+        period (str): One of `PERIODS`.
+        since (str): First bucket to include.
+
+    Returns:
+        list: Toppings with `name` and `amount`, most used first.
+    """
+
+    with db.read() as conn:
+        return conn.execute("""
+            SELECT
+                i.name, r.amount
+            FROM (
+                SELECT
+                    ingredientId, SUM(amount) AS amount
+                FROM ToppingUsageRollup
+                WHERE period = ?
+                      AND bucket >= ?
+                GROUP BY ingredientId
+            ) r
+            JOIN Ingredient i ON
+                i.id = r.ingredientId
+            ORDER BY r.amount DESC
+        """, (period, since)).fetchall()
+
+
+def format_report(db: Database, period: str, limit: int = 12) -> str:
+    """Render the sales report of a period as text.
+
+    Args:
+        db (Database): Database connection manager.
+        period (str): One of `PERIODS`.
+        limit (int, optional): Number of buckets. Defaults to 12.
+
+    Returns:
+        str: The report.
+    """
+
+    sales = get_sales(db, period, limit)
+    if not sales:
+        return "No sales yet."
+
+    lines = [f"Sales per {period}:", f"{'':<17}{'Orders':>8}{'Revenue':>12}"]
+    for s in sales:
+        lines.append(f"{s['bucket']:<17}{s['orders']:>8}{s['revenue']:>12.2f}")
+
+    since = sales[-1]['bucket']
+    lines.append(f"\nProducts since {since}:")
+    for p in get_product_sales(db, period, since):
+        lines.append(f"{p['units']:>6}x {p['name']} - {p['revenue']:.2f} kr")
+
+    lines.append(f"\nToppings since {since}:")
+    for t in get_topping_usage(db, period, since):
+        lines.append(f"{t['amount']:>6}x {t['name']}")
+
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sales reports from the rollup tables.")
+    parser.add_argument('command', choices=['show', 'rebuild'])
+    parser.add_argument('period', nargs='?', choices=PERIODS, default='day')
+    parser.add_argument('--limit', type=int, default=12, help="Number of periods to show")
+    parser.add_argument('--database', default='database.db')
+    args = parser.parse_args()
+
+    # Only the command line needs main, the admin flow imports this module
+    from main import open_database
+    db = open_database(args.database)
+    try:
+        if args.command == 'rebuild':
+            print(f"Rebuilt sales rollups ({rebuild_rollups(db)} rows)")
+        else:
+            print(format_report(db, args.period, args.limit))
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,503 @@
+import json
+import sqlite3
+from datetime import datetime
+from typing import Iterator, NamedTuple
+
+# Every statement the flows run on User, Order, OrderItem, Product and
+# Ingredient lives here, as a constant. sqlite3 keeps the prepared statement
+# of each distinct SQL text in the per-connection statement cache, so running
+# the same constant again skips parsing and planning.
+#
+# Rows come back as plain tuples and are turned into the record types below,
+# instead of going through sqlite3.Row and dict copies. Functions take a
+# connection, or the cursor of a transaction.
+
+# Rows fetched per round trip when streaming a result set
+FETCH_SIZE = 256
+
+
+class User(NamedTuple):
+    id: int
+    email: str
+    password: str
+    firstName: str
+    lastName: str
+    isAdmin: bool
+    version: int
+
+
+class Product(NamedTuple):
+    id: int
+    name: str
+    description: str
+    price: float
+    prepSeconds: int
+
+
+class Ingredient(NamedTuple):
+    id: int
+    name: str
+    isTopping: bool
+
+
+class ProductIngredient(NamedTuple):
+    productId: int
+    ingredientId: int
+    amount: int
+
+
+class PastOrder(NamedTuple):
+    id: int
+    status: int
+    itemsCount: int
+    total: float
+    createdAt: str
+
+
+class CartTopping(NamedTuple):
+    name: str
+    amount: int
+
+
+class CartItem(NamedTuple):
+    orderItemId: int
+    amount: int
+    comment: str
+    name: str
+    price: float
+    lineTotal: float
+    toppings: list
+
+
+class OpenOrder(NamedTuple):
+    orderId: int
+    items: list
+    total: float
+
+    def as_dict(self) -> dict:
+        """The order as plain JSON data."""
+        return {
+            "orderId": self.orderId,
+            "items": [{**item._asdict(), "toppings": [t._asdict() for t in item.toppings]} for item in self.items],
+            "total": self.total,
+        }
+
+
+def _tuples(conn: sqlite3.Connection) -> sqlite3.Cursor:
+    """A cursor returning plain tuples, whatever the connection's row factory."""
+
+    if isinstance(conn, sqlite3.Cursor):
+        conn = conn.connection
+    cur = conn.cursor()
+    cur.row_factory = None
+    return cur
+
+
+def fetch_one(conn: sqlite3.Connection, record: type, sql: str, params=()) -> tuple:
+    """Run a query and return its first row as a record, or None."""
+
+    row = _tuples(conn).execute(sql, params).fetchone()
+    return record._make(row) if row else None
+
+
+def stream(conn: sqlite3.Connection, record: type, sql: str, params=(), size: int = FETCH_SIZE) -> Iterator:
+    """Run a query and yield its rows as records, `size` rows at a time.
+
+    Only one batch is in memory at once. The connection must stay borrowed
+    until the iterator is exhausted.
+    """
+
+    cur = _tuples(conn).execute(sql, params)
+    while rows := cur.fetchmany(size):
+        yield from map(record._make, rows)
+
+
+########
+# USER #
+########
+
+USER_COLUMNS = "id, email, password, firstName, lastName, isAdmin, version"
+
+USER_BY_EMAIL = f"SELECT {USER_COLUMNS} FROM User WHERE email = ?"
+
+# Users by id, params: (JSON array of ids,). One statement text for any number of ids.
+USERS_BY_ID = f"SELECT {USER_COLUMNS} FROM User WHERE id IN (SELECT value FROM json_each(?))"
+
+USER_VERSIONS = "SELECT id, version FROM User WHERE id IN (SELECT value FROM json_each(?))"
+
+INSERT_USER = f"""
+    INSERT INTO User
+        (email, password, firstName, lastName, isAdmin, updatedAt)
+    VALUES
+        (?, ?, ?, ?, ?, ?)
+    RETURNING {USER_COLUMNS}
+"""
+
+# Updates bump the version themselves, so the returned row is the new one
+UPDATE_USER_PASSWORD = f"UPDATE User SET password = ?, version = version + 1 WHERE id = ? RETURNING {USER_COLUMNS}"
+
+UPDATE_USER_NAME = f"""
+    UPDATE User SET
+        firstName = ?,
+        lastName = ?,
+        version = version + 1
+    WHERE id = ?
+    RETURNING {USER_COLUMNS}
+"""
+
+DELETE_USER = "DELETE FROM User WHERE id = ?"
+
+
+def get_user_by_email(conn: sqlite3.Connection, email: str) -> User:
+    """Get a user by their email, or None."""
+    return fetch_one(conn, User, USER_BY_EMAIL, (email,))
+
+
+def insert_user(conn: sqlite3.Connection, email: str, password: str, first_name: str, last_name: str,
+                is_admin: bool) -> User:
+    """Create a user, raises sqlite3.IntegrityError if the email is taken."""
+    return fetch_one(conn, User, INSERT_USER,
+                     (email, password, first_name, last_name, is_admin, datetime.now()))
+
+
+def iter_users(conn: sqlite3.Connection, user_ids: list) -> Iterator[User]:
+    return stream(conn, User, USERS_BY_ID, (json.dumps(user_ids),))
+
+
+def get_user_versions(conn: sqlite3.Connection, user_ids: list) -> dict:
+    """Get the version of every user that still exists, by id."""
+    return dict(_tuples(conn).execute(USER_VERSIONS, (json.dumps(user_ids),)).fetchall())
+
+
+def update_user_password(conn: sqlite3.Connection, user_id: int, password: str) -> User:
+    """Change a user's password, returns the updated user or None."""
+    return fetch_one(conn, User, UPDATE_USER_PASSWORD, (password, user_id))
+
+
+def update_user_name(conn: sqlite3.Connection, user_id: int, first_name: str, last_name: str) -> User:
+    """Change a user's name, returns the updated user or None."""
+    return fetch_one(conn, User, UPDATE_USER_NAME, (first_name, last_name, user_id))
+
+
+def delete_user(conn: sqlite3.Connection, user_id: int) -> None:
+    conn.execute(DELETE_USER, (user_id,))
+
+
+#########
+# ORDER #
+#########
+
+# The open order with its items and toppings in one query, params: (userId,)
+OPEN_ORDER = """
+    SELECT
+        orderId,
+        json_group_array(json_array(
+            orderItemId, amount, comment, name, price, amount * price, json(toppings)
+        )) AS items,
+        SUM(amount * price) AS total
+    FROM (
+        SELECT
+            o.id AS orderId, oi.id AS orderItemId, oi.amount, oi.comment, p.name, p.price,
+            (
+                SELECT json_group_array(json_array(i.name, t.amount))
+                FROM IngredientOrderItemTopping t
+                JOIN Ingredient i ON
+                    t.ingredientId = i.id
+                WHERE t.orderItemId = oi.id
+            ) AS toppings
+        FROM `Order` o
+        JOIN OrderItem oi ON
+            o.id = oi.orderId
+        JOIN Product p ON
+            oi.productId = p.id
+        WHERE o.userId = ?
+              AND o.status = 0
+        ORDER BY oi.id
+    )
+    GROUP BY orderId
+"""
+
+OPEN_ORDER_ID = """
+    SELECT id FROM `Order`
+    WHERE userId = ?
+          AND status = 0
+"""
+
+# The open order, if it has anything to place
+PLACEABLE_ORDER_ID = """
+    SELECT o.id
+    FROM `Order` o
+    WHERE o.userId = ?
+          AND o.status = 0
+          AND EXISTS (SELECT 1 FROM OrderItem oi WHERE oi.orderId = o.id)
+"""
+
+INSERT_ORDER = """
+    INSERT INTO `Order`
+        (userId, status, updatedAt)
+    VALUES
+        (?, 0, ?)
+"""
+
+TOUCH_ORDER = "UPDATE `Order` SET updatedAt = ?, holdExpiresAt = ? WHERE id = ?"
+
+# Prices may have changed while the order was open, so the stored total is
+# recomputed once here and frozen from then on
+PLACE_ORDER = """
+    UPDATE `Order` SET
+        status = 1,
+        total = COALESCE((
+            SELECT SUM(oi.amount * p.price)
+            FROM OrderItem oi
+            JOIN Product p ON
+                p.id = oi.productId
+            WHERE oi.orderId = `Order`.id
+        ), 0),
+        placedAt = :now,
+        updatedAt = :now
+    WHERE id = :order_id
+"""
+
+ORDER_STATUS = "SELECT status FROM `Order` WHERE id = ? AND userId = ?"
+
+PAST_ORDER_COLUMNS = "id, status, itemsCount, total, createdAt"
+
+# Pages of placed orders, newest first, keyed on (createdAt, id)
+PAST_ORDERS = f"""
+    SELECT
+        {PAST_ORDER_COLUMNS}
+    FROM `Order`
+    WHERE
+        userId = ?
+        AND status <> 0
+    ORDER BY
+        createdAt DESC, id DESC
+    LIMIT ?
+"""
+
+PAST_ORDERS_BEFORE = f"""
+    SELECT
+        {PAST_ORDER_COLUMNS}
+    FROM `Order`
+    WHERE
+        userId = ?
+        AND status <> 0
+        AND (createdAt, id) < (?, ?)
+    ORDER BY
+        createdAt DESC, id DESC
+    LIMIT ?
+"""
+
+
+def get_open_order(conn: sqlite3.Connection, user_id: int) -> OpenOrder:
+    """Get the open order with its items, toppings and totals in one query.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        user_id (int): User id.
+
+    Returns:
+        OpenOrder: Open order with its `CartItem`s, or None if the user has no
+            items in an open order.
+    """
+
+    if not (row := _tuples(conn).execute(OPEN_ORDER, (user_id,)).fetchone()):
+        return None
+
+    order_id, items, total = row
+    return OpenOrder(order_id, [
+        CartItem(*item[:6], [CartTopping(*t) for t in item[6]]) for item in json.loads(items)
+    ], total)
+
+
+def get_open_order_id(conn: sqlite3.Connection, user_id: int) -> int:
+    """Get the id of the user's open order, or None."""
+    row = conn.execute(OPEN_ORDER_ID, (user_id,)).fetchone()
+    return row[0] if row else None
+
+
+def get_placeable_order_id(conn: sqlite3.Connection, user_id: int) -> int:
+    """Get the id of the user's open order if it has items, or None."""
+    row = conn.execute(PLACEABLE_ORDER_ID, (user_id,)).fetchone()
+    return row[0] if row else None
+
+
+def insert_order(conn: sqlite3.Connection, user_id: int) -> int:
+    """Open a new order, returns its id."""
+    return conn.execute(INSERT_ORDER, (user_id, datetime.now())).lastrowid
+
+
+def touch_order(conn: sqlite3.Connection, order_id: int, now: datetime, hold_expires_at: datetime) -> None:
+    """Mark an open order as changed, extending its holds."""
+    conn.execute(TOUCH_ORDER, (now, hold_expires_at, order_id))
+
+
+def update_order_placed(conn: sqlite3.Connection, order_id: int, now: datetime) -> None:
+    """Mark an order as placed and freeze its total."""
+    conn.execute(PLACE_ORDER, {"now": now, "order_id": order_id})
+
+
+def get_user_order_status(conn: sqlite3.Connection, user_id: int, order_id: int) -> int:
+    """Get the status of one of the user's orders, or None."""
+    row = conn.execute(ORDER_STATUS, (order_id, user_id)).fetchone()
+    return row[0] if row else None
+
+
+def iter_past_orders(conn: sqlite3.Connection, user_id: int, limit: int, before: tuple = None) -> Iterator[PastOrder]:
+    """Stream a page of the user's placed orders, newest first.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        user_id (int): User id.
+        limit (int): Max number of orders.
+        before (tuple, optional): `(createdAt, id)` of the last order on the previous page.
+    """
+
+    if before is None:
+        return stream(conn, PastOrder, PAST_ORDERS, (user_id, limit))
+    return stream(conn, PastOrder, PAST_ORDERS_BEFORE, (user_id, *before, limit))
+
+
+#############
+# ORDERITEM #
+#############
+
+# Matches an order item in the user's open order, params: (orderItemId, userId)
+OPEN_ORDER_ITEM = """
+    id = ?
+    AND orderId IN (
+        SELECT id FROM `Order`
+        WHERE userId = ?
+              AND status = 0
+    )
+"""
+
+OPEN_ORDER_ITEM_ORDER_ID = f"SELECT orderId FROM OrderItem WHERE {OPEN_ORDER_ITEM}"
+
+INSERT_ORDER_ITEM = """
+    INSERT INTO OrderItem
+        (orderId, productId, amount, comment, updatedAt)
+    VALUES
+        (?, ?, ?, ?, ?)
+"""
+
+INSERT_TOPPING = """
+    INSERT INTO IngredientOrderItemTopping
+        (orderItemId, ingredientId, amount)
+    VALUES
+        (?, ?, ?)
+"""
+
+UPDATE_ORDER_ITEM_AMOUNT = "UPDATE OrderItem SET amount = ?, updatedAt = ? WHERE id = ?"
+
+UPDATE_OPEN_ORDER_ITEM_COMMENT = f"UPDATE OrderItem SET comment = ?, updatedAt = ? WHERE {OPEN_ORDER_ITEM}"
+
+DELETE_ORDER_ITEM_TOPPINGS = "DELETE FROM IngredientOrderItemTopping WHERE orderItemId = ?"
+
+DELETE_ORDER_ITEM = "DELETE FROM OrderItem WHERE id = ?"
+
+DELETE_OPEN_ORDER_TOPPINGS = """
+    DELETE FROM IngredientOrderItemTopping
+    WHERE orderItemId IN (
+        SELECT oi.id
+        FROM `Order` o JOIN OrderItem oi ON
+            o.id = oi.orderId
+        WHERE o.status = 0
+              AND o.userId = ?
+    )
+"""
+
+DELETE_OPEN_ORDER_ITEMS = """
+    DELETE FROM OrderItem
+    WHERE orderId = (
+        SELECT id FROM `Order`
+        WHERE status = 0
+              AND userId = ?
+    )
+"""
+
+
+def get_open_order_item_order_id(conn: sqlite3.Connection, user_id: int, order_item_id: int) -> int:
+    """Get the order of an item in the user's open order, or None if it isn't in it."""
+    row = conn.execute(OPEN_ORDER_ITEM_ORDER_ID, (order_item_id, user_id)).fetchone()
+    return row[0] if row else None
+
+
+def insert_order_item(conn: sqlite3.Connection, order_id: int, product_id: int, amount: int, comment: str,
+                      toppings: list = ()) -> int:
+    """Add an item with its extra toppings to an order, returns its id.
+
+    Toppings are dicts with `ingredientId` and `amount`.
+    """
+
+    order_item_id = conn.execute(INSERT_ORDER_ITEM,
+                                 (order_id, product_id, amount, comment, datetime.now())).lastrowid
+    conn.executemany(INSERT_TOPPING, [(order_item_id, t["ingredientId"], t["amount"]) for t in toppings])
+    return order_item_id
+
+
+def update_order_item_amount(conn: sqlite3.Connection, order_item_id: int, amount: int, now: datetime) -> None:
+    conn.execute(UPDATE_ORDER_ITEM_AMOUNT, (amount, now, order_item_id))
+
+
+def update_open_order_item_comment(conn: sqlite3.Connection, user_id: int, order_item_id: int,
+                                   comment: str) -> bool:
+    """Change the comment of an item, False if it isn't in the user's open order."""
+    return conn.execute(UPDATE_OPEN_ORDER_ITEM_COMMENT,
+                        (comment, datetime.now(), order_item_id, user_id)).rowcount > 0
+
+
+def delete_order_item(conn: sqlite3.Connection, order_item_id: int) -> None:
+    """Remove an item and its toppings."""
+    conn.execute(DELETE_ORDER_ITEM_TOPPINGS, (order_item_id,))
+    conn.execute(DELETE_ORDER_ITEM, (order_item_id,))
+
+
+def delete_open_order_items(conn: sqlite3.Connection, user_id: int) -> int:
+    """Remove all items of the user's open order, returns the number removed."""
+    conn.execute(DELETE_OPEN_ORDER_TOPPINGS, (user_id,))
+    return conn.execute(DELETE_OPEN_ORDER_ITEMS, (user_id,)).rowcount
+
+
+#########################
+# PRODUCT & INGREDIENTS #
+#########################
+
+PRODUCTS = "SELECT id, name, description, price, prepSeconds FROM Product ORDER BY id"
+
+INGREDIENTS = "SELECT id, name, isTopping FROM Ingredient ORDER BY id"
+
+# Live stock, changed by every cart and order, so it is read apart from the
+# rest of the catalog: only the rows changed after a stock revision
+PRODUCT_STOCK = "SELECT id, maxBuildable FROM Product WHERE stockRevision > ?"
+
+INGREDIENT_STOCK = "SELECT id, inStock - held FROM Ingredient WHERE stockRevision > ?"
+
+PRODUCT_INGREDIENTS = """
+    SELECT
+        pi.productId, pi.ingredientId, pi.amount
+    FROM ProductIngredient pi
+    ORDER BY pi.productId, pi.ingredientId
+"""
+
+
+def iter_products(conn: sqlite3.Connection) -> Iterator[Product]:
+    return stream(conn, Product, PRODUCTS)
+
+
+def iter_ingredients(conn: sqlite3.Connection) -> Iterator[Ingredient]:
+    return stream(conn, Ingredient, INGREDIENTS)
+
+
+def iter_product_ingredients(conn: sqlite3.Connection) -> Iterator[ProductIngredient]:
+    return stream(conn, ProductIngredient, PRODUCT_INGREDIENTS)
+
+
+def get_product_stock(conn: sqlite3.Connection, since: int = -1) -> dict:
+    """Get how many of each product changed after a stock revision the stock is enough for, by id."""
+    return dict(_tuples(conn).execute(PRODUCT_STOCK, (since,)).fetchall())
+
+
+def get_ingredient_stock(conn: sqlite3.Connection, since: int = -1) -> dict:
+    """Get the available stock, not held by a cart, of each ingredient changed after a stock revision, by id."""
+    return dict(_tuples(conn).execute(INGREDIENT_STOCK, (since,)).fetchall())
@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import re
+import traceback
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from db import Database
+from helpers import session_io, EXIT
+from holds import HoldSweeper
+from main import open_database, session_flow
+
+# Telnet option negotiation (IAC ...), which we don't support
+TELNET_COMMAND = re.compile(rb"\xff[\xfb-\xfe].|\xff[\xf0-\xfa]")
+
+
+class SocketIO:
+    """Session I/O over a TCP connection.
+
+    The flows run in a worker thread and block on `read_line`, while the
+    socket itself is only touched from the event loop.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 loop: asyncio.AbstractEventLoop, idle_timeout: float):
+        self.reader = reader
+        self.writer = writer
+        self.loop = loop
+        self.idle_timeout = idle_timeout
+        # Client address, used for rate limiting logins
+        peername = writer.get_extra_info('peername')
+        self.peer = peername[0] if peername else None
+
+    def write(self, text: str) -> None:
+        data = text.replace('\n', '\r\n').encode('utf-8')
+        self.loop.call_soon_threadsafe(self.writer.write, data)
+
+    def read_line(self, prompt: str = "") -> str:
+        if prompt:
+            self.write(prompt)
+
+        future = asyncio.run_coroutine_threadsafe(self.reader.readline(), self.loop)
+        try:
+            line = future.result(self.idle_timeout)
+        # Only an alias of the builtin TimeoutError from Python 3.11
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self.write("\nSession timed out.\n")
+            raise EOFError
+
+        if not line:
+            # Connection closed
+            raise EOFError
+
+        return TELNET_COMMAND.sub(b"", line).decode('utf-8', errors='replace').rstrip('\r\n')
+
+
+def run_session(db: Database, io: SocketIO) -> None:
+    """Run one session in a worker thread."""
+
+    token = session_io.set(io)
+    try:
+        session_flow(db)
+    except (EXIT, EOFError, ConnectionError):
+        pass
+    except Exception:
+        # Don't take the other sessions down with this one
+        traceback.print_exc()
+        io.write("\nSomething went wrong, please reconnect.\n")
+    finally:
+        session_io.reset(token)
+
+
+async def serve(host: str, port: int, max_sessions: int, idle_timeout: float) -> None:
+    """Serve ordering sessions over TCP until cancelled.
+
+    Args:
+        host (str): Address to listen on.
+        port (int): Port to listen on.
+        max_sessions (int): Max number of concurrent sessions.
+        idle_timeout (float): Seconds to wait for input before ending a session.
+    """
+
+    metrics.start()
+    db = open_database()
+    sweeper = HoldSweeper(db).start()
+    loop = asyncio.get_running_loop()
+
+    # Every session gets a thread, so database and bcrypt work never blocks the loop
+    executor = ThreadPoolExecutor(max_workers=max_sessions, thread_name_prefix='session')
+    sessions = asyncio.Semaphore(max_sessions)
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        if sessions.locked():
+            writer.write(b"The pizza shop is full, please try again later.\r\n")
+            await writer.drain()
+            writer.close()
+            return
+
+        async with sessions:
+            io = SocketIO(reader, writer, loop, idle_timeout)
+            try:
+                await loop.run_in_executor(executor, run_session, db, io)
+                await writer.drain()
+            finally:
+                writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"Serving FastPizza on {host}:{port}")
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        sweeper.stop()
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve FastPizza sessions over TCP (telnet/netcat).")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=2323)
+    parser.add_argument('--max-sessions', type=int, default=500)
+    parser.add_argument('--idle-timeout', type=float, default=600)
+    args = parser.parse_args()
+
+    asyncio.run(serve(args.host, args.port, args.max_sessions, args.idle_timeout))
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
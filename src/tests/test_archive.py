@@ -0,0 +1,101 @@
+"""Order archive tests, on a small database made from the template.
+
+Run from the src directory:
+
+    python -m unittest discover -s tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from archive import ARCHIVE_DIR, archive_orders
+from catalog import Catalog
+from flows.order import add_order_item, place_order
+from flows.orders import get_past_orders, get_receipt
+from kitchen import READY
+from main import open_database
+from receipts import ReceiptCache
+from repository import insert_user
+
+# Creation times of the orders, two months to archive and a recent one
+CREATED = ['2025-01-10 12:00:00.000000', '2025-01-20 12:00:00.000000', '2025-02-05 12:00:00.000000', None]
+
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = open_database(os.path.join(self.tmp, 'archive.db'))
+
+        with self.db.write() as conn:
+            conn.execute("UPDATE Ingredient SET inStock = 1000")
+            self.user_id = insert_user(conn, "customer@archive.test", "-", "Some", "One", False).id
+            self.other_id = insert_user(conn, "other@archive.test", "-", "Other", "One", False).id
+
+        patcher = mock.patch('flows.order.catalog', Catalog())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.order_ids = []
+        for amount, created in enumerate(CREATED, 1):
+            add_order_item(self.db, self.user_id, 1, amount)
+            order_id = place_order(self.db, self.user_id)
+            with self.db.write() as conn:
+                conn.execute("UPDATE `Order` SET status = ?, createdAt = COALESCE(?, createdAt) WHERE id = ?",
+                             (READY, created, order_id))
+            self.order_ids.append(order_id)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmp)
+
+    def receipt(self, order_id: int, user_id: int = None) -> tuple:
+        """Receipt of an order, past any cached copy."""
+
+        with mock.patch('flows.orders.receipts', ReceiptCache()):
+            return get_receipt(self.db, user_id or self.user_id, order_id)
+
+    def test_round_trip(self):
+        orders = get_past_orders(self.db, self.user_id)
+        receipts = {order_id: self.receipt(order_id) for order_id in self.order_ids}
+        self.assertEqual([o.id for o in orders], self.order_ids[::-1])
+        self.assertNotIn(None, receipts.values())
+
+        self.assertEqual(archive_orders(self.db, batch=2), len(CREATED) - 1)
+
+        with self.db.read() as conn:
+            hot = [row[0] for row in conn.execute("SELECT id FROM `Order`")]
+        self.assertEqual(hot, self.order_ids[-1:])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmp, ARCHIVE_DIR))),
+                         ['orders-2025-01.db', 'orders-2025-02.db'])
+
+        self.assertEqual(get_past_orders(self.db, self.user_id), orders)
+        for order_id, receipt in receipts.items():
+            self.assertEqual(self.receipt(order_id), receipt)
+
+    def test_pages_span_the_archives(self):
+        archive_orders(self.db)
+
+        pages, before = [], None
+        while page := get_past_orders(self.db, self.user_id, 2, before):
+            pages.append([o.id for o in page])
+            before = (page[-1].createdAt, page[-1].id)
+
+        self.assertEqual(pages, [self.order_ids[:1:-1], self.order_ids[1::-1]])
+
+    def test_archived_orders_stay_private(self):
+        archive_orders(self.db)
+
+        self.assertEqual(get_past_orders(self.db, self.other_id), [])
+        self.assertIsNone(self.receipt(self.order_ids[0], self.other_id))
+
+    def test_archiving_again_moves_nothing(self):
+        archive_orders(self.db)
+        self.assertEqual(archive_orders(self.db), 0)
+        self.assertEqual(len(get_past_orders(self.db, self.user_id)), len(CREATED))
+
+
+if __name__ == '__main__':
+    unittest.main()
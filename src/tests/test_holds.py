@@ -0,0 +1,151 @@
+"""Stock hold tests, on a small database made from the template.
+
+Run from the src directory:
+
+    python -m unittest discover -s tests
+"""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from catalog import Catalog
+from db import Database
+from flows.order import add_order_item, place_order
+from helpers import OutOfStock
+from holds import sweep_expired_holds
+from main import open_database
+from repository import insert_user
+
+PRODUCT_ID = 1
+# Pizzas the stock is enough for
+STOCK = 2
+
+
+class StockHoldTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'holds.db')
+        self.db = open_database(self.path)
+
+        with self.db.write() as conn:
+            # Only the recipe of the product is in stock, enough for `STOCK` of it
+            conn.execute("""
+                UPDATE Ingredient SET
+                    inStock = ? * COALESCE((
+                        SELECT amount
+                        FROM ProductIngredient
+                        WHERE productId = ?
+                              AND ingredientId = Ingredient.id
+                    ), 0)
+            """, (STOCK, PRODUCT_ID))
+            self.user_ids = [insert_user(conn, f"customer{i}@holds.test", "-", "Some", "One", False).id
+                             for i in range(4)]
+
+        # A fresh menu, the shared one may have been loaded from another database
+        patcher = mock.patch('flows.order.catalog', Catalog())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmp)
+
+    def stock(self) -> dict:
+        """(inStock, held) of the ingredients of the product, by id."""
+
+        with self.db.read() as conn:
+            return {row[0]: (row[1], row[2]) for row in conn.execute("""
+                SELECT i.id, i.inStock, i.held
+                FROM Ingredient i
+                JOIN ProductIngredient pi ON
+                    pi.ingredientId = i.id
+                WHERE pi.productId = ?
+            """, (PRODUCT_ID,))}
+
+    def max_buildable(self) -> int:
+        with self.db.read() as conn:
+            return conn.execute("SELECT maxBuildable FROM Product WHERE id = ?", (PRODUCT_ID,)).fetchone()[0]
+
+    def test_adding_holds_stock(self):
+        add_order_item(self.db, self.user_ids[0], PRODUCT_ID, 1)
+
+        for in_stock, held in self.stock().values():
+            self.assertEqual(held, in_stock // STOCK)
+        self.assertEqual(self.max_buildable(), STOCK - 1)
+
+    def test_out_of_stock_writes_nothing(self):
+        before = self.stock()
+
+        with self.assertRaises(OutOfStock):
+            add_order_item(self.db, self.user_ids[0], PRODUCT_ID, STOCK + 1)
+
+        self.assertEqual(self.stock(), before)
+        with self.db.read() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM OrderItem").fetchone()[0], 0)
+
+    def test_held_stock_is_not_available(self):
+        add_order_item(self.db, self.user_ids[0], PRODUCT_ID, STOCK)
+
+        with self.assertRaises(OutOfStock):
+            add_order_item(self.db, self.user_ids[1], PRODUCT_ID, 1)
+
+    def test_placing_takes_held_stock(self):
+        add_order_item(self.db, self.user_ids[0], PRODUCT_ID, STOCK)
+
+        self.assertIsNotNone(place_order(self.db, self.user_ids[0]))
+
+        self.assertEqual(set(self.stock().values()), {(0, 0)})
+        with self.db.read() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM StockHold").fetchone()[0], 0)
+        # Nothing left to place
+        self.assertIsNone(place_order(self.db, self.user_ids[0]))
+
+    def test_expired_cart_is_out_of_stock_when_taken(self):
+        add_order_item(self.db, self.user_ids[0], PRODUCT_ID, STOCK)
+        sweep_expired_holds(self.db, datetime.now() + timedelta(days=1))
+        # The released stock goes to another customer
+        add_order_item(self.db, self.user_ids[1], PRODUCT_ID, STOCK)
+
+        with self.assertRaises(OutOfStock):
+            place_order(self.db, self.user_ids[0])
+
+        with self.db.read() as conn:
+            self.assertEqual(conn.execute("SELECT status FROM `Order` WHERE userId = ?",
+                                          (self.user_ids[0],)).fetchone()[0], 0)
+        self.assertIsNotNone(place_order(self.db, self.user_ids[1]))
+
+    def test_concurrent_holds_on_the_last_units(self):
+        # One database per customer, like separate processes, so only SQLite orders the holds
+        dbs = [Database(self.path) for _ in self.user_ids]
+        start = threading.Barrier(len(self.user_ids))
+        results = {}
+
+        def add(db: Database, user_id: int) -> None:
+            start.wait()
+            try:
+                results[user_id] = add_order_item(db, user_id, PRODUCT_ID, 1)
+            except OutOfStock:
+                results[user_id] = None
+
+        threads = [threading.Thread(target=add, args=args) for args in zip(dbs, self.user_ids)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for db in dbs:
+            db.close()
+
+        self.assertEqual(len(results), len(self.user_ids))
+        self.assertEqual(sum(item_id is not None for item_id in results.values()), STOCK)
+        for in_stock, held in self.stock().values():
+            self.assertEqual(held, in_stock)
+        self.assertEqual(self.max_buildable(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""Kitchen queue tests, on a small database made from the template.
+
+Run from the src directory:
+
+    python -m unittest discover -s tests
+"""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from collections import Counter
+from unittest import mock
+
+from catalog import Catalog
+from db import Database
+from flows.order import add_order_item, place_order
+from kitchen import PREPARING, QUEUED, claim_job, release_claims
+from main import open_database
+from repository import insert_user
+
+ORDERS = 12
+STATIONS = 6
+
+
+class ClaimJobTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'kitchen.db')
+        self.db = open_database(self.path)
+
+        with self.db.write() as conn:
+            conn.execute("UPDATE Ingredient SET inStock = 1000")
+            user_ids = [insert_user(conn, f"customer{i}@kitchen.test", "-", "Some", "One", False).id
+                        for i in range(ORDERS)]
+
+        patcher = mock.patch('flows.order.catalog', Catalog())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.order_ids = []
+        for user_id in user_ids:
+            add_order_item(self.db, user_id, 1, 1)
+            self.order_ids.append(place_order(self.db, user_id))
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmp)
+
+    def claim_all(self) -> list:
+        """Claim jobs from stations in separate databases, all at once, until the queue is empty."""
+
+        dbs = [Database(self.path) for _ in range(STATIONS)]
+        start = threading.Barrier(STATIONS)
+        claimed = []
+
+        def run_station(db: Database, station: str) -> None:
+            start.wait()
+            while job := claim_job(db, station):
+                claimed.append((job["orderId"], station))
+
+        threads = [threading.Thread(target=run_station, args=(db, f"station-{i + 1}")) for i, db in enumerate(dbs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for db in dbs:
+            db.close()
+        return claimed
+
+    def test_every_job_is_claimed_once(self):
+        claimed = self.claim_all()
+
+        self.assertEqual(Counter(order_id for order_id, _ in claimed), Counter(self.order_ids))
+        with self.db.read() as conn:
+            jobs = {row[0]: row[1] for row in conn.execute("SELECT orderId, station FROM KitchenJob")}
+            statuses = {row[0] for row in conn.execute("SELECT status FROM `Order`")}
+        self.assertEqual(jobs, dict(claimed))
+        self.assertEqual(statuses, {PREPARING})
+
+    def test_empty_queue(self):
+        self.claim_all()
+        self.assertIsNone(claim_job(self.db, "station-1"))
+
+    def test_released_jobs_are_claimed_again(self):
+        self.claim_all()
+
+        self.assertEqual(release_claims(self.db), ORDERS)
+        with self.db.read() as conn:
+            self.assertEqual({row[0] for row in conn.execute("SELECT status FROM `Order`")}, {QUEUED})
+
+        self.assertEqual(Counter(order_id for order_id, _ in self.claim_all()), Counter(self.order_ids))
+
+    def test_earliest_due_first(self):
+        with self.db.write() as conn:
+            conn.execute("UPDATE KitchenJob SET dueAt = datetime(dueAt, '-1 hour') WHERE orderId = ?",
+                         (self.order_ids[-1],))
+
+        self.assertEqual(claim_job(self.db, "station-1")["orderId"], self.order_ids[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+"""Metrics tests, on a small in-memory database.
+
+Run from the src directory:
+
+    python -m unittest discover -s tests
+"""
+import sqlite3
+import unittest
+
+import metrics
+
+
+class InstrumentedConnectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:", factory=metrics.InstrumentedConnection)
+        self.conn.execute("CREATE TABLE Product (id INTEGER PRIMARY KEY, price REAL)")
+
+    def tearDown(self):
+        self.conn.close()
+
+    def assertTimed(self, statement: str, count: int = 1) -> None:
+        self.assertIn(f'fastpizza_sql_seconds_count{{statement="{statement}"}} {count}', metrics.render())
+
+    def test_execute_is_timed(self):
+        statement = "SELECT COUNT(*) FROM Product WHERE price > ?"
+        self.conn.execute(statement, (0,)).fetchall()
+        self.assertTimed(statement)
+
+    def test_executemany_is_timed(self):
+        statement = "INSERT INTO Product (price) VALUES (?)"
+        self.conn.executemany(statement, [(1,), (2,)])
+        self.assertTimed(statement)
+
+    def test_cursor_execute_is_timed(self):
+        statement = "SELECT id FROM Product WHERE price < ?"
+        self.conn.cursor().execute(statement, (10,)).fetchall()
+        self.assertTimed(statement)
+
+    def test_rows_keep_the_connection_row_factory(self):
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("INSERT INTO Product (price) VALUES (5)")
+        self.assertEqual(self.conn.execute("SELECT price FROM Product").fetchone()["price"], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,244 @@
+"""Query plan regression tests.
+
+Runs the flows with scripted input against a large seeded database, collects
+every statement they send through a trace callback, and checks the plan of
+each one with `EXPLAIN QUERY PLAN`: no full scans of large tables and no
+temporary B-trees for sorting or grouping rows of large tables.
+
+Statement timings at this scale are written to `query_timings.json` (or
+`$QUERY_TIMINGS_FILE`) so regressions show up as numbers.
+
+Run from the src directory:
+
+    python -m unittest discover -s tests
+"""
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+
+import bcrypt
+
+import passwords
+from bench import run_scripted
+from catalog import catalog
+from db import Database
+from flows.account import account_flow
+from flows.admin import admin_flow
+from flows.login import login_flow
+from flows.order import modify_order_flow, order_pizza_flow, place_order_flow
+from flows.orders import orders_flow
+from holds import sweep_expired_holds
+from kitchen import Kitchen, release_claims
+from main import open_database
+from receipts import SNAPSHOT_RECEIPT
+from reports import rebuild_rollups
+
+CUSTOMERS = int(os.environ.get('QUERY_PLAN_CUSTOMERS', 5000))
+ORDERS_PER_CUSTOMER = int(os.environ.get('QUERY_PLAN_ORDERS_PER_CUSTOMER', 10))
+# Tables with more rows than this must not be scanned
+LARGE_TABLE_ROWS = 1000
+TIMING_RUNS = 20
+TIMINGS_FILE = os.environ.get('QUERY_TIMINGS_FILE', 'query_timings.json')
+PASSWORD = "query-plan-password"
+
+# Tables named in FROM/JOIN clauses and comma joins, with their aliases
+TABLE_REFERENCE = re.compile(
+    r"(?:\bFROM|\bJOIN|,)\s*[`\"]?(\w+)[`\"]?"
+    r"(?:\s+(?:AS\s+)?(?!(?:ON|FROM|WHERE|JOIN|LEFT|INNER|CROSS|GROUP|ORDER|HAVING|LIMIT|UNION|USING|SET|VALUES)\b)(\w+))?",
+    re.IGNORECASE)
+SCAN = re.compile(r"^SCAN (\w+)")
+
+# Temporary B-trees that no index can replace, because they sort or group a
+# small, bounded set of rows. Patterns match the statement with collapsed whitespace.
+ALLOWED_TEMP_BTREES = [
+    (re.compile(r"FROM (ProductSalesRollup|ToppingUsageRollup) WHERE period = .* GROUP BY \w+ \) r"),
+     "report totals, one row per product or topping"),
+    (re.compile(r"^SELECT orderId, json_group_array\(json_array\( orderItemId"),
+     "the items of a single open order"),
+    (re.compile(r"^SELECT ingredientId, SUM\(amount\) AS amount FROM \( SELECT pi.ingredientId, oi.amount \* pi.amount"),
+     "the ingredients of a single order"),
+]
+STATEMENT = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+
+
+class TracedDatabase(Database):
+    """Database that records every statement run on its connections."""
+
+    def __init__(self, *args, **kwargs):
+        self.statements = []
+        super().__init__(*args, **kwargs)
+
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        conn = super()._connect(readonly)
+        conn.set_trace_callback(self.statements.append)
+        return conn
+
+
+def seed(path: str) -> None:
+    """Create a database with lots of customers, orders and rollups."""
+
+    db = open_database(path)
+    rng = random.Random(17)
+    hashed_password = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(4)).decode('utf-8')
+    now = datetime.now()
+
+    with db.write() as conn:
+        conn.execute("UPDATE Ingredient SET inStock = 1000000000")
+        products = [r[0] for r in conn.execute("SELECT id FROM Product")]
+        toppings = [r[0] for r in conn.execute("SELECT id FROM Ingredient WHERE isTopping")]
+
+        conn.executemany(
+            "INSERT INTO User (email, password, firstName, lastName, isAdmin, updatedAt) VALUES (?, ?, ?, ?, ?, ?)",
+            [(f"customer{i}@plans.test", hashed_password, "Customer", str(i), i == 0, now)
+             for i in range(CUSTOMERS)])
+        user_ids = [r[0] for r in conn.execute("SELECT id FROM User WHERE email LIKE '%@plans.test' ORDER BY id")]
+
+        orders = []
+        for user_id in user_ids:
+            for _ in range(ORDERS_PER_CUSTOMER):
+                placed = now - timedelta(minutes=rng.randrange(60 * 24 * 365 * 2))
+                orders.append((placed, placed, placed, 1, user_id))
+        conn.executemany(
+            "INSERT INTO `Order` (createdAt, updatedAt, placedAt, status, userId) VALUES (?, ?, ?, ?, ?)", orders)
+
+        order_ids = [r[0] for r in conn.execute("SELECT id FROM `Order`")]
+        conn.executemany(
+            "INSERT INTO OrderItem (orderId, productId, amount, updatedAt) VALUES (?, ?, ?, ?)",
+            [(order_id, rng.choice(products), rng.randint(1, 3), now)
+             for order_id in order_ids for _ in range(rng.randint(1, 3))])
+        conn.executemany(
+            "INSERT INTO IngredientOrderItemTopping (orderItemId, ingredientId, amount) VALUES (?, ?, ?)",
+            [(order_item_id, rng.choice(toppings), rng.randint(1, 2))
+             for (order_item_id,) in conn.execute("SELECT id FROM OrderItem") if rng.random() < 0.5])
+        conn.executemany(SNAPSHOT_RECEIPT, [{"order_id": order_id, "now": now} for order_id in order_ids])
+
+    rebuild_rollups(db)
+    db.close()
+
+
+class QueryPlanTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.tmp, 'plans.db')
+        seed(cls.path)
+
+        passwords.ROUNDS = 4
+        cls.limiter = passwords.limiter
+        passwords.limiter = passwords.RateLimiter(burst=10**9, per_minute=10**9)
+
+        cls.db = TracedDatabase(cls.path)
+        cls.run_flows(cls.db)
+        cls.statements = sorted({s for s in cls.db.statements if STATEMENT.match(s)})
+
+        cls.conn = sqlite3.connect(f"file:{cls.path}?mode=ro", uri=True)
+        cls.row_counts = {
+            name: cls.conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+            for (name,) in cls.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        passwords.limiter = cls.limiter
+        cls.conn.close()
+        cls.db.close()
+        shutil.rmtree(cls.tmp)
+
+    @classmethod
+    def run_flows(cls, db: Database) -> None:
+        """Go through every flow once, as the admin customer0."""
+
+        with db.read() as conn:
+            menu = catalog.refresh(conn)
+        done = str(len(menu.toppings) + 1)
+
+        user = run_scripted(login_flow, ['1', 'customer0@plans.test', PASSWORD], db)
+        # Search the menu, then two pizzas, one with a topping
+        run_scripted(order_pizza_flow, ['pizza', '2', '1', 'y', '1', '1', done, '', 'y', '1', '2', 'n', 'a comment', 'n'],
+                     user, db)
+        # First item amount to 2, second item's comment, remove the first item
+        run_scripted(modify_order_flow, ['1', '2', '2', '4', '3'], user, db)
+        run_scripted(modify_order_flow, ['2', '3', 'extra crispy', '4', '3'], user, db)
+        run_scripted(modify_order_flow, ['1', '1', 'y', '2'], user, db)
+        # Let the cart's holds expire, placing takes the stock anyway
+        sweep_expired_holds(db, datetime.now() + timedelta(days=1))
+        run_scripted(place_order_flow, ['y', 'n'], user, db)
+        # Make the order, without waiting for it
+        Kitchen(db, bake_seconds=0, speed=float('inf')).work_one('station-1')
+        release_claims(db)
+        # Older orders, newer orders, view the newest order
+        run_scripted(orders_flow, ['11', '12', '1', ''], user, db)
+        run_scripted(account_flow, ['2', 'New', 'Name', '4'], user, db)
+        # Every report, the restock plan and the kitchen, then go back
+        run_scripted(admin_flow, ['1', '', '2', '', '3', '', '4', '', '5', '', '7'], user, db)
+        # Registering checks for an existing email
+        run_scripted(login_flow, ['2', 'Some', 'One', 'someone@plans.test', 'password1', 'password1', 'n'], db)
+
+    def plan(self, statement: str) -> list:
+        return [row[3] for row in self.conn.execute(f"EXPLAIN QUERY PLAN {statement}")]
+
+    def large_tables(self, statement: str) -> dict:
+        """Large tables used by a statement, by the names the plan uses for them."""
+
+        names = {}
+        for table, alias in TABLE_REFERENCE.findall(statement):
+            if self.row_counts.get(table, 0) > LARGE_TABLE_ROWS:
+                names[table] = table
+                if alias:
+                    names[alias] = table
+        return names
+
+    def test_flows_ran(self):
+        self.assertGreater(len(self.statements), 20)
+
+    def test_no_scans_of_large_tables(self):
+        for statement in self.statements:
+            large = self.large_tables(statement)
+            for detail in self.plan(statement):
+                if (match := SCAN.match(detail)) and match.group(1) in large:
+                    with self.subTest(statement=statement):
+                        self.fail(f"{detail} ({large[match.group(1)]} has "
+                                  f"{self.row_counts[large[match.group(1)]]} rows)")
+
+    def test_no_temp_btrees_on_large_tables(self):
+        for statement in self.statements:
+            if not self.large_tables(statement):
+                continue
+            if any(pattern.search(" ".join(statement.split())) for pattern, _ in ALLOWED_TEMP_BTREES):
+                continue
+            for detail in self.plan(statement):
+                if "TEMP B-TREE" in detail:
+                    with self.subTest(statement=statement):
+                        self.fail(detail)
+
+    def test_record_timings(self):
+        timings = {}
+        for statement in self.statements:
+            if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+                continue
+            start = time.perf_counter()
+            for _ in range(TIMING_RUNS):
+                self.conn.execute(statement).fetchall()
+            timings[" ".join(statement.split())] = (time.perf_counter() - start) / TIMING_RUNS * 1000
+
+        with open(TIMINGS_FILE, 'w') as f:
+            json.dump({
+                "customers": CUSTOMERS,
+                "orders": self.row_counts["Order"],
+                "order_items": self.row_counts["OrderItem"],
+                "mean_ms": dict(sorted(timings.items(), key=lambda t: -t[1])),
+            }, f, indent=2)
+
+        self.assertTrue(timings)
+
+
+if __name__ == '__main__':
+    unittest.main()
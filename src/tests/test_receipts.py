@@ -0,0 +1,96 @@
+"""Receipt tests, on a small database made from the template.
+
+Run from the src directory:
+
+    python -m unittest discover -s tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from catalog import Catalog
+from flows.order import add_order_item, place_order
+from main import open_database
+from receipts import ReceiptCache
+from repository import insert_user
+
+PRODUCT_ID = 1
+
+
+class ReceiptTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = open_database(os.path.join(self.tmp, 'receipts.db'))
+
+        with self.db.write() as conn:
+            conn.execute("UPDATE Ingredient SET inStock = 100")
+            self.user_id = insert_user(conn, "customer@receipts.test", "-", "Some", "One", False).id
+            self.topping_id = conn.execute("SELECT id FROM Ingredient WHERE isTopping LIMIT 1").fetchone()[0]
+
+        patcher = mock.patch('flows.order.catalog', Catalog())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        add_order_item(self.db, self.user_id, PRODUCT_ID, 2,
+                       [{"ingredientId": self.topping_id, "amount": 1}], "well done")
+        self.order_id = place_order(self.db, self.user_id)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmp)
+
+    def receipt(self, user_id: int = None) -> tuple:
+        """The stored receipt, read past any cache."""
+
+        with self.db.read() as conn:
+            return ReceiptCache().get(conn, user_id or self.user_id, self.order_id)
+
+    def test_receipt_is_the_placed_order(self):
+        receipt, text = self.receipt()
+
+        with self.db.read() as conn:
+            name, price = conn.execute("SELECT name, price FROM Product WHERE id = ?", (PRODUCT_ID,)).fetchone()
+            total = conn.execute("SELECT total FROM `Order` WHERE id = ?", (self.order_id,)).fetchone()[0]
+
+        self.assertEqual(receipt["orderId"], self.order_id)
+        self.assertEqual(receipt["total"], total)
+        item, = receipt["items"]
+        self.assertEqual((item["name"], item["amount"], item["price"], item["comment"]), (name, 2, price, "well done"))
+        self.assertEqual([t["amount"] for t in item["toppings"]], [1])
+        self.assertIn(f"2x {name} @ {price} kr", text)
+
+    def test_receipt_survives_catalog_changes(self):
+        before = self.receipt()
+
+        with self.db.write() as conn:
+            conn.execute("UPDATE Product SET name = 'Renamed', price = price * 2 WHERE id = ?", (PRODUCT_ID,))
+            conn.execute("UPDATE Ingredient SET name = 'Renamed' WHERE id = ?", (self.topping_id,))
+
+        self.assertEqual(self.receipt(), before)
+
+    def test_receipt_survives_changes_to_the_order(self):
+        before = self.receipt()
+
+        with self.db.write() as conn:
+            conn.execute("UPDATE OrderItem SET amount = 5, comment = NULL WHERE orderId = ?", (self.order_id,))
+
+        self.assertEqual(self.receipt(), before)
+
+    def test_receipt_of_another_user_is_hidden(self):
+        with self.db.write() as conn:
+            other_id = insert_user(conn, "other@receipts.test", "-", "Other", "One", False).id
+
+        self.assertIsNone(self.receipt(other_id))
+
+        # Also once cached for its owner
+        cache = ReceiptCache()
+        with self.db.read() as conn:
+            self.assertIsNotNone(cache.get(conn, self.user_id, self.order_id))
+            self.assertIsNone(cache.get(conn, other_id, self.order_id))
+
+
+if __name__ == '__main__':
+    unittest.main()
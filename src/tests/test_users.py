@@ -0,0 +1,91 @@
+"""User map tests, on a small database made from the template.
+
+Run from the src directory:
+
+    python -m unittest discover -s tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from db import Database
+from main import open_database
+from repository import delete_user, insert_user, update_user_name
+from users import UserMap
+
+
+class UserMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'users.db')
+        self.db = open_database(self.path)
+        # Changes from another process
+        self.other = Database(self.path)
+
+        with self.db.write() as conn:
+            self.user = insert_user(conn, "customer@users.test", "-", "Some", "One", False)
+
+        self.users = UserMap()
+        self.users.acquire(self.user)
+
+    def tearDown(self):
+        self.other.close()
+        self.db.close()
+        shutil.rmtree(self.tmp)
+
+    def get(self):
+        with self.db.read() as conn:
+            return self.users.get(conn, self.user.id)
+
+    def test_unchanged_user_is_a_hit(self):
+        self.assertEqual(self.get(), self.user)
+        misses = self.users.misses
+
+        self.assertEqual(self.get(), self.user)
+        self.assertEqual(self.users.misses, misses)
+
+    def test_update_from_another_process_is_seen(self):
+        self.get()
+        with self.other.write() as conn:
+            updated = update_user_name(conn, self.user.id, "New", "Name")
+
+        user = self.get()
+        self.assertGreater(updated.version, self.user.version)
+        self.assertEqual(user, updated)
+        self.assertEqual((user.firstName, user.lastName), ("New", "Name"))
+
+    def test_other_changes_keep_the_user(self):
+        self.get()
+        with self.other.write() as conn:
+            insert_user(conn, "other@users.test", "-", "Other", "One", False)
+
+        self.assertEqual(self.get(), self.user)
+
+    def test_deleted_user_is_gone(self):
+        self.get()
+        with self.other.write() as conn:
+            delete_user(conn, self.user.id)
+
+        self.assertIsNone(self.get())
+
+    def test_older_version_is_not_put_back(self):
+        with self.db.write() as conn:
+            updated = update_user_name(conn, self.user.id, "New", "Name")
+        self.users.put(updated)
+
+        self.users.put(self.user)
+        self.assertEqual(self.get(), updated)
+
+    def test_user_is_dropped_with_the_last_session(self):
+        self.users.acquire(self.user)
+
+        self.users.release(self.user.id)
+        self.assertEqual(self.get(), self.user)
+        self.users.release(self.user.id)
+        self.assertIsNone(self.get())
+
+
+if __name__ == '__main__':
+    unittest.main()
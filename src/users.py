@@ -0,0 +1,111 @@
+import sqlite3
+import threading
+
+from repository import User, get_user_versions, iter_users
+
+
+class UserMap:
+    """Identity map of the logged in users, shared by the sessions in this process.
+
+    Every session reads its user from here, so a change made in one session
+    shows up in all of them. Changes made through the map are written
+    through, and changes from other processes are picked up by the version
+    column, bumped on every update of a user. A `PRAGMA data_version` /
+    `total_changes` check tells whether anything was committed since the
+    last lookup, and only then are the versions of the mapped users read.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+        # User by id, and the number of sessions holding it
+        self._users = {}
+        self._sessions = {}
+        # Last seen (data_version, total_changes) per connection
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, user: User) -> User:
+        """Start a session of a user who just logged in.
+
+        Returns:
+            User: The mapped user, the newest of the one given and the one mapped.
+        """
+
+        with self._lock:
+            self._sessions[user.id] = self._sessions.get(user.id, 0) + 1
+            self._put(user)
+            # The user may have been read before the last lookup, check it next time
+            self._seen.clear()
+            return self._users[user.id]
+
+    def release(self, user_id: int) -> None:
+        """End a session, the user is dropped with the last one."""
+
+        with self._lock:
+            if (count := self._sessions.get(user_id, 0) - 1) > 0:
+                self._sessions[user_id] = count
+                return
+            self._sessions.pop(user_id, None)
+            self._users.pop(user_id, None)
+
+    def put(self, user: User) -> None:
+        """Write an updated user through to the sessions holding it."""
+
+        with self._lock:
+            if user.id in self._sessions:
+                self._put(user)
+
+    def remove(self, user_id: int) -> None:
+        """Drop a deleted user, its sessions get None from `get`."""
+
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def get(self, conn: sqlite3.Connection, user_id: int) -> User:
+        """Get the current data of a logged in user.
+
+        Args:
+            conn (sqlite3.Connection): Database connection.
+            user_id (int): User id.
+
+        Returns:
+            User: The user, or None if it was deleted.
+        """
+
+        with self._lock:
+            key = (conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+            if self._seen.get(id(conn)) == key:
+                self.hits += 1
+                return self._users.get(user_id)
+
+            self._refresh(conn)
+            self._seen[id(conn)] = key
+            return self._users.get(user_id)
+
+    def _put(self, user: User) -> None:
+        mapped = self._users.get(user.id)
+        if mapped is None or mapped.version <= user.version:
+            self._users[user.id] = user
+
+    def _refresh(self, conn: sqlite3.Connection) -> None:
+        """Reload the mapped users whose version changed, drop deleted ones."""
+
+        if not self._users:
+            return
+
+        versions = get_user_versions(conn, list(self._users))
+        for user_id in [i for i in self._users if i not in versions]:
+            del self._users[user_id]
+
+        if stale := [u.id for u in self._users.values() if u.version != versions[u.id]]:
+            self.misses += 1
+            for user in iter_users(conn, stale):
+                self._put(user)
+        else:
+            self.hits += 1
+
+
+# Shared by all sessions in this process
+users = UserMap()